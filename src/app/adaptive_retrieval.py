@@ -0,0 +1,59 @@
+from dataclasses import dataclass
+import numpy as np
+
+
+@dataclass
+class AdaptiveK:
+    """Chooses how many search results to use from the distribution of their similarity scores.
+    Results are cut below min_score and after the largest drop-off ("elbow") in scores, keeping
+    between min_k and max_k of them in their original order. If no result reaches relevance_floor,
+    the question is considered off-topic and no results are kept at all.
+    """
+
+    min_k: int = 1
+    max_k: int = 10
+    # Cosine similarity a result needs to be used beyond the first min_k
+    min_score: float = 0.82
+    # Cosine similarity the best result needs for the question to be answered at all
+    relevance_floor: float = 0.78
+    # A drop between neighbouring scores this many times the average drop is an elbow
+    elbow_factor: float = 2.0
+
+    def select(self, results: list[dict]) -> list[dict]:
+        """Keep the leading results worth putting into the prompt
+        Args:
+            results: Search results sorted by rank, up to max_k of them. The cosine similarity
+                is taken from "dense_score" of hybrid results and from "score" otherwise,
+                results without a known similarity are kept by their rank
+        Returns:
+            Results to use in their original order, empty if the question is off-topic
+        """
+        results = results[: self.max_k]
+        scores = np.array(
+            sorted((score for score in map(self._similarity, results) if score is not None), reverse=True),
+            dtype=np.float32,
+        )
+        if not len(scores) or scores[0] < self.relevance_floor:
+            return []
+
+        # At least min_k relevant results, more while they clear min_score
+        k = max(int((scores >= self.min_score).sum()), min(self.min_k, int((scores >= self.relevance_floor).sum())))
+        gaps = scores[: k - 1] - scores[1:k]
+        if len(gaps) >= self.min_k:
+            elbow = self.min_k - 1 + int(np.argmax(gaps[self.min_k - 1 :]))
+            if gaps[elbow] > 0 and gaps[elbow] >= self.elbow_factor * gaps.mean():
+                k = elbow + 1
+        # Hybrid results are ranked by fused score, so every result is judged by its own dense
+        # score against the k-th best one. A result without a similarity is kept, dropping
+        # it would throw away keyword matches the fused ranking put in front
+        cutoff = scores[k - 1]
+        return [
+            result for result in results
+            if (score := self._similarity(result)) is None or score >= cutoff
+        ]
+
+    @staticmethod
+    def _similarity(result: dict) -> float | None:
+        """Cosine similarity of a result: "dense_score" of hybrid results, which is None if the
+        store could not compute it, and "score" of dense results"""
+        return result["dense_score"] if "dense_score" in result else result["score"]
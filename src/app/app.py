@@ -1,9 +1,15 @@
-from web_page_processor import WebPageProcessor
-from course_advisor import CourseAdvisor
+from adaptive_retrieval import AdaptiveK
+from async_course_advisor import AsyncCourseAdvisor
 from vector_store import VectorStore
 from config import COURSE_URLS
 from dotenv import load_dotenv
 from embedder import Embedder
+from embedding_cache import EmbeddingCache
+from embedding_server import RemoteEmbedder
+from index_repository import IndexRepository
+from index_watcher import IndexWatcher
+from reranker import Reranker
+from semantic_cache import SemanticCache
 import streamlit as st
 import os
 
@@ -11,6 +17,29 @@ load_dotenv()
 
 # Constants
 vector_store_path = os.getenv("VECTOR_STORE_PATH")
+page_cache_dir = os.getenv("PAGE_CACHE_DIR")
+embedding_cache_path = os.getenv("EMBEDDING_CACHE_PATH")
+# Address of a shared embedding server, workers then do not load their own model
+embedding_server = os.getenv("EMBEDDING_SERVER")
+# Key of the embedding server, by default the one it generated is read from its key file
+embedding_server_authkey = os.getenv("EMBEDDING_SERVER_AUTHKEY")
+refresh_index_on_start = os.getenv("REFRESH_INDEX", "").lower() in ("1", "true")
+# Similarity above which a previous answer is reused, 0 (default) disables the answer cache:
+# with a small embedding model, questions about different courses can be more similar than 0.95
+semantic_cache_threshold = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0"))
+semantic_cache_ttl = float(os.getenv("SEMANTIC_CACHE_TTL", str(24 * 3600)))
+max_concurrent_llm_requests = int(os.getenv("MAX_CONCURRENT_LLM_REQUESTS", "16"))
+llm_timeout = float(os.getenv("LLM_TIMEOUT", "60"))
+# Similarity the best chunk needs for the question to reach the LLM, 0 (default) disables
+# adaptive retrieval: the thresholds have to be tuned for the embedding model
+relevance_floor = float(os.getenv("RELEVANCE_FLOOR", "0"))
+min_chunk_score = float(os.getenv("MIN_CHUNK_SCORE", "0.82"))
+max_context_chunks = int(os.getenv("MAX_CONTEXT_CHUNKS", "10"))
+# Cross-encoder re-ranking of the search results, disabled when no model is set
+reranker_model = os.getenv("RERANKER_MODEL")
+rerank_budget_ms = float(os.getenv("RERANK_BUDGET_MS", "200"))
+# Seconds between checks for a newly published index, 0 disables hot reload
+index_poll_interval = float(os.getenv("INDEX_POLL_INTERVAL", "30"))
 
 # Set page config
 st.set_page_config(page_title="Навигатор по курсам", page_icon="🎓", layout="wide")
@@ -25,25 +54,87 @@ if "advisor" not in st.session_state:
     @st.cache_resource(show_spinner=False)
     def initialize_advisor():
         # Initialize embedder
-        embedder = Embedder()
-
-        # Initialize or load vectorstore
-        if os.path.exists(f"{vector_store_path}.faiss"):
-            vectorstore = VectorStore(dimension=embedder.get_embedding_dimension())
-            vectorstore.load(vector_store_path)
+        if embedding_server:
+            embedder = RemoteEmbedder(
+                embedding_server,
+                authkey=embedding_server_authkey.encode() if embedding_server_authkey else None,
+            )
         else:
-            # Process documents
-            processor = WebPageProcessor()
-            chunks = processor.process_urls(COURSE_URLS)
+            embedding_cache = (
+                EmbeddingCache(embedding_cache_path) if embedding_cache_path else None
+            )
+            embedder = Embedder(cache=embedding_cache)
+
+        # Load the published vectorstore without loading the embedding model, a store that
+        # is being written is never visible here. Files are memory-mapped, so all worker
+        # processes of the host share one copy of the vectors and chunks in the page cache
+        repository = IndexRepository(vector_store_path)
+        version = repository.current_version()
+        index_exists = repository.current_path() is not None
+        if index_exists:
+            vectorstore = repository.load(mmap=True)
+
+        if not index_exists or refresh_index_on_start:
+            # Workers starting together build the index once, the others wait for the lock
+            # of the repository and load the version published meanwhile
+            with repository.lock():
+                if repository.current_version() != version:
+                    vectorstore = repository.load(mmap=True)
+                else:
+                    # Build dependencies are only imported when the index has to be built,
+                    # production indexes are built offline with `python -m app.build_index`
+                    from web_page_processor import WebPageProcessor
+                    from crawler import AsyncCrawler
+                    from page_cache import PageCache
+                    from deduplicator import ChunkDeduplicator
+                    from build_index import IndexBuilder
+
+                    if not index_exists:
+                        vectorstore = VectorStore(dimension=embedder.get_embedding_dimension())
+
+                    # Fetch, split and embed pages concurrently, embedding only new or changed chunks
+                    page_cache = PageCache(page_cache_dir) if page_cache_dir else None
+                    processor = WebPageProcessor(
+                        crawler=AsyncCrawler(),
+                        cache=page_cache,
+                        deduplicator=ChunkDeduplicator(),
+                    )
+                    # Pages are split in a thread, worker processes are not started from the Streamlit server.
+                    # An interrupted build resumes from its checkpoint, the result is published atomically
+                    IndexBuilder(
+                        vectorstore, embedder, processor, workers=0, repository=repository
+                    ).build(COURSE_URLS)
 
-            # Create embeddings and initialize vectorstore
-            embeddings = embedder.get_embeddings(chunks)
-            vectorstore = VectorStore(dimension=embedder.get_embedding_dimension())
-            vectorstore.add_texts(chunks, embeddings)
-            vectorstore.save(vector_store_path)
+        # Initialize advisor, the answer cache and LLM connection pool are shared by all sessions
+        semantic_cache = (
+            SemanticCache(threshold=semantic_cache_threshold, ttl=semantic_cache_ttl)
+            if semantic_cache_threshold > 0
+            else None
+        )
+        advisor = AsyncCourseAdvisor(
+            vectorstore=vectorstore,
+            embedder=embedder,
+            cache=semantic_cache,
+            adaptive_k=(
+                AdaptiveK(
+                    max_k=max_context_chunks,
+                    min_score=min_chunk_score,
+                    relevance_floor=relevance_floor,
+                )
+                if relevance_floor > 0
+                else None
+            ),
+            reranker=(
+                Reranker(reranker_model, budget_ms=rerank_budget_ms) if reranker_model else None
+            ),
+            max_concurrent_requests=max_concurrent_llm_requests,
+            timeout=llm_timeout,
+        )
 
-        # Initialize advisor
-        return CourseAdvisor(vectorstore=vectorstore, embedder=embedder)
+        # Rebuilt indexes are swapped into the cached advisor, the embedding model stays loaded
+        if index_poll_interval > 0:
+            IndexWatcher(repository, [advisor], interval=index_poll_interval).start()
+        return advisor
 
     with st.spinner("Инициализация базы знаний... Это может занять некоторое время."):
         st.session_state.advisor = initialize_advisor()
@@ -56,6 +147,14 @@ query = st.text_input(
 
 # Search button
 if st.button("Получить ответ") and query:
+    timings = {}
     with st.spinner("Анализирую ваш вопрос..."):
-        response = st.session_state.advisor.process_query(query)
-        st.write(response)
+        # Render the answer token by token as it is generated
+        st.write_stream(st.session_state.advisor.stream_query(query, timings=timings))
+    if timings.get("failed"):
+        st.error("Ответ прервался из-за ошибки, попробуйте задать вопрос ещё раз.")
+    elif "ttft_s" in timings:
+        st.caption(
+            f"Первый токен: {timings['ttft_s']:.1f} с, полный ответ: {timings['total_s']:.1f} с"
+            + (f", контекст: {timings['context_tokens']} токенов" if "context_tokens" in timings else "")
+        )
@@ -0,0 +1,299 @@
+import asyncio
+import os
+import queue
+import random
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, AsyncIterator, Awaitable, Callable, Iterator, TypeVar
+from adaptive_retrieval import AdaptiveK
+from config import OFF_TOPIC_ANSWER
+from context_builder import ContextBuilder
+from course_advisor import CourseAdvisor
+from embedder import Embedder
+from reranker import Reranker
+from semantic_cache import SemanticCache, cache_scope
+from vector_store import VectorStore
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
+
+T = TypeVar("T")
+
+# Statuses worth retrying: rate limiting and transient server errors
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class AsyncCourseAdvisor(CourseAdvisor):
+    def __init__(
+        self,
+        vectorstore: VectorStore,
+        embedder: Embedder,
+        hybrid: bool = True,
+        cache: SemanticCache | None = None,
+        context_builder: ContextBuilder | None = None,
+        top_k: int = 5,
+        adaptive_k: AdaptiveK | None = None,
+        reranker: Reranker | None = None,
+        max_concurrent_requests: int = 16,
+        max_workers: int = 4,
+        max_connections: int = 64,
+        timeout: float = 60.0,
+        retries: int = 3,
+        backoff: float = 0.5,
+    ):
+        """Initialize course advisor for many concurrent sessions.
+        LLM calls go through AsyncOpenAI with a shared connection pool and at most
+        max_concurrent_requests in flight, embedding and search run in a bounded thread pool.
+        The sync methods (process_query, stream_query) run on a background event loop shared
+        by all callers, so waiting on the network does not need a thread per request.
+        Args:
+            vectorstore: VectorStore instance for course content search
+            embedder: Embedder instance for question embedding
+            hybrid: Fuse dense search with BM25 keyword search (default: True)
+            cache: Optional SemanticCache to reuse answers to similar questions
+            context_builder: Assembles retrieved chunks into the prompt within a token budget
+            top_k: Number of chunks retrieved for the context
+            adaptive_k: Optional AdaptiveK choosing the number of chunks from their scores
+            reranker: Optional cross-encoder Reranker of the search results
+            max_concurrent_requests: Maximum number of LLM calls in flight
+            max_workers: Number of threads for embedding and search
+            max_connections: Size of the HTTP connection pool to the LLM API
+            timeout: Timeout of one LLM call in seconds
+            retries: Number of retries of LLM calls failed with 429 / 5xx or connection errors
+            backoff: Base delay in seconds for exponential backoff between retries
+        """
+        super().__init__(
+            vectorstore,
+            embedder,
+            hybrid=hybrid,
+            cache=cache,
+            context_builder=context_builder,
+            top_k=top_k,
+            adaptive_k=adaptive_k,
+            reranker=reranker,
+        )
+        self.max_concurrent_requests = max_concurrent_requests
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.stats = {"requests": 0, "retries": 0, "failed": 0}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="advisor")
+        # Clients and semaphores are bound to the event loop they were created on
+        self._loop_state: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._loop_lock = threading.Lock()
+
+    @property
+    def async_client(self) -> "AsyncOpenAI":
+        """AsyncOpenAI client of the running event loop, created on first use"""
+        return self._state()[0]
+
+    async def aretrieve_context(
+        self, question: str, sources: str | list[str] | None = None
+    ) -> list[str]:
+        """Async variant of retrieve_context, embedding and search run in the thread pool
+        Args:
+            question: Question about courses
+            sources: Optional glob pattern(s) of page URLs to search in
+        Returns:
+            List of relevant course content chunks
+        """
+        return await self._run_blocking(self.retrieve_context, question, sources=sources)
+
+    async def aselect_results(self, question: str, results: list[dict]) -> list[dict]:
+        """Async variant of select_results, re-ranking runs in the thread pool
+        Args:
+            question: Question about courses
+            results: search_k search results sorted by rank
+        Returns:
+            Results to build the context from, empty for off-topic questions
+        """
+        return await self._run_blocking(self.select_results, question, results)
+
+    async def agenerate_completion(self, question: str, context: str, **kwargs) -> str:
+        """Async variant of generate_completion with concurrency limit and retries
+        Args:
+            question: Question about courses
+            context: Relevant course content to use for answering
+        Returns:
+            Generated course advice
+        """
+        try:
+            async with self._state()[1]:
+                response = await self._with_retries(
+                    lambda: self.async_client.chat.completions.create(
+                        model=self.model, messages=self._messages(question, context), **kwargs
+                    )
+                )
+            return response.choices[0].message.content
+        except Exception as e:
+            self.stats["failed"] += 1
+            print(f"Error generating course advice: {e}")
+            return ""
+
+    async def astream_completion(self, question: str, context: str, **kwargs) -> AsyncIterator[str]:
+        """Async streaming completion holding a concurrency slot until the stream ends.
+        Only opening the stream is retried, a stream that failed midway is not restarted.
+        Args:
+            question: Question about courses
+            context: Relevant course content to use for answering
+        Returns:
+            Async iterator over text deltas of the answer
+        Raises:
+            Exception: Error of a stream that failed, re-raised after logging
+        """
+        try:
+            async with self._state()[1]:
+                response = await self._with_retries(
+                    lambda: self.async_client.chat.completions.create(
+                        model=self.model,
+                        messages=self._messages(question, context),
+                        stream=True,
+                        **kwargs,
+                    )
+                )
+                async for chunk in response:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yield chunk.choices[0].delta.content
+        except Exception as e:
+            self.stats["failed"] += 1
+            print(f"Error generating course advice: {e}")
+            raise
+
+    async def aprocess_query(self, question: str, **kwargs) -> str:
+        """Async variant of process_query
+        Args:
+            question: Question about courses
+        Returns:
+            Generated course advice based on relevant content
+        """
+        store = self.vectorstore
+        index_version = store.version
+        scope = cache_scope(**kwargs)
+        question_embedding = await self._run_blocking(self.embedder.get_embeddings, [question])
+        answer = self._cached_answer(question_embedding, {}, time.perf_counter(), index_version, scope)
+        if answer is not None:
+            return answer
+
+        results = await self._run_blocking(
+            self.search, question, question_embedding=question_embedding, vectorstore=store
+        )
+        if not results:
+            self.context_stats["off_topic"] += 1
+            return OFF_TOPIC_ANSWER
+        answer = await self.agenerate_completion(question, self.build_context(results).text, **kwargs)
+        self._cache_answer(question, question_embedding, answer, store, index_version, scope)
+        return answer
+
+    def process_query(self, question: str, **kwargs) -> str:
+        """Process a question on the shared background event loop and wait for the advice
+        Args:
+            question: Question about courses
+        Returns:
+            Generated course advice based on relevant content
+        """
+        return asyncio.run_coroutine_threadsafe(
+            self.aprocess_query(question, **kwargs), self._background_loop()
+        ).result()
+
+    def stream_query(
+        self, question: str, timings: dict[str, float] | None = None, **kwargs
+    ) -> Iterator[str]:
+        """Stream the advice produced on the shared background event loop
+        Args:
+            question: Question about courses
+            timings: Optional dictionary filled the same way as by CourseAdvisor.stream_query
+        Returns:
+            Iterator over text deltas of the advice
+        """
+        deltas: queue.Queue = queue.Queue()
+        done = object()
+
+        async def produce():
+            try:
+                async for delta in self.astream_query(question, timings=timings, **kwargs):
+                    deltas.put(delta)
+            except Exception as e:
+                deltas.put(e)
+            finally:
+                deltas.put(done)
+
+        future = asyncio.run_coroutine_threadsafe(produce(), self._background_loop())
+        try:
+            while (delta := deltas.get()) is not done:
+                if isinstance(delta, Exception):
+                    raise delta
+                yield delta
+        finally:
+            # The consumer stopped early, e.g. the Streamlit session was closed
+            future.cancel()
+
+    def close(self) -> None:
+        """Stop the background event loop and the thread pool"""
+        with self._loop_lock:
+            if self._loop is not None:
+                self._loop.call_soon_threadsafe(self._loop.stop)
+                self._loop = None
+        self._executor.shutdown(wait=False)
+
+    async def _run_blocking(self, func: Callable[..., T], *args, **kwargs) -> T:
+        """Run blocking embedding or search code in the bounded thread pool"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, lambda: func(*args, **kwargs))
+
+    async def _with_retries(self, call: Callable[[], Awaitable[T]]) -> T:
+        """Await an LLM call, retrying rate limiting, server and connection errors with backoff"""
+        import openai
+
+        self.stats["requests"] += 1
+        for attempt in range(self.retries + 1):
+            try:
+                return await call()
+            except (openai.APIStatusError, openai.APIConnectionError) as e:
+                retryable = isinstance(e, openai.APIConnectionError) or e.status_code in RETRY_STATUSES
+                if not retryable or attempt == self.retries:
+                    raise
+            self.stats["retries"] += 1
+            # Exponential backoff with jitter so retries do not arrive in lockstep
+            await asyncio.sleep(self.backoff * 2**attempt * (1 + random.random()))
+
+    def _state(self) -> tuple["AsyncOpenAI", asyncio.Semaphore]:
+        """Get the client and the concurrency semaphore of the running event loop"""
+        loop = asyncio.get_running_loop()
+        if loop not in self._loop_state:
+            self._loop_state[loop] = (
+                self._create_async_client(),
+                asyncio.Semaphore(self.max_concurrent_requests),
+            )
+        return self._loop_state[loop]
+
+    def _create_async_client(self) -> "AsyncOpenAI":
+        """Create AsyncOpenAI client with a pooled HTTP client, retries are done by _with_retries"""
+        import httpx
+        from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+        return AsyncOpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            base_url=os.getenv("OPENAI_BASE_URL"),
+            timeout=self.timeout,
+            max_retries=0,
+            http_client=DefaultAsyncHttpxClient(
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                )
+            ),
+        )
+
+    def _background_loop(self) -> asyncio.AbstractEventLoop:
+        """Get the event loop shared by sync callers, starting its thread on first use"""
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(
+                    target=self._loop.run_forever, name="advisor-loop", daemon=True
+                ).start()
+            return self._loop
@@ -0,0 +1,503 @@
+"""Build or refresh the course index offline with a streaming pipeline.
+
+Pages are fetched, parsed and split in a process pool, embedded in batches and appended
+to the vector store concurrently, with bounded queues between the stages. Progress is
+checkpointed, an interrupted build resumes from the last checkpoint, and the finished
+store is published as a new version of the index repository. Run with:
+    PYTHONPATH=src:src/app python -m app.build_index --output vector_store
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from dotenv import load_dotenv
+import numpy as np
+from chunk_store import Chunk
+from config import COURSE_URLS
+from crawler import AsyncCrawler, Page
+from deduplicator import ChunkDeduplicator
+from embedder import Embedder
+from embedding_cache import EmbeddingCache
+from index_refresh import page_fingerprints
+from index_repository import IndexRepository
+from page_cache import PageCache
+from vector_store import INDEX_KINDS, IndexSpec, VectorStore
+from web_page_processor import WebPageProcessor
+
+
+@dataclass
+class StageStats:
+    """Work done by one pipeline stage and the depth of the queue it reads from"""
+
+    items: int = 0
+    # Time spent working, excluding waiting for input
+    busy_s: float = 0.0
+    max_queue: int = 0
+    queue_samples: list[int] = field(default_factory=list)
+
+    def sample_queue(self, queue: asyncio.Queue) -> None:
+        """Record the depth of the input queue"""
+        self.max_queue = max(self.max_queue, queue.qsize())
+        self.queue_samples.append(queue.qsize())
+
+
+class IndexBuilder:
+    def __init__(
+        self,
+        vectorstore: VectorStore,
+        embedder: Embedder,
+        processor: WebPageProcessor,
+        workers: int = 4,
+        batch_size: int = 128,
+        queue_size: int = 64,
+        repository: IndexRepository | None = None,
+        checkpoint_every: int = 2000,
+        resume: bool = True,
+        allow_partial: bool = False,
+    ):
+        """Initialize streaming index build: fetch -> parse/split -> embed -> append -> checkpoint.
+        Stages run concurrently and hand work over through bounded queues, so network, parsing
+        and model inference overlap and only chunks in flight are held in memory. As in
+        refresh_index, unchanged chunks keep their vectors and chunks of vanished pages are removed,
+        while pages that failed to fetch keep their chunks from the previous build.
+        Args:
+            vectorstore: VectorStore to build or refresh in place
+            embedder: Embedder for new chunks
+            processor: WebPageProcessor with the crawler, page cache, splitter settings and deduplicator
+            workers: Number of processes parsing and splitting pages, 0 splits in a thread
+            batch_size: Maximum number of chunks embedded in one call
+            queue_size: Capacity of the queues between stages
+            repository: IndexRepository to checkpoint the build to and publish the store in
+            checkpoint_every: Number of added chunks between checkpoints
+            resume: Continue from the checkpoint of an interrupted build with the same settings
+            allow_partial: Publish the store even if some pages failed to fetch. Otherwise such a
+                build is only checkpointed, and the next one fetches just the failed pages
+        """
+        self.vectorstore = vectorstore
+        self.embedder = embedder
+        self.processor = processor
+        self.workers = workers
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self.repository = repository
+        self.checkpoint_every = checkpoint_every
+        self.resume = resume
+        self.allow_partial = allow_partial
+        self.stages = {name: StageStats() for name in ("fetch", "split", "embed", "append")}
+        self.stats = {
+            "pages": 0, "resumed": 0, "failed": 0, "added": 0, "removed": 0, "reused": 0, "checkpoints": 0
+        }
+        self.wall_s = 0.0
+        # Version published by the last build
+        self.published_version: str | None = None
+
+    @property
+    def metadata(self) -> dict:
+        """Build settings recorded in the manifest, a checkpoint is only resumed with the same ones"""
+        return {
+            "model_name": getattr(self.embedder, "model_name", None),
+            "chunk_size": self.processor.chunk_size,
+            "chunk_overlap": self.processor.chunk_overlap,
+            "deduplicate": self.processor.deduplicator is not None,
+        }
+
+    def build(self, urls: list[str]) -> dict[str, int]:
+        """Run the pipeline over the URLs
+        Args:
+            urls: List of page URLs to index
+        Returns:
+            Dictionary with numbers of pages (and pages taken from a checkpoint and pages
+            that failed to fetch), added, removed and reused chunks and checkpoints
+        """
+        return asyncio.run(self.abuild(urls))
+
+    async def abuild(self, urls: list[str]) -> dict[str, int]:
+        """Async variant of build, concurrent builds into the same repository run one at a time"""
+        if self.repository is None:
+            return await self._run(urls)
+        with self.repository.lock():
+            return await self._run(urls)
+
+    async def _run(self, urls: list[str]) -> dict[str, int]:
+        """Run the pipeline, then checkpoint or publish the store"""
+        start = time.perf_counter()
+        pages: asyncio.Queue[Page | None] = asyncio.Queue(self.queue_size)
+        chunks: asyncio.Queue[tuple[str, list[Chunk]] | None] = asyncio.Queue(self.queue_size)
+        embedded: asyncio.Queue[tuple[list[Chunk], np.ndarray, list[str]] | None] = asyncio.Queue(
+            self.queue_size
+        )
+        # Chunks of every page seen in this build, text only, for stale removal and deduplication
+        self._pages: dict[str, dict[str, Chunk]] = {}
+        # URLs that failed to fetch, their chunks from the previous build are kept
+        self._failed: list[str] = []
+        # Fingerprints of chunks being embedded, so that a chunk is embedded once
+        self._pending: set[str] = set()
+        # Fingerprints of chunks the last build dropped by deduplication, they are not embedded
+        self._dropped: set[str] = set()
+        self._since_checkpoint = 0
+        if self.repository is not None:
+            self._dropped = self._previously_dropped()
+        if self.repository is not None and self.resume:
+            self._restore_checkpoint(urls)
+        # Pages completed before an interruption are not fetched again
+        urls = [url for url in urls if url not in self._pages]
+
+        # Worker processes are spawned, forking a process with a loaded model is not safe
+        pool: Executor = (
+            ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+            if self.workers > 0
+            else ThreadPoolExecutor(1)
+        )
+        try:
+            await asyncio.gather(
+                self._fetch(urls, pages),
+                self._split(pages, chunks, pool),
+                self._embed(chunks, embedded),
+                self._append(embedded),
+            )
+        finally:
+            pool.shutdown()
+
+        self._finish()
+        if self.repository is not None and self._failed and not self.allow_partial:
+            print(
+                f"Error publishing index: {len(self._failed)} pages failed to fetch, "
+                "the build is checkpointed to retry them"
+            )
+            self._checkpoint()
+        elif self.repository is not None:
+            # Published in the thread holding the repository lock, the pipeline is done
+            self.published_version = self.repository.publish(
+                self.vectorstore, self._progress(), **self.metadata
+            )
+            self.repository.clear_checkpoint()
+        self.wall_s = time.perf_counter() - start
+        return self.stats
+
+    def report(self) -> str:
+        """Format per-stage throughput, utilization and queue depth of the last build"""
+        lines = [f"{'stage':<8}{'items':>8}{'items/s':>10}{'busy':>7}{'queue max':>11}{'mean':>7}"]
+        for name, stage in self.stages.items():
+            throughput = stage.items / stage.busy_s if stage.busy_s else 0.0
+            utilization = stage.busy_s / self.wall_s if self.wall_s else 0.0
+            mean_queue = float(np.mean(stage.queue_samples)) if stage.queue_samples else 0.0
+            lines.append(
+                f"{name:<8}{stage.items:>8}{throughput:>10.1f}{utilization:>7.0%}"
+                f"{stage.max_queue:>11}{mean_queue:>7.1f}"
+            )
+        lines.append(
+            f"{self.stats['pages']} pages ({self.stats['resumed']} from checkpoint, {self.stats['failed']} failed), "
+            f"{self.stats['added']} added, {self.stats['reused']} reused, "
+            f"{self.stats['removed']} removed chunks in {self.wall_s:.1f}s"
+        )
+        return "\n".join(lines)
+
+    async def _fetch(self, urls: list[str], pages: asyncio.Queue) -> None:
+        """Fetch pages concurrently and pass them on in completion order"""
+        crawler = self.processor.crawler or AsyncCrawler()
+        stage = self.stages["fetch"]
+        start = time.perf_counter()
+        async for page in crawler.crawl(urls, cache=self.processor.cache, failed=self._failed):
+            stage.items += 1
+            await pages.put(page)
+        self.stats["failed"] = len(self._failed)
+        # Fetching overlaps with waiting for the network, its busy time is the whole crawl
+        stage.busy_s = time.perf_counter() - start
+        for _ in range(max(self.workers, 1)):
+            await pages.put(None)
+
+    async def _split(self, pages: asyncio.Queue, chunks: asyncio.Queue, pool: Executor) -> None:
+        """Parse and split pages in the pool, reusing chunks of unchanged pages from the page cache"""
+        loop = asyncio.get_running_loop()
+        stage = self.stages["split"]
+        splitter = WebPageProcessor(self.processor.chunk_size, self.processor.chunk_overlap)
+
+        async def worker():
+            while (page := await pages.get()) is not None:
+                stage.sample_queue(pages)
+                start = time.perf_counter()
+                page_chunks, page = self.processor.lookup_page(page)
+                if page_chunks is None:
+                    page_chunks = await loop.run_in_executor(pool, splitter.split_page, page)
+                    self.processor.cache_page(page, page_chunks)
+                stage.busy_s += time.perf_counter() - start
+                stage.items += 1
+                await chunks.put((page.url, page_chunks))
+
+        await asyncio.gather(*(worker() for _ in range(max(self.workers, 1))))
+        await chunks.put(None)
+
+    async def _embed(self, chunks: asyncio.Queue, embedded: asyncio.Queue) -> None:
+        """Embed chunks not in the store yet, in batches of chunks that are already waiting"""
+        stage = self.stages["embed"]
+        batch: list[tuple[str, Chunk]] = []
+        done = False
+        while not done:
+            # Take pages that are waiting until a batch is full, but do not wait for more
+            item = await chunks.get()
+            while item is not None:
+                stage.sample_queue(chunks)
+                batch.extend(self._new_chunks(*item))
+                if len(batch) >= self.batch_size or chunks.empty():
+                    break
+                item = chunks.get_nowait()
+            done = item is None
+
+            while batch and (done or len(batch) >= self.batch_size or chunks.empty()):
+                current, batch = batch[: self.batch_size], batch[self.batch_size :]
+                start = time.perf_counter()
+                embeddings = await asyncio.to_thread(
+                    self.embedder.get_embeddings, [chunk.embedding_text for _, chunk in current]
+                )
+                stage.busy_s += time.perf_counter() - start
+                stage.items += len(current)
+                await embedded.put(
+                    ([chunk for _, chunk in current], embeddings, [fp for fp, _ in current])
+                )
+        await embedded.put(None)
+
+    async def _append(self, embedded: asyncio.Queue) -> None:
+        """Add embedded chunks to the store"""
+        stage = self.stages["append"]
+        # IVF indexes are trained on the first added batch, collect enough vectors for it
+        untrained: list[tuple[list[Chunk], np.ndarray, list[str]]] = []
+        while (item := await embedded.get()) is not None:
+            stage.sample_queue(embedded)
+            if not self.vectorstore.index.is_trained:
+                untrained.append(item)
+                if sum(len(batch[0]) for batch in untrained) < self.vectorstore.index_spec.training_size:
+                    continue
+                item, untrained = self._concatenate(untrained), []
+            await self._add(*item)
+        if untrained:
+            await self._add(*self._concatenate(untrained))
+
+    async def _add(self, chunks: list[Chunk], embeddings: np.ndarray, fingerprints: list[str]) -> None:
+        """Add a batch to the store and save a checkpoint every checkpoint_every chunks"""
+        stage = self.stages["append"]
+        start = time.perf_counter()
+        # Chunks that failed to embed are skipped and embedded again by the next build
+        ids = self.vectorstore.add_chunks(chunks, embeddings, fingerprints=fingerprints)
+        self._pending.difference_update(fingerprints)
+        stage.busy_s += time.perf_counter() - start
+        stage.items += len(chunks)
+        self.stats["added"] += len(ids)
+
+        self._since_checkpoint += len(chunks)
+        if self.repository is not None and self._since_checkpoint >= self.checkpoint_every:
+            self._checkpoint()
+            self._since_checkpoint = 0
+
+    def _checkpoint(self) -> None:
+        """Save the store with the pages whose chunks are all in it.
+        Runs in the event loop, so that other stages do not change the store while it is saved.
+        """
+        fingerprints = self.vectorstore.fingerprints
+        completed = {
+            url: list(chunks)
+            for url, chunks in self._pages.items()
+            if all(fp in fingerprints for fp in chunks)
+        }
+        self.repository.save_checkpoint(self.vectorstore, self._progress(completed), **self.metadata)
+        self.stats["checkpoints"] += 1
+
+    def _progress(self, pages: dict[str, list[str]] | None = None) -> dict:
+        """Build state saved with a checkpoint or a published version"""
+        progress = {"dropped": sorted(self._dropped)}
+        if pages is not None:
+            progress["pages"] = pages
+        return progress
+
+    def _previously_dropped(self) -> set[str]:
+        """Fingerprints of chunks dropped by the build that published the store being refreshed"""
+        manifest = self.repository.manifest()
+        if (
+            self.processor.deduplicator is None
+            or manifest is None
+            or manifest["store_version"] != self.vectorstore.version
+        ):
+            return set()
+        return set(manifest.get("progress", {}).get("dropped", []))
+
+    def _restore_checkpoint(self, urls: list[str]) -> None:
+        """Load the checkpoint of an interrupted build and mark its completed pages as seen"""
+        progress = self.repository.load_checkpoint(self.vectorstore, **self.metadata)
+        if progress is None:
+            return
+        self._dropped = set(progress.get("dropped", []))
+        fingerprints = self.vectorstore.fingerprints
+        wanted = set(urls)
+        for url, chunks in progress["pages"].items():
+            if url not in wanted:
+                continue
+            self._pages[url] = {
+                fp: self.vectorstore.chunks[fingerprints[fp]] for fp in chunks if fp in fingerprints
+            }
+        self.stats["resumed"] = len(self._pages)
+        self.stats["pages"] += len(self._pages)
+
+    @staticmethod
+    def _concatenate(
+        batches: list[tuple[list[Chunk], np.ndarray, list[str]]]
+    ) -> tuple[list[Chunk], np.ndarray, list[str]]:
+        """Join embedded batches into one"""
+        return (
+            [chunk for chunks, _, _ in batches for chunk in chunks],
+            np.vstack([embeddings for _, embeddings, _ in batches]),
+            [fingerprint for _, _, fingerprints in batches for fingerprint in fingerprints],
+        )
+
+    def _new_chunks(self, url: str, chunks: list[Chunk]) -> list[tuple[str, Chunk]]:
+        """Remember the chunks of a page and get the ones whose vectors are not in the store yet.
+        Chunks dropped by deduplication last time are not embedded, _finish embeds the ones
+        this build keeps after all.
+        """
+        self.stats["pages"] += 1
+        current = page_fingerprints(url, chunks)
+        self._pages[url] = current
+        new = []
+        moved = {}
+        for fingerprint, chunk in current.items():
+            idx = self.vectorstore.fingerprints.get(fingerprint)
+            if idx is None and fingerprint in self._dropped:
+                continue
+            if idx is None and fingerprint not in self._pending:
+                self._pending.add(fingerprint)
+                new.append((fingerprint, chunk))
+            elif idx is not None:
+                self.stats["reused"] += 1
+                if self.vectorstore.chunks[idx] != chunk:
+                    moved[idx] = chunk
+        self.vectorstore.update_chunks(moved)
+        return new
+
+    def _finish(self) -> None:
+        """Remove chunks of pages that are gone and chunks dropped by deduplication.
+        Chunks of pages that failed to fetch are kept, they are not known to be gone.
+        """
+        current = {fp for chunks in self._pages.values() for fp in chunks}
+        deduplicator = self.processor.deduplicator
+        if deduplicator is not None:
+            pages = {url: list(chunks.values()) for url, chunks in self._pages.items()}
+            kept = deduplicator.deduplicate(pages)
+            current = {
+                fp for url, chunks in kept.items() for fp in page_fingerprints(url, chunks)
+            }
+            seen = {fp: chunk for chunks in self._pages.values() for fp, chunk in chunks.items()}
+            # Kept chunks that were skipped as dropped by the last build are embedded now
+            revived = [
+                (fp, seen[fp])
+                for fp in sorted(current)
+                if fp in self._dropped and fp not in self.vectorstore.fingerprints
+            ]
+            if revived:
+                embeddings = self.embedder.get_embeddings([chunk.embedding_text for _, chunk in revived])
+                ids = self.vectorstore.add_chunks(
+                    [chunk for _, chunk in revived], embeddings, fingerprints=[fp for fp, _ in revived]
+                )
+                self.stats["added"] += len(ids)
+            # Remembered so that the next build does not embed them only to drop them again
+            self._dropped = {fp for fp in seen if fp not in current}
+        failed = set(self._failed)
+        stale = [
+            idx
+            for fp, idx in self.vectorstore.fingerprints.items()
+            if fp not in current and self.vectorstore.chunks[idx].source not in failed
+        ]
+        # Chunks added without a fingerprint cannot be matched and are replaced as well
+        fingerprinted = set(self.vectorstore.fingerprints.values())
+        stale.extend(
+            idx
+            for idx, chunk in self.vectorstore.chunks.items()
+            if idx not in fingerprinted and chunk.source not in failed
+        )
+        self.vectorstore.remove_ids(stale)
+        self.stats["removed"] = len(stale)
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", default=os.getenv("VECTOR_STORE_PATH"), help="Directory of the index repository")
+    parser.add_argument("--urls", nargs="+", default=COURSE_URLS)
+    parser.add_argument("--page-cache", default=os.getenv("PAGE_CACHE_DIR"))
+    parser.add_argument("--embedding-cache", default=os.getenv("EMBEDDING_CACHE_PATH"))
+    parser.add_argument("--model", default="intfloat/multilingual-e5-small")
+    parser.add_argument("--index-kind", choices=INDEX_KINDS, default="flat")
+    parser.add_argument(
+        "--rescore",
+        type=int,
+        default=0,
+        help="Keep float32 vectors of compressed kinds and re-score this many candidates per result",
+    )
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--batch-size", type=int, default=128)
+    parser.add_argument("--queue-size", type=int, default=64)
+    parser.add_argument("--checkpoint-every", type=int, default=2000)
+    parser.add_argument("--no-dedup", action="store_true", help="Keep site chrome and near-duplicate chunks")
+    parser.add_argument("--rebuild", action="store_true", help="Ignore the existing index and embed everything")
+    parser.add_argument("--no-resume", action="store_true", help="Discard the checkpoint of an interrupted build")
+    parser.add_argument(
+        "--allow-partial",
+        action="store_true",
+        help="Publish the index even if some pages failed to fetch, keeping their previous chunks",
+    )
+    parser.add_argument("--keep", type=int, default=3, help="Number of published versions to keep")
+    parser.add_argument(
+        "--rollback",
+        nargs="?",
+        const="",
+        metavar="VERSION",
+        help="Point the index to an earlier version (default: the previous one) instead of building",
+    )
+    args = parser.parse_args()
+    if not args.output:
+        parser.error("--output or VECTOR_STORE_PATH is required")
+
+    repository = IndexRepository(args.output, keep=args.keep)
+    if args.rollback is not None:
+        print(f"Current version: {repository.rollback(args.rollback or None)}")
+        return
+
+    embedder = Embedder(
+        model_name=args.model,
+        cache=EmbeddingCache(args.embedding_cache) if args.embedding_cache else None,
+    )
+    # Wait for a concurrent build to finish, this one then starts from the version it published
+    with repository.lock():
+        if repository.current_path() is not None and not args.rebuild:
+            vectorstore = repository.load()
+        else:
+            spec = IndexSpec(kind=args.index_kind, rescore=args.rescore)
+            vectorstore = VectorStore(embedder.get_embedding_dimension(), spec)
+
+        processor = WebPageProcessor(
+            crawler=AsyncCrawler(),
+            cache=PageCache(args.page_cache) if args.page_cache else None,
+            deduplicator=None if args.no_dedup else ChunkDeduplicator(),
+        )
+        builder = IndexBuilder(
+            vectorstore,
+            embedder,
+            processor,
+            workers=args.workers,
+            batch_size=args.batch_size,
+            queue_size=args.queue_size,
+            repository=repository,
+            checkpoint_every=args.checkpoint_every,
+            resume=not args.no_resume,
+            allow_partial=args.allow_partial,
+        )
+        builder.build(args.urls)
+    print(builder.report())
+    if builder.published_version is None:
+        parser.exit(1, "Index not published, rerun to retry failed pages or pass --allow-partial\n")
+    print(f"Current version: {builder.published_version}")
+
+
+if __name__ == "__main__":
+    main()
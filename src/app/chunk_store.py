@@ -0,0 +1,232 @@
+import fnmatch
+import json
+import os
+import re
+from dataclasses import dataclass
+from typing import Iterator, Mapping
+import numpy as np
+
+MAGIC = b"CHUNKS02"
+# Format written before chunk positions and sections were stored, still readable
+MAGIC_V1 = b"CHUNKS01"
+# Header every chunk gets from WebPageProcessor.split_documents
+CHUNK_HEADER = re.compile(
+    r"Page name:\n(?P<title>.*?)\nPage source:\n(?P<source>.*?)\nPage content:\n(?P<content>.*)\n",
+    re.DOTALL,
+)
+FINGERPRINT_SIZE = 64
+
+
+def format_chunk(title: str, source: str, content: str) -> str:
+    """Format chunk text the same way WebPageProcessor.split_documents does"""
+    return f"Page name:\n{title}\nPage source:\n{source}\nPage content:\n{content}\n"
+
+
+@dataclass
+class Chunk:
+    """Piece of page content with the metadata of where it comes from"""
+
+    text: str
+    # URL and title of the page, None for chunks added as plain text
+    source: str | None = None
+    title: str | None = None
+    # Number of the chunk within its page
+    position: int = 0
+    # Nearest heading above the chunk on the page
+    section: str | None = None
+
+    @classmethod
+    def from_text(cls, text: str, position: int = 0) -> "Chunk":
+        """Create a chunk from text, splitting off the "Page name / Page source" header if it has one
+        Args:
+            text: Chunk text, optionally formatted with format_chunk
+            position: Number of the chunk within its page
+        Returns:
+            Chunk with the header moved to source and title
+        """
+        match = CHUNK_HEADER.fullmatch(text)
+        if match and format_chunk(*match.group("title", "source", "content")) == text:
+            return cls(
+                text=match.group("content"),
+                source=match.group("source"),
+                title=match.group("title"),
+                position=position,
+            )
+        return cls(text=text, position=position)
+
+    @property
+    def formatted(self) -> str:
+        """Chunk text prefixed with page name and source, as shown to the language model"""
+        if self.source is None:
+            return self.text
+        return format_chunk(self.title or "Unknown", self.source, self.text)
+
+    @property
+    def embedding_text(self) -> str:
+        """Text to embed: page title and content, without the URL and field labels"""
+        return f"{self.title}\n{self.text}" if self.title else self.text
+
+
+class ChunkStore(Mapping[int, Chunk]):
+    def __init__(self, path: str, mmap: bool = True):
+        """Open a binary chunk store written by ChunkStore.write.
+        The file holds sorted chunk IDs, columnar metadata arrays and one UTF-8 blob of chunk
+        texts, page titles, URLs and sections are interned into separate tables. Text is decoded
+        only for the chunks that are actually read.
+        Args:
+            path: Path to the chunk store file
+            mmap: Memory-map the file instead of reading it into memory
+        """
+        self.path = path
+        buffer = np.memmap(path, dtype=np.uint8, mode="r") if mmap else np.fromfile(path, dtype=np.uint8)
+        magic = bytes(buffer[: len(MAGIC)])
+        if magic not in (MAGIC, MAGIC_V1):
+            raise ValueError(f"{path} is not a chunk store")
+
+        header_size = int(buffer[8:16].view(np.uint64)[0])
+        header = json.loads(bytes(buffer[16 : 16 + header_size]))
+        count = header["count"]
+        self.pages: list[tuple[str, str]] = [tuple(page) for page in header["pages"]]
+        self.sections: list[str] = header.get("sections", [])
+
+        position = 16 + header_size
+        arrays = {}
+        layout = [
+            ("ids", np.int64, count),
+            ("offsets", np.int64, count + 1),
+            ("page_ids", np.int32, count),
+            ("positions", np.int32, count),
+            ("section_ids", np.int32, count),
+            ("fingerprints", f"S{FINGERPRINT_SIZE}", count),
+        ]
+        if magic == MAGIC_V1:
+            # Stores of the first format have no positions and sections
+            layout = [section for section in layout if section[0] not in ("positions", "section_ids")]
+            arrays["positions"] = np.zeros(count, dtype=np.int32)
+            arrays["section_ids"] = np.full(count, -1, dtype=np.int32)
+        for name, dtype, size in layout:
+            nbytes = np.dtype(dtype).itemsize * size
+            arrays[name] = buffer[position : position + nbytes].view(dtype)
+            position += _padded(nbytes)
+        self.ids = arrays["ids"]
+        self.offsets = arrays["offsets"]
+        self.page_ids = arrays["page_ids"]
+        self.positions = arrays["positions"]
+        self.section_ids = arrays["section_ids"]
+        self.fingerprint_codes = arrays["fingerprints"]
+        self.blob = buffer[position : position + header["blob_size"]]
+
+    @staticmethod
+    def write(path: str, chunks: Mapping[int, Chunk], fingerprints: Mapping[int, str] | None = None) -> None:
+        """Write chunks to a chunk store file, replacing it atomically
+        Args:
+            path: Path to the chunk store file
+            chunks: Mapping of chunk ID to chunk
+            fingerprints: Optional mapping of chunk ID to its fingerprint
+        """
+        fingerprints = fingerprints or {}
+        ids = np.array(sorted(chunks), dtype=np.int64)
+        page_index: dict[tuple[str, str | None], int] = {}
+        section_index: dict[str, int] = {}
+        page_ids = np.full(len(ids), -1, dtype=np.int32)
+        positions = np.zeros(len(ids), dtype=np.int32)
+        section_ids = np.full(len(ids), -1, dtype=np.int32)
+        texts = []
+        for row, idx in enumerate(ids.tolist()):
+            chunk = chunks[idx]
+            if chunk.source is not None:
+                page_ids[row] = page_index.setdefault((chunk.title, chunk.source), len(page_index))
+            if chunk.section is not None:
+                section_ids[row] = section_index.setdefault(chunk.section, len(section_index))
+            positions[row] = chunk.position
+            texts.append(chunk.text.encode("utf-8"))
+
+        offsets = np.zeros(len(ids) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(text) for text in texts])
+        fingerprint_codes = np.array(
+            [(fingerprints.get(idx) or "").encode("ascii") for idx in ids.tolist()],
+            dtype=f"S{FINGERPRINT_SIZE}",
+        )
+        header = json.dumps(
+            {
+                "count": len(ids),
+                "blob_size": int(offsets[-1]),
+                "pages": list(page_index),
+                "sections": list(section_index),
+            },
+            ensure_ascii=False,
+        ).encode("utf-8")
+        header += b" " * (_padded(len(header)) - len(header))
+
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(MAGIC)
+            f.write(np.uint64(len(header)).tobytes())
+            f.write(header)
+            for array in (ids, offsets, page_ids, positions, section_ids, fingerprint_codes):
+                data = array.tobytes()
+                f.write(data + b"\0" * (_padded(len(data)) - len(data)))
+            for text in texts:
+                f.write(text)
+        # Readers that memory-mapped the old file keep seeing it until they reopen
+        os.replace(temp_path, path)
+
+    def __getitem__(self, idx: int) -> Chunk:
+        row = self._row(idx)
+        if row is None:
+            raise KeyError(idx)
+
+        text = bytes(self.blob[self.offsets[row] : self.offsets[row + 1]]).decode("utf-8")
+        page_id = int(self.page_ids[row])
+        section_id = int(self.section_ids[row])
+        title, source = self.pages[page_id] if page_id >= 0 else (None, None)
+        return Chunk(
+            text=text,
+            source=source,
+            title=title,
+            position=int(self.positions[row]),
+            section=self.sections[section_id] if section_id >= 0 else None,
+        )
+
+    def __contains__(self, idx: object) -> bool:
+        return isinstance(idx, (int, np.integer)) and self._row(int(idx)) is not None
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.ids.tolist())
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def fingerprints(self) -> dict[str, int]:
+        """Get the fingerprint -> chunk ID mapping of chunks stored with a fingerprint"""
+        return {
+            code.decode("ascii"): idx
+            for code, idx in zip(self.fingerprint_codes.tolist(), self.ids.tolist())
+            if code
+        }
+
+    def ids_from_sources(self, patterns: list[str]) -> np.ndarray:
+        """Get IDs of chunks whose source URL matches any of the glob patterns
+        Args:
+            patterns: fnmatch-style patterns, e.g. "*/simulator*"
+        Returns:
+            Array of matching chunk IDs
+        """
+        pages = [
+            page_id
+            for page_id, (_, source) in enumerate(self.pages)
+            if any(fnmatch.fnmatchcase(source, pattern) for pattern in patterns)
+        ]
+        return self.ids[np.isin(self.page_ids, pages)]
+
+    def _row(self, idx: int) -> int | None:
+        """Find the row of a chunk ID in the sorted IDs array"""
+        row = int(np.searchsorted(self.ids, idx))
+        if row < len(self.ids) and self.ids[row] == idx:
+            return row
+        return None
+
+
+def _padded(size: int) -> int:
+    """Round a section size up to 8 bytes, so that every array is aligned"""
+    return (size + 7) // 8 * 8
@@ -0,0 +1,125 @@
+import math
+from dataclasses import dataclass
+from typing import Callable
+from chunk_store import format_chunk
+
+
+@dataclass
+class BuiltContext:
+    """Context assembled for the prompt with its token counts"""
+
+    text: str
+    # Tokens of the assembled context and of the search results joined as they are
+    tokens: int
+    naive_tokens: int
+    # Number of search results that made it into the context
+    chunks: int
+
+    @property
+    def saved_tokens(self) -> int:
+        """Prompt tokens saved compared to joining all search results"""
+        return self.naive_tokens - self.tokens
+
+
+class ContextBuilder:
+    def __init__(
+        self,
+        max_tokens: int = 1500,
+        token_counter: Callable[[str], int] | None = None,
+        model: str | None = None,
+        min_overlap: int = 20,
+    ):
+        """Initialize builder that assembles search results into prompt context within a token budget.
+        Results are taken in score order while they fit. Chunks of one page are printed under a
+        single "Page name / Page source" header in page order, and the text neighbouring chunks
+        share because of the splitter overlap is printed once.
+        Args:
+            max_tokens: Token budget of the context
+            token_counter: Function counting tokens of a text, by default tiktoken for the model
+                if it is installed, otherwise an estimate of one token per three characters
+            model: Name of the LLM, used to pick the tiktoken encoding
+            min_overlap: Minimum number of shared characters to treat neighbouring chunks as overlapping
+        """
+        self.max_tokens = max_tokens
+        self.model = model
+        self.min_overlap = min_overlap
+        self._token_counter = token_counter
+
+    def count_tokens(self, text: str) -> int:
+        """Count tokens of a text
+        Args:
+            text: Text to count tokens of
+        Returns:
+            Number of tokens
+        """
+        if self._token_counter is None:
+            self._token_counter = self._default_token_counter()
+        return self._token_counter(text)
+
+    def build(self, results: list[dict]) -> BuiltContext:
+        """Assemble search results into context
+        Args:
+            results: Search results of VectorStore sorted by descending score
+        Returns:
+            BuiltContext with the context text and token counts
+        """
+        naive_tokens = self.count_tokens("\n".join(result["chunk"] for result in results))
+        # Page -> position -> result, pages ordered by their best result
+        selected: dict[tuple, dict[int, dict]] = {}
+        text, tokens, used = "", 0, 0
+        for i, result in enumerate(results):
+            # Chunks added as plain text have no page and are never merged
+            page = (result.get("source"), result.get("title")) if result.get("source") else (None, i)
+            chunks = selected.get(page, {})
+            if result.get("position", 0) in chunks:
+                continue
+
+            candidate = {**selected, page: {**chunks, result.get("position", 0): result}}
+            candidate_text = self._render(candidate)
+            candidate_tokens = self.count_tokens(candidate_text)
+            if candidate_tokens > self.max_tokens:
+                # A lower ranked shorter chunk may still fit
+                continue
+            selected, text, tokens = candidate, candidate_text, candidate_tokens
+            used += 1
+
+        return BuiltContext(text=text, tokens=tokens, naive_tokens=naive_tokens, chunks=used)
+
+    def _render(self, selected: dict[tuple, dict[int, dict]]) -> str:
+        """Render selected chunks with one header per page"""
+        parts = []
+        for (source, title), chunks in selected.items():
+            body, previous = "", None
+            for position, result in sorted(chunks.items()):
+                chunk_text = result.get("text", result["chunk"])
+                if previous is None:
+                    body = chunk_text
+                elif position == previous + 1:
+                    body = self._merge(body, chunk_text)
+                else:
+                    body = f"{body}\n...\n{chunk_text}"
+                previous = position
+            parts.append(format_chunk(title or "Unknown", source, body) if source else body)
+        return "\n".join(parts)
+
+    def _merge(self, text: str, next_text: str) -> str:
+        """Append the next chunk of a page without the text both chunks share"""
+        for size in range(min(len(text), len(next_text)), self.min_overlap - 1, -1):
+            if text.endswith(next_text[:size]):
+                return text + next_text[size:]
+        return f"{text}\n{next_text}"
+
+    def _default_token_counter(self) -> Callable[[str], int]:
+        """Get tiktoken counter for the model, or a character based estimate without tiktoken"""
+        try:
+            import tiktoken
+
+            try:
+                encoding = tiktoken.encoding_for_model(self.model or "")
+            except KeyError:
+                encoding = tiktoken.get_encoding("o200k_base")
+            return lambda text: len(encoding.encode(text, disallowed_special=()))
+        except Exception as e:
+            # tiktoken is not installed or could not download its encoding
+            print(f"Error loading tokenizer, estimating tokens from text length: {e}")
+            return lambda text: math.ceil(len(text) / 3)
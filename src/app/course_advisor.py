@@ -1,37 +1,169 @@
+import asyncio
 import os
-from openai import OpenAI
-from config import QA_PROMPT
+import time
+from typing import TYPE_CHECKING, AsyncIterator, Callable, Iterator, TypeVar
+import numpy as np
+from numpy.typing import NDArray
+from adaptive_retrieval import AdaptiveK
+from config import OFF_TOPIC_ANSWER, QA_PROMPT
+from context_builder import BuiltContext, ContextBuilder
+from reranker import Reranker
 from vector_store import VectorStore
 from embedder import Embedder
+from semantic_cache import SemanticCache, cache_scope
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI, OpenAI
+
+T = TypeVar("T")
 
 
 class CourseAdvisor:
-    def __init__(self, vectorstore: VectorStore, embedder: Embedder):
+    def __init__(
+        self,
+        vectorstore: VectorStore,
+        embedder: Embedder,
+        hybrid: bool = True,
+        cache: SemanticCache | None = None,
+        context_builder: ContextBuilder | None = None,
+        top_k: int = 5,
+        adaptive_k: AdaptiveK | None = None,
+        reranker: Reranker | None = None,
+    ):
         """Initialize course advisor with vector store and embedder
         Args:
             vectorstore: VectorStore instance for course content search
             embedder: Embedder instance for question embedding
+            hybrid: Fuse dense search with BM25 keyword search (default: True)
+            cache: Optional SemanticCache to reuse answers to similar questions
+            context_builder: Assembles retrieved chunks into the prompt within a token budget
+                (default: ContextBuilder with a 1500 token budget)
+            top_k: Number of chunks retrieved for the context
+            adaptive_k: Optional AdaptiveK choosing the number of chunks from their scores instead of
+                top_k, questions without relevant chunks get OFF_TOPIC_ANSWER without an LLM call
+            reranker: Optional Reranker re-scoring reranker.candidates search results with a cross-encoder
         """
-        self.client = OpenAI(
-            api_key=os.getenv("OPENAI_API_KEY"), base_url=os.getenv("OPENAI_BASE_URL")
-        )
         self.model = os.getenv("OPENAI_MODEL")
         self.vectorstore = vectorstore
         self.embedder = embedder
+        self.hybrid = hybrid
+        self.cache = cache
+        self.context_builder = context_builder or ContextBuilder(model=self.model)
+        self.top_k = top_k
+        self.adaptive_k = adaptive_k
+        self.reranker = reranker
+        # Prompt context sizes summed over all queries, and questions answered without the LLM
+        self.context_stats = {"queries": 0, "tokens": 0, "saved_tokens": 0, "off_topic": 0}
+        self._client = None
+        self._async_client = None
+
+    @property
+    def client(self) -> "OpenAI":
+        """OpenAI client, the openai package is imported on first use"""
+        if self._client is None:
+            from openai import OpenAI
+
+            self._client = OpenAI(
+                api_key=os.getenv("OPENAI_API_KEY"),
+                base_url=os.getenv("OPENAI_BASE_URL"),
+            )
+        return self._client
+
+    @property
+    def async_client(self) -> "AsyncOpenAI":
+        """Async OpenAI client for streaming from async code, created on first use"""
+        if self._async_client is None:
+            from openai import AsyncOpenAI
 
-    def retrieve_context(self, question: str) -> list[str]:
+            self._async_client = AsyncOpenAI(
+                api_key=os.getenv("OPENAI_API_KEY"),
+                base_url=os.getenv("OPENAI_BASE_URL"),
+            )
+        return self._async_client
+
+    def retrieve_context(
+        self,
+        question: str,
+        sources: str | list[str] | None = None,
+        question_embedding: NDArray[np.float32] | None = None,
+    ) -> list[str]:
         """Retrieve relevant course content for the question
         Args:
             question: Question about courses
+            sources: Optional glob pattern(s) of page URLs to search in, e.g. "*/simulator*"
+            question_embedding: Embedding of the question if it is already computed
         Returns:
             List of relevant course content chunks
         """
+        return [doc["chunk"] for doc in self.search(question, sources, question_embedding)]
+
+    def search(
+        self,
+        question: str,
+        sources: str | list[str] | None = None,
+        question_embedding: NDArray[np.float32] | None = None,
+        vectorstore: VectorStore | None = None,
+    ) -> list[dict]:
+        """Search course content for the question
+        Args:
+            question: Question about courses
+            sources: Optional glob pattern(s) of page URLs to search in
+            question_embedding: Embedding of the question if it is already computed
+            vectorstore: Store the query is pinned to, the current one by default
+        Returns:
+            Search results of the vector store with chunk text, scores and metadata,
+            with adaptive_k only the relevant ones
+        """
         # Get embedding for the question
-        question_embedding = self.embedder.get_embeddings([question])
+        if question_embedding is None:
+            question_embedding = self.embedder.get_embeddings([question])
+
+        # Search using similarity, fused with keyword search
+        store = self.vectorstore if vectorstore is None else vectorstore
+        if self.hybrid:
+            results = store.hybrid_search(
+                question_embedding, question, k=self.search_k, sources=sources
+            )
+        else:
+            results = store.similarity_search(question_embedding, k=self.search_k, sources=sources)
+        return self.select_results(question, results)
+
+    @property
+    def search_k(self) -> int:
+        """Number of search results to retrieve before select_results"""
+        return self.reranker.candidates if self.reranker is not None else self.context_k
+
+    @property
+    def context_k(self) -> int:
+        """Maximum number of chunks used for the context"""
+        return self.top_k if self.adaptive_k is None else self.adaptive_k.max_k
+
+    def select_results(self, question: str, results: list[dict]) -> list[dict]:
+        """Re-rank search results and keep the relevant ones
+        Args:
+            question: Question about courses
+            results: search_k search results sorted by rank
+        Returns:
+            Results to build the context from, empty for off-topic questions
+        """
+        if self.reranker is not None:
+            results = self.reranker.rerank(question, results, self.context_k)
+        else:
+            results = results[: self.context_k]
+        return results if self.adaptive_k is None else self.adaptive_k.select(results)
 
-        # Search using similarity
-        results = self.vectorstore.similarity_search(question_embedding)
-        return [doc["chunk"] for doc in results]
+    def build_context(self, results: list[dict]) -> BuiltContext:
+        """Assemble search results into prompt context and record the prompt tokens saved
+        Args:
+            results: Search results sorted by descending score
+        Returns:
+            BuiltContext with the context text and token counts
+        """
+        context = self.context_builder.build(results)
+        self.context_stats["queries"] += 1
+        self.context_stats["tokens"] += context.tokens
+        self.context_stats["saved_tokens"] += context.saved_tokens
+        return context
 
     def generate_completion(self, question: str, context: str, **kwargs) -> str:
         """Generate course advice using OpenAI API
@@ -42,28 +174,249 @@ class CourseAdvisor:
             Generated course advice
         """
         try:
-            # Format the prompt using the template
-            formatted_prompt = QA_PROMPT.format(context=context, question=question)
-            messages = [{"role": "user", "content": formatted_prompt}]
-
             response = self.client.chat.completions.create(
-                model=self.model, messages=messages, **kwargs
+                model=self.model, messages=self._messages(question, context), **kwargs
             )
             return response.choices[0].message.content
         except Exception as e:
             print(f"Error generating course advice: {e}")
             return ""
 
+    def stream_completion(self, question: str, context: str, **kwargs) -> Iterator[str]:
+        """Generate course advice using OpenAI API and yield it as it is generated
+        Args:
+            question: Question about courses
+            context: Relevant course content to use for answering
+        Returns:
+            Iterator over text deltas of the answer
+        Raises:
+            Exception: Error of a stream that failed, re-raised after logging so that a
+                truncated answer is not taken for a complete one
+        """
+        try:
+            response = self.client.chat.completions.create(
+                model=self.model,
+                messages=self._messages(question, context),
+                stream=True,
+                **kwargs,
+            )
+            for chunk in response:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        except Exception as e:
+            print(f"Error generating course advice: {e}")
+            raise
+
+    async def astream_completion(self, question: str, context: str, **kwargs) -> AsyncIterator[str]:
+        """Async variant of stream_completion
+        Args:
+            question: Question about courses
+            context: Relevant course content to use for answering
+        Returns:
+            Async iterator over text deltas of the answer
+        Raises:
+            Exception: Error of a stream that failed, re-raised after logging
+        """
+        try:
+            response = await self.async_client.chat.completions.create(
+                model=self.model,
+                messages=self._messages(question, context),
+                stream=True,
+                **kwargs,
+            )
+            async for chunk in response:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        except Exception as e:
+            print(f"Error generating course advice: {e}")
+            raise
+
     def process_query(self, question: str, **kwargs) -> str:
-        """Process a course-related question and generate advice
+        """Process a course-related question and generate advice.
+        Answers to questions similar to already answered ones are taken from the cache.
         Args:
             question: Question about courses
         Returns:
             Generated course advice based on relevant content
         """
-        # Get relevant context
-        contexts = self.retrieve_context(question)
-        context_str = "\n".join(contexts)
+        # The store is read once, a swapped index is only used by the next query
+        store = self.vectorstore
+        index_version = store.version
+        scope = cache_scope(**kwargs)
+        question_embedding = self.embedder.get_embeddings([question])
+        if self.cache is not None:
+            answer = self.cache.get(question_embedding, index_version, scope)
+            if answer is not None:
+                return answer
+
+        # Get relevant context, off-topic questions are refused without calling the LLM
+        results = self.search(question, question_embedding=question_embedding, vectorstore=store)
+        if not results:
+            self.context_stats["off_topic"] += 1
+            return OFF_TOPIC_ANSWER
+        context = self.build_context(results)
+
+        # Generate and return answer, failed completions are not cached
+        answer = self.generate_completion(question, context.text, **kwargs)
+        self._cache_answer(question, question_embedding, answer, store, index_version, scope)
+        return answer
+
+    def stream_query(
+        self, question: str, timings: dict[str, float] | None = None, **kwargs
+    ) -> Iterator[str]:
+        """Process a course-related question and yield the advice as it is generated
+        Args:
+            question: Question about courses
+            timings: Optional dictionary filled with retrieval_s, ttft_s (time to first token)
+                and total_s in seconds, cached (whether the answer came from the cache),
+                context_tokens (size of the prompt context), off_topic (whether the question
+                was refused without calling the LLM) and failed (whether the answer stream
+                broke off, such answers are not cached)
+        Returns:
+            Iterator over text deltas of the advice
+        """
+        timings = {} if timings is None else timings
+        start = time.perf_counter()
+        store = self.vectorstore
+        index_version = store.version
+        scope = cache_scope(**kwargs)
+        question_embedding = self.embedder.get_embeddings([question])
+        cached = self._cached_answer(question_embedding, timings, start, index_version, scope)
+        if cached is not None:
+            yield cached
+            return
+
+        results = self.search(question, question_embedding=question_embedding, vectorstore=store)
+        if not results:
+            yield self._off_topic_answer(timings, start)
+            return
+
+        context = self.build_context(results)
+        timings.update(retrieval_s=time.perf_counter() - start, context_tokens=context.tokens)
+
+        parts = []
+        try:
+            for delta in self.stream_completion(question, context.text, **kwargs):
+                if not parts:
+                    timings["ttft_s"] = time.perf_counter() - start
+                parts.append(delta)
+                yield delta
+        except Exception:
+            # The error is already logged, a truncated answer is shown but never cached
+            timings.update(failed=True, total_s=time.perf_counter() - start)
+            return
+        self._finish(
+            question, question_embedding, "".join(parts), timings, start, store, index_version, scope
+        )
+
+    async def astream_query(
+        self, question: str, timings: dict[str, float] | None = None, **kwargs
+    ) -> AsyncIterator[str]:
+        """Async variant of stream_query, embedding and search run in a worker thread
+        Args:
+            question: Question about courses
+            timings: Optional dictionary filled the same way as by stream_query
+        Returns:
+            Async iterator over text deltas of the advice
+        """
+        timings = {} if timings is None else timings
+        start = time.perf_counter()
+        store = self.vectorstore
+        index_version = store.version
+        scope = cache_scope(**kwargs)
+        question_embedding = await self._run_blocking(self.embedder.get_embeddings, [question])
+        cached = self._cached_answer(question_embedding, timings, start, index_version, scope)
+        if cached is not None:
+            yield cached
+            return
+
+        results = await self._run_blocking(
+            self.search, question, question_embedding=question_embedding, vectorstore=store
+        )
+        if not results:
+            yield self._off_topic_answer(timings, start)
+            return
+
+        context = self.build_context(results)
+        timings.update(retrieval_s=time.perf_counter() - start, context_tokens=context.tokens)
+
+        parts = []
+        try:
+            async for delta in self.astream_completion(question, context.text, **kwargs):
+                if not parts:
+                    timings["ttft_s"] = time.perf_counter() - start
+                parts.append(delta)
+                yield delta
+        except Exception:
+            # The error is already logged, a truncated answer is shown but never cached
+            timings.update(failed=True, total_s=time.perf_counter() - start)
+            return
+        self._finish(
+            question, question_embedding, "".join(parts), timings, start, store, index_version, scope
+        )
+
+    async def _run_blocking(self, func: Callable[..., T], *args, **kwargs) -> T:
+        """Run blocking embedding or search code in a worker thread"""
+        return await asyncio.to_thread(func, *args, **kwargs)
+
+    def _cached_answer(
+        self,
+        question_embedding: NDArray[np.float32],
+        timings: dict[str, float],
+        start: float,
+        index_version: str,
+        scope: str | None = None,
+    ) -> str | None:
+        """Look up the answer cache and record timings of a hit"""
+        timings["cached"] = False
+        if self.cache is None:
+            return None
+
+        answer = self.cache.get(question_embedding, index_version, scope)
+        if answer is not None:
+            elapsed = time.perf_counter() - start
+            timings.update(cached=True, retrieval_s=elapsed, ttft_s=elapsed, total_s=elapsed)
+        return answer
+
+    def _off_topic_answer(self, timings: dict[str, float], start: float) -> str:
+        """Record timings of a question refused because no relevant content was found"""
+        self.context_stats["off_topic"] += 1
+        elapsed = time.perf_counter() - start
+        timings.update(off_topic=True, retrieval_s=elapsed, ttft_s=elapsed, total_s=elapsed)
+        return OFF_TOPIC_ANSWER
+
+    def _finish(
+        self,
+        question: str,
+        question_embedding: NDArray[np.float32],
+        answer: str,
+        timings: dict[str, float],
+        start: float,
+        store: VectorStore,
+        index_version: str,
+        scope: str | None = None,
+    ) -> None:
+        """Record total time and cache a complete streamed answer"""
+        timings["total_s"] = time.perf_counter() - start
+        self._cache_answer(question, question_embedding, answer, store, index_version, scope)
+
+    def _cache_answer(
+        self,
+        question: str,
+        question_embedding: NDArray[np.float32],
+        answer: str,
+        store: VectorStore,
+        index_version: str,
+        scope: str | None = None,
+    ) -> None:
+        """Cache an answer, unless it failed or the store it was searched in was swapped or
+        changed while it was generated"""
+        swapped = store is not self.vectorstore or index_version != store.version
+        if self.cache is not None and answer and not swapped:
+            self.cache.put(question, question_embedding, answer, index_version, scope)
 
-        # Generate and return answer
-        return self.generate_completion(question, context_str, **kwargs)
+    @staticmethod
+    def _messages(question: str, context: str) -> list[dict[str, str]]:
+        """Format the prompt using the template"""
+        formatted_prompt = QA_PROMPT.format(context=context, question=question)
+        return [{"role": "user", "content": formatted_prompt}]
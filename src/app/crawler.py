@@ -0,0 +1,137 @@
+import asyncio
+import random
+from dataclasses import dataclass
+from typing import AsyncIterator
+import aiohttp
+from page_cache import PageCache
+
+# Statuses worth retrying: rate limiting and transient server errors
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+@dataclass
+class Page:
+    """Raw HTML of a fetched web page"""
+
+    url: str
+    html: str
+    status: int
+    etag: str | None = None
+    last_modified: str | None = None
+
+    @property
+    def not_modified(self) -> bool:
+        """Whether the server answered a conditional request with 304 Not Modified"""
+        return self.status == 304
+
+
+class AsyncCrawler:
+    def __init__(
+        self,
+        max_connections: int = 10,
+        per_host_limit: int = 4,
+        timeout: float = 30.0,
+        retries: int = 3,
+        backoff: float = 0.5,
+        headers: dict[str, str] | None = None,
+    ):
+        """Initialize asyncio-based web crawler
+        Args:
+            max_connections: Size of the shared connection pool
+            per_host_limit: Maximum number of concurrent connections to one host
+            timeout: Total timeout for one request in seconds
+            retries: Number of retries after a failed request
+            backoff: Base delay in seconds for exponential backoff between retries
+            headers: Extra HTTP headers sent with every request
+        """
+        self.max_connections = max_connections
+        self.per_host_limit = per_host_limit
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.headers = headers or {}
+
+    async def fetch(
+        self, session: aiohttp.ClientSession, url: str, headers: dict[str, str] | None = None
+    ) -> Page:
+        """Fetch a single page, retrying transient failures with backoff
+        Args:
+            session: Open aiohttp session to use for the request
+            url: URL of the page
+            headers: Extra headers for this request (e.g. conditional request validators)
+        Returns:
+            Fetched page, with empty HTML if the server answered 304 Not Modified
+        Raises:
+            aiohttp.ClientResponseError: If the server answered with an error status, so that
+                error pages are never parsed and indexed
+        """
+        for attempt in range(self.retries + 1):
+            try:
+                async with session.get(url, headers=headers) as response:
+                    if not (200 <= response.status < 300 or response.status == 304):
+                        raise aiohttp.ClientResponseError(
+                            response.request_info,
+                            response.history,
+                            status=response.status,
+                            message=response.reason or "",
+                        )
+                    html = await response.text(errors="replace")
+                    return Page(
+                        url=url,
+                        html=html,
+                        status=response.status,
+                        etag=response.headers.get("ETag"),
+                        last_modified=response.headers.get("Last-Modified"),
+                    )
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                # Not found, forbidden and other client errors will not change on retry
+                retryable = not isinstance(e, aiohttp.ClientResponseError) or e.status in RETRY_STATUSES
+                if attempt == self.retries or not retryable:
+                    raise
+            # Exponential backoff with jitter so retries do not arrive in lockstep
+            await asyncio.sleep(self.backoff * 2**attempt * (1 + random.random()))
+
+    async def crawl(
+        self, urls: list[str], cache: PageCache | None = None, failed: list[str] | None = None
+    ) -> AsyncIterator[Page]:
+        """Fetch pages concurrently and yield them in completion order
+        Args:
+            urls: List of URLs to fetch
+            cache: Optional PageCache to issue conditional requests against
+            failed: Optional list the URLs of pages that could not be fetched are appended to
+        Returns:
+            Async iterator over fetched pages, pages that failed are skipped
+        """
+        connector = aiohttp.TCPConnector(
+            limit=self.max_connections, limit_per_host=self.per_host_limit
+        )
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        async with aiohttp.ClientSession(
+            connector=connector, timeout=timeout, headers=self.headers
+        ) as session:
+            tasks = [
+                asyncio.create_task(
+                    self._try_fetch(session, url, cache.validators(url) if cache else None)
+                )
+                for url in urls
+            ]
+            try:
+                for task in asyncio.as_completed(tasks):
+                    url, page = await task
+                    if page is not None:
+                        yield page
+                    elif failed is not None:
+                        failed.append(url)
+            finally:
+                for task in tasks:
+                    task.cancel()
+
+    async def _try_fetch(
+        self, session: aiohttp.ClientSession, url: str, headers: dict[str, str] | None
+    ) -> tuple[str, Page | None]:
+        """Fetch a page, logging failures instead of raising them"""
+        try:
+            return url, await self.fetch(session, url, headers)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"Error fetching page {url}: {e}")
+            return url, None
@@ -0,0 +1,143 @@
+import hashlib
+import unicodedata
+from collections import defaultdict
+import numpy as np
+from chunk_store import Chunk
+
+# Mersenne prime and hash mask used by the MinHash permutations
+MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+MAX_HASH = np.uint64((1 << 32) - 1)
+
+
+class ChunkDeduplicator:
+    def __init__(
+        self,
+        threshold: float = 0.7,
+        shingle_size: int = 3,
+        num_perm: int = 64,
+        bands: int = 16,
+        boilerplate_min_pages: int = 3,
+        seed: int = 0,
+    ):
+        """Initialize near-duplicate and boilerplate chunk detector based on MinHash
+        Args:
+            threshold: Minimum estimated Jaccard similarity of word shingles to treat chunks as duplicates
+            shingle_size: Number of words in a shingle
+            num_perm: Number of MinHash permutations
+            bands: Number of LSH bands (num_perm must be divisible by bands)
+            boilerplate_min_pages: Chunks repeated on at least this many pages are dropped as site chrome
+            seed: Random seed for MinHash permutations
+        """
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+
+        self.threshold = threshold
+        self.shingle_size = shingle_size
+        self.num_perm = num_perm
+        self.bands = bands
+        self.boilerplate_min_pages = boilerplate_min_pages
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(1, MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        self.b = rng.integers(0, MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        self.stats = {"chunks": 0, "boilerplate": 0, "duplicates": 0, "kept": 0}
+
+    def deduplicate(
+        self, pages: dict[str, list[Chunk | str]]
+    ) -> dict[str, list[Chunk | str]]:
+        """Drop site chrome and keep one copy of near-duplicate chunks
+        Args:
+            pages: Dictionary mapping page URL to the list of its chunks (records or formatted text)
+        Returns:
+            Dictionary with the same pages and only the remaining chunks
+        """
+        # Pages come in crawl completion order, order chunks by (source, position) so that
+        # the kept copy of a cluster (its first member) is the same on every run
+        items = [(url, chunk) for url in sorted(pages) for chunk in pages[url]]
+        signatures = np.array(
+            [self.signature(self._content(chunk)) for _, chunk in items], dtype=np.uint64
+        ).reshape(len(items), self.num_perm)
+        clusters = self._cluster(signatures)
+
+        dropped = set()
+        boilerplate = 0
+        for members in clusters.values():
+            if len(members) == 1:
+                continue
+            if len({items[i][0] for i in members}) >= self.boilerplate_min_pages:
+                # Repeated across many pages: navigation, footer and other site chrome
+                dropped.update(members)
+                boilerplate += len(members)
+            else:
+                # Members are in item order, the first one has the smallest (source, position)
+                dropped.update(members[1:])
+
+        result = {url: [] for url in pages}
+        for i, (url, chunk) in enumerate(items):
+            if i not in dropped:
+                result[url].append(chunk)
+
+        self.stats = {
+            "chunks": len(items),
+            "boilerplate": boilerplate,
+            "duplicates": len(dropped) - boilerplate,
+            "kept": len(items) - len(dropped),
+        }
+        return result
+
+    def signature(self, text: str) -> np.ndarray:
+        """Get MinHash signature of word shingles of the normalized text
+        Args:
+            text: Text to sign
+        Returns:
+            Array of num_perm uint64 minimum hashes
+        """
+        words = unicodedata.normalize("NFC", text).lower().split()
+        size = min(self.shingle_size, len(words)) or 1
+        shingles = {" ".join(words[i : i + size]) for i in range(max(len(words) - size + 1, 1))}
+        hashes = np.array(
+            [
+                int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=4).digest(), "little")
+                for s in shingles
+            ],
+            dtype=np.uint64,
+        )
+        # Universal hashing (a * x + b) mod p for every permutation, uint64 wraparound is intended
+        with np.errstate(over="ignore"):
+            permuted = (np.outer(hashes, self.a) + self.b) % MERSENNE_PRIME & MAX_HASH
+        return permuted.min(axis=0)
+
+    def _cluster(self, signatures: np.ndarray) -> dict[int, list[int]]:
+        """Group chunks into near-duplicate clusters using LSH banding and union-find"""
+        parent = list(range(len(signatures)))
+
+        def find(i: int) -> int:
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        rows = self.num_perm // self.bands
+        for band in range(self.bands):
+            buckets = defaultdict(list)
+            for i, row in enumerate(signatures[:, band * rows : (band + 1) * rows]):
+                buckets[row.tobytes()].append(i)
+            for candidates in buckets.values():
+                first = candidates[0]
+                for other in candidates[1:]:
+                    # Verify LSH candidates with the estimated Jaccard similarity
+                    if find(first) != find(other) and (
+                        np.mean(signatures[first] == signatures[other]) >= self.threshold
+                    ):
+                        parent[find(other)] = find(first)
+
+        clusters = defaultdict(list)
+        for i in range(len(signatures)):
+            clusters[find(i)].append(i)
+        return clusters
+
+    @staticmethod
+    def _content(chunk: Chunk | str) -> str:
+        """Strip the page name / page source header so that only page content is compared"""
+        if isinstance(chunk, Chunk):
+            return chunk.text
+        return chunk.split("Page content:\n", 1)[-1]
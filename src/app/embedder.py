@@ -1,44 +1,285 @@
+import glob
+import os
+import shutil
+import tempfile
+import threading
+import time
+from typing import TYPE_CHECKING, Callable, Iterator
 import numpy as np
 from numpy.typing import NDArray
-from sentence_transformers import SentenceTransformer
-import torch
+from embedding_cache import EmbeddingCache
+
+if TYPE_CHECKING:
+    # torch and sentence_transformers take seconds to import, they are loaded with the model
+    from sentence_transformers import SentenceTransformer
+
+BACKENDS = ("torch", "onnx")
 
 
 class Embedder:
     def __init__(
-        self, model_name: str = "intfloat/multilingual-e5-small", device: str = None
+        self,
+        model_name: str = "intfloat/multilingual-e5-small",
+        device: str = None,
+        batch_size: int = 32,
+        max_batch_tokens: int = 8192,
+        cache: EmbeddingCache | None = None,
+        backend: str = "torch",
+        quantization: str | None = None,
+        intra_op_threads: int | None = None,
+        onnx_dir: str | None = None,
+        dimension: int | None = None,
     ):
-        """Initialize the embedder with a SentenceTransformer model
+        """Initialize the embedder with a SentenceTransformer model.
+        The model is loaded lazily on the first call that needs it.
         Args:
             model_name: Name of the model to use (default: intfloat/multilingual-e5-small)
             device: Device to use for inference (default: auto-detect)
+            batch_size: Maximum number of texts encoded in one batch
+            max_batch_tokens: Maximum number of padded tokens in one batch, bounds peak memory
+            cache: Optional EmbeddingCache to reuse embeddings of previously seen texts
+            backend: Inference backend, "torch" or "onnx" (ONNX Runtime on CPU)
+            quantization: Dynamic int8 quantization config for the onnx backend
+                (e.g. "avx2", "avx512_vnni", "arm64"), None keeps float32 weights
+            intra_op_threads: Number of intra-op threads for the onnx backend (default: all cores)
+            onnx_dir: Directory to save and reuse the exported ONNX model in (default: a directory per
+                model and quantization under ONNX_CACHE_DIR or ~/.cache/course-advisor/onnx)
+            dimension: Dimension of the embeddings if known, read from the model when it is loaded otherwise
         """
-        self.device = (
-            device
-            if device
-            else (
-                "mps"
-                if torch.backends.mps.is_available()
-                else ("cuda" if torch.cuda.is_available() else "cpu")
-            )
-        )
-        self.model = SentenceTransformer(model_name, device=self.device)
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown backend {backend!r}, expected one of {BACKENDS}")
+
+        self.device = "cpu" if backend == "onnx" else device
+        self.model_name = model_name
+        self.backend = backend
+        self.quantization = quantization
+        self.intra_op_threads = intra_op_threads
+        self.onnx_dir = onnx_dir
+        self.cache = cache
+        self.batch_size = batch_size
+        self.max_batch_tokens = max_batch_tokens
+        self.stats = {"texts": 0, "tokens": 0, "seconds": 0.0, "failed": 0}
+        self._dimension = dimension
+        self._model = None
+        self._model_lock = threading.Lock()
+
+    @property
+    def model(self) -> "SentenceTransformer":
+        """SentenceTransformer model, loaded on first access"""
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    self._model = self._load_model()
+        return self._model
+
+    @property
+    def is_loaded(self) -> bool:
+        """Whether the model has been loaded already"""
+        return self._model is not None
 
     def get_embeddings(self, texts: list[str]) -> NDArray[np.float32]:
         """Get embeddings for a list of texts
         Args:
             texts: List of texts to embed
         Returns:
-            NDArray of embeddings as float32
+            NDArray of embeddings as float32, rows of texts that failed to embed are zero
+            (VectorStore.add_chunks skips them, so they are embedded again on the next refresh)
         """
-        try:
-            # SentenceTransformer returns numpy array, just ensure float32 type
-            embeddings = self.model.encode(texts)
-            return embeddings.astype(np.float32)
-        except Exception as e:
-            print(f"Error getting embeddings: {e}")
-            return np.array([], dtype=np.float32)
+        if isinstance(texts, str):
+            try:
+                # SentenceTransformer returns numpy array, just ensure float32 type
+                embeddings = self.model.encode(texts)
+                return embeddings.astype(np.float32)
+            except Exception as e:
+                print(f"Error getting embeddings: {e}")
+                return np.array([], dtype=np.float32)
+        if not texts:
+            # Empty input does not load the model unless its dimension is unknown
+            return np.empty((0, self.get_embedding_dimension()), dtype=np.float32)
+
+        cached = self.cache.get_many(self.model_name, texts) if self.cache else {}
+        if len(cached) == len(texts):
+            return np.stack([cached[i] for i in range(len(texts))])
+
+        embeddings = np.zeros(
+            (len(texts), self.get_embedding_dimension()), dtype=np.float32
+        )
+        for i, embedding in cached.items():
+            embeddings[i] = embedding
+
+        # Embed only texts missing from the cache
+        missing = [i for i in range(len(texts)) if i not in cached]
+        missing_texts = [texts[i] for i in missing]
+        for indices, batch_embeddings in self.embed_batches(missing_texts):
+            embeddings[[missing[i] for i in indices]] = batch_embeddings
+            if self.cache:
+                # Rows of texts that failed to embed are zero and must not be cached
+                ok = [row for row in range(len(indices)) if batch_embeddings[row].any()]
+                self.cache.put_many(
+                    self.model_name,
+                    [missing_texts[indices[row]] for row in ok],
+                    batch_embeddings[ok],
+                )
+        return embeddings
+
+    def embed_batches(
+        self,
+        texts: list[str],
+        batch_size: int | None = None,
+        progress: Callable[[int, int], None] | None = None,
+    ) -> Iterator[tuple[list[int], NDArray[np.float32]]]:
+        """Embed texts in batches of similar token length and yield results as they are ready.
+        Texts are bucketed by token length to minimize padding, every batch is capped by
+        batch_size and max_batch_tokens, and a failing text only loses its own row.
+        Args:
+            texts: List of texts to embed
+            batch_size: Maximum number of texts in one batch (default: self.batch_size)
+            progress: Optional callback called with (embedded, total) after every batch
+        Returns:
+            Iterator over (indices of texts in the batch, their embeddings as float32)
+        """
+        batch_size = batch_size or self.batch_size
+        lengths = self._token_lengths(texts)
+        batch: list[int] = []
+        done = 0
+        # Shortest texts first, so every batch pads to the length of similar texts
+        for idx in np.argsort(lengths, kind="stable").tolist():
+            padded_tokens = (len(batch) + 1) * lengths[idx]
+            if batch and (len(batch) == batch_size or padded_tokens > self.max_batch_tokens):
+                yield self._encode_batch(texts, batch, lengths)
+                done += len(batch)
+                if progress:
+                    progress(done, len(texts))
+                batch = []
+            batch.append(idx)
+
+        if batch:
+            yield self._encode_batch(texts, batch, lengths)
+            if progress:
+                progress(len(texts), len(texts))
+
+    @property
+    def throughput(self) -> dict[str, float]:
+        """Texts and tokens embedded per second since the embedder was created"""
+        seconds = self.stats["seconds"] or float("inf")
+        return {
+            "texts_per_sec": self.stats["texts"] / seconds,
+            "tokens_per_sec": self.stats["tokens"] / seconds,
+        }
 
     def get_embedding_dimension(self) -> int:
         """Get the dimension of the embeddings"""
-        return self.model.get_sentence_embedding_dimension()
+        if self._dimension is None:
+            self._dimension = self.model.get_sentence_embedding_dimension()
+        return self._dimension
+
+    def _load_model(self) -> "SentenceTransformer":
+        """Import the inference stack and load the model on the selected backend"""
+        if self.backend == "onnx":
+            return self._load_onnx_model()
+
+        import torch
+        from sentence_transformers import SentenceTransformer
+
+        self.device = self.device or (
+            "mps"
+            if torch.backends.mps.is_available()
+            else ("cuda" if torch.cuda.is_available() else "cpu")
+        )
+        return SentenceTransformer(self.model_name, device=self.device)
+
+    def _load_onnx_model(self) -> "SentenceTransformer":
+        """Load the model on ONNX Runtime, exporting and quantizing it on first use"""
+        import onnxruntime as ort
+        from sentence_transformers import SentenceTransformer
+        from sentence_transformers.backend import export_dynamic_quantized_onnx_model
+
+        session_options = ort.SessionOptions()
+        if self.intra_op_threads:
+            session_options.intra_op_num_threads = self.intra_op_threads
+        model_kwargs = {
+            "provider": "CPUExecutionProvider",
+            "session_options": session_options,
+        }
+
+        onnx_dir = self.onnx_dir or self.default_onnx_dir()
+        # Quantized graphs are saved as model_qint8_<config>.onnx or model_quint8_<config>.onnx
+        pattern = f"model_q*int8_{self.quantization}.onnx" if self.quantization else "model.onnx"
+        files = glob.glob(os.path.join(onnx_dir, "onnx", pattern))
+        if not files:
+            target = onnx_dir
+            if self.onnx_dir is None:
+                # Export next to the cache directory and rename it into place, so that processes
+                # starting at the same time never load a partially written model
+                parent = os.path.dirname(target)
+                os.makedirs(parent, exist_ok=True)
+                onnx_dir = tempfile.mkdtemp(prefix=".export-", dir=parent)
+            # Export the float32 model once, then quantize the exported graph
+            exported = os.path.exists(os.path.join(onnx_dir, "onnx", "model.onnx"))
+            model = SentenceTransformer(
+                onnx_dir if exported else self.model_name,
+                device="cpu",
+                backend="onnx",
+                model_kwargs=model_kwargs,
+            )
+            model.save(onnx_dir)
+            if self.quantization:
+                export_dynamic_quantized_onnx_model(model, self.quantization, onnx_dir)
+            if onnx_dir != target:
+                try:
+                    os.rename(onnx_dir, target)
+                except OSError:
+                    # Another process exported the same model first
+                    shutil.rmtree(onnx_dir, ignore_errors=True)
+                onnx_dir = target
+            files = glob.glob(os.path.join(onnx_dir, "onnx", pattern))
+
+        model_kwargs["file_name"] = f"onnx/{os.path.basename(files[0])}"
+        return SentenceTransformer(
+            onnx_dir, device="cpu", backend="onnx", model_kwargs=model_kwargs
+        )
+
+    def default_onnx_dir(self) -> str:
+        """Get the cache directory of the exported model, reused by every start with the same
+        model and quantization config
+        """
+        root = os.getenv("ONNX_CACHE_DIR") or os.path.join(
+            os.path.expanduser("~"), ".cache", "course-advisor", "onnx"
+        )
+        name = f"{self.model_name.strip('/').replace('/', '--')}-{self.quantization or 'float32'}"
+        return os.path.join(root, name)
+
+    def _encode_batch(
+        self, texts: list[str], indices: list[int], lengths: list[int]
+    ) -> tuple[list[int], NDArray[np.float32]]:
+        """Encode one batch, falling back to one text at a time if the batch fails"""
+        start = time.perf_counter()
+        batch = [texts[idx] for idx in indices]
+        try:
+            embeddings = self.model.encode(batch, batch_size=len(batch))
+        except Exception:
+            embeddings = np.zeros((len(batch), self.get_embedding_dimension()))
+            for row, text in enumerate(batch):
+                try:
+                    embeddings[row] = self.model.encode([text])[0]
+                except Exception as e:
+                    print(f"Error getting embeddings: {e}")
+                    self.stats["failed"] += 1
+
+        self.stats["texts"] += len(batch)
+        self.stats["tokens"] += sum(lengths[idx] for idx in indices)
+        self.stats["seconds"] += time.perf_counter() - start
+        return indices, embeddings.astype(np.float32)
+
+    def _token_lengths(self, texts: list[str]) -> list[int]:
+        """Count tokens of every text, truncated to the model's maximum sequence length"""
+        max_length = self.model.max_seq_length
+        try:
+            input_ids = self.model.tokenizer(texts, truncation=True, max_length=max_length)["input_ids"]
+            return [len(ids) for ids in input_ids]
+        except Exception:
+            # A malformed text breaks batch tokenization, estimate its length instead
+            return [
+                min(len(text) // 4 + 2, max_length) if isinstance(text, str) else 1
+                for text in texts
+            ]
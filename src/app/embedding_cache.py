@@ -0,0 +1,124 @@
+import hashlib
+import sqlite3
+import threading
+import time
+import unicodedata
+import numpy as np
+from numpy.typing import NDArray
+
+
+class EmbeddingCache:
+    def __init__(self, path: str, max_entries: int = 200_000):
+        """Initialize persistent content-addressed embedding cache backed by SQLite.
+        The database runs in WAL mode, so the Streamlit process and offline build
+        scripts can share one file. Least recently used rows are evicted above max_entries,
+        down to a low-water mark so that eviction runs once per tenth of the capacity.
+        Args:
+            path: Path to the SQLite database file
+            max_entries: Maximum number of cached embeddings
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.low_water = max_entries - max_entries // 10
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                """CREATE TABLE IF NOT EXISTS embeddings (
+                    model TEXT NOT NULL,
+                    key BLOB NOT NULL,
+                    vector BLOB NOT NULL,
+                    last_access REAL NOT NULL,
+                    PRIMARY KEY (model, key)
+                ) WITHOUT ROWID"""
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS embeddings_last_access ON embeddings (last_access)"
+            )
+            # Upper bound of the row count: replaced rows and rows of other processes are
+            # only accounted for by the exact count taken when the bound exceeds max_entries
+            self._count = self._row_count()
+
+    def get_many(self, model_name: str, texts: list[str]) -> dict[int, NDArray[np.float32]]:
+        """Look up cached embeddings
+        Args:
+            model_name: Name of the model the embeddings were produced with
+            texts: List of texts
+        Returns:
+            Dictionary mapping position in texts to the cached embedding, for cache hits only
+        """
+        keys = [self._key(text) if isinstance(text, str) else None for text in texts]
+        found = {}
+        with self._lock, self._connection:
+            # Query in slices to stay below SQLite's limit on bound parameters
+            for start in range(0, len(keys), 500):
+                batch = list(set(keys[start : start + 500]) - {None})
+                placeholders = ",".join("?" * len(batch))
+                rows = self._connection.execute(
+                    f"SELECT key, vector FROM embeddings WHERE model = ? AND key IN ({placeholders})",
+                    [model_name, *batch],
+                ).fetchall()
+                found.update(rows)
+            if found:
+                self._connection.executemany(
+                    "UPDATE embeddings SET last_access = ? WHERE model = ? AND key = ?",
+                    [(time.time(), model_name, key) for key in found],
+                )
+
+        result = {
+            i: np.frombuffer(found[key], dtype=np.float32)
+            for i, key in enumerate(keys)
+            if key in found
+        }
+        self.hits += len(result)
+        self.misses += len(texts) - len(result)
+        return result
+
+    def put_many(
+        self, model_name: str, texts: list[str], embeddings: NDArray[np.float32]
+    ) -> None:
+        """Store embeddings and evict least recently used rows above max_entries
+        Args:
+            model_name: Name of the model the embeddings were produced with
+            texts: List of texts
+            embeddings: Array of their embeddings
+        """
+        now = time.time()
+        rows = [
+            (model_name, self._key(text), embedding.astype(np.float32).tobytes(), now)
+            for text, embedding in zip(texts, embeddings)
+        ]
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?)", rows
+            )
+            self._count += len(rows)
+            if self._count > self.max_entries:
+                self._count = self._row_count()
+            if self._count > self.max_entries:
+                # Oldest rows are read in index order, the table is not sorted
+                self._connection.execute(
+                    """DELETE FROM embeddings WHERE (model, key) IN (
+                        SELECT model, key FROM embeddings ORDER BY last_access LIMIT ?
+                    )""",
+                    (self._count - self.low_water,),
+                )
+                self._count = self.low_water
+
+    def _row_count(self) -> int:
+        """Number of cached embeddings of all models"""
+        return self._connection.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    @property
+    def stats(self) -> dict[str, int]:
+        """Hit and miss counters"""
+        return {"hits": self.hits, "misses": self.misses}
+
+    @staticmethod
+    def _key(text: str) -> bytes:
+        """Hash of the text after Unicode normalization and stripping of surrounding whitespace"""
+        normalized = unicodedata.normalize("NFC", text).strip()
+        return hashlib.sha256(normalized.encode("utf-8")).digest()
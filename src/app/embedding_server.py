@@ -0,0 +1,370 @@
+"""Serve query embeddings to the app and service worker processes of a host.
+
+One process loads the model and answers embedding requests of all workers over a local
+socket, requests that arrive together are embedded in one batch. Workers use RemoteEmbedder
+(set EMBEDDING_SERVER to the address) instead of loading their own copy of the model.
+Clients authenticate with EMBEDDING_SERVER_AUTHKEY, or if it is not set with a random key the
+server writes to a file only its user can read, in $XDG_RUNTIME_DIR or ~/.cache. Run with:
+    PYTHONPATH=src:src/app python -m app.embedding_server --address /tmp/embedder.sock
+"""
+
+import argparse
+import hashlib
+import ipaddress
+import os
+import queue
+import secrets
+import threading
+import time
+from dataclasses import dataclass, field
+from multiprocessing.connection import Client, Connection, Listener
+from dotenv import load_dotenv
+import numpy as np
+from numpy.typing import NDArray
+from embedder import Embedder
+from embedding_cache import EmbeddingCache
+
+
+def parse_address(address: str) -> str | tuple[str, int]:
+    """Parse "host:port" into a TCP address, anything else is a Unix socket path"""
+    host, _, port = address.rpartition(":")
+    if host and port.isdigit():
+        return host, int(port)
+    return address
+
+
+def key_path(address: str | tuple[str, int]) -> str:
+    """Path of the file with the key generated by a server on the address, in a directory of
+    the user ($XDG_RUNTIME_DIR or ~/.cache/course-advisor) that other users cannot write to"""
+    directory = os.getenv("XDG_RUNTIME_DIR") or os.path.join(
+        os.path.expanduser("~"), ".cache", "course-advisor"
+    )
+    if isinstance(address, str):
+        name = hashlib.sha1(os.path.abspath(address).encode("utf-8")).hexdigest()[:16]
+    else:
+        name = str(address[1])
+    return os.path.join(directory, f"embedding-server-{name}.key")
+
+
+def is_loopback(host: str) -> bool:
+    """Whether a TCP host is only reachable from this machine"""
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+@dataclass
+class PendingEmbedding:
+    """Texts of one request waiting for the next batch"""
+
+    texts: list[str]
+    done: threading.Event = field(default_factory=threading.Event)
+    result: NDArray[np.float32] | None = None
+    error: Exception | None = None
+
+
+class EmbeddingServer:
+    def __init__(
+        self,
+        embedder: Embedder,
+        address: str | tuple[str, int],
+        authkey: bytes | None = None,
+        max_batch_size: int = 64,
+        max_wait_ms: float = 2.0,
+    ):
+        """Initialize server embedding texts for other processes with one shared model.
+        Every client connection is served by its own thread, requests are queued and the first
+        one of a batch waits at most max_wait_ms for others before the batch is embedded.
+        Requests are unpickled, so clients always have to authenticate: without an authkey a random
+        one is generated and written to key_path(address) with owner-only permissions. The Unix
+        socket is owner-only as well, and addresses reachable from other hosts require an authkey.
+        Args:
+            embedder: Embedder with the model, loaded once for all clients
+            address: Unix socket path or (host, port) to listen on
+            authkey: Secret clients have to authenticate with, generated if not given
+            max_batch_size: Maximum number of texts embedded in one call
+            max_wait_ms: Maximum time in milliseconds the first request waits for a batch to fill
+        """
+        self.embedder = embedder
+        self.address = address
+        self.authkey = authkey
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.stats = {"requests": 0, "batches": 0, "texts": 0}
+        self._queue: queue.Queue[PendingEmbedding | None] = queue.Queue()
+        self._listener: Listener | None = None
+        self._threads: list[threading.Thread] = []
+        # Key file written for clients when the key was generated
+        self._key_path: str | None = None
+
+    def start(self) -> None:
+        """Listen on the address and serve clients in background threads"""
+        generate_key = self.authkey is None
+        if isinstance(self.address, str):
+            if os.path.exists(self.address):
+                # Socket file left behind by a server that was killed
+                os.remove(self.address)
+        elif generate_key and not is_loopback(self.address[0]):
+            raise ValueError(f"An authkey is required to listen on {self.address[0]}")
+        if generate_key:
+            self.authkey = secrets.token_hex(32).encode()
+
+        # The socket file is created without permissions for other users
+        umask = os.umask(0o177)
+        try:
+            self._listener = Listener(self.address, authkey=self.authkey)
+        finally:
+            os.umask(umask)
+        self.address = self._listener.address
+        if generate_key:
+            self._key_path = key_path(self.address)
+            self._write_key(self._key_path, self.authkey)
+        for target in (self._accept, self._batch):
+            thread = threading.Thread(target=target, name="embedding-server", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def serve_forever(self) -> None:
+        """Start the server unless it was started and block until it is closed"""
+        if self._listener is None:
+            self.start()
+        for thread in self._threads:
+            thread.join()
+
+    def close(self) -> None:
+        """Stop accepting clients and stop the batching thread"""
+        if self._listener is not None:
+            self._listener.close()
+            self._listener = None
+        if self._key_path is not None:
+            try:
+                os.remove(self._key_path)
+            except FileNotFoundError:
+                pass
+            self._key_path = None
+        self._queue.put(None)
+
+    @staticmethod
+    def _write_key(path: str, authkey: bytes) -> None:
+        """Write the key readable by the owner only, replacing the key of a previous server"""
+        os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+        tmp_path = f"{path}.{secrets.token_hex(8)}.tmp"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, "wb") as f:
+            f.write(authkey)
+        os.replace(tmp_path, path)
+
+    def _accept(self) -> None:
+        listener = self._listener
+        while True:
+            try:
+                connection = listener.accept()
+            except OSError:
+                # Listener closed
+                return
+            except Exception as e:
+                print(f"Error accepting embedding client: {e}")
+                continue
+            threading.Thread(target=self._serve, args=(connection,), daemon=True).start()
+
+    def _serve(self, connection: Connection) -> None:
+        """Answer requests of one client until it disconnects"""
+        with connection:
+            while True:
+                try:
+                    op, payload = connection.recv()
+                except (EOFError, OSError):
+                    return
+                try:
+                    if op == "embed":
+                        result = self._embed(payload)
+                    elif op == "info":
+                        result = {
+                            "model_name": self.embedder.model_name,
+                            "dimension": self.embedder.get_embedding_dimension(),
+                        }
+                    else:
+                        raise ValueError(f"Unknown request {op!r}")
+                    connection.send(("ok", result))
+                except (EOFError, OSError):
+                    return
+                except Exception as e:
+                    connection.send(("error", f"{type(e).__name__}: {e}"))
+
+    def _embed(self, texts: list[str]) -> NDArray[np.float32]:
+        """Queue texts for the next batch and wait for their embeddings"""
+        request = PendingEmbedding(texts)
+        self._queue.put(request)
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+    def _batch(self) -> None:
+        """Collect queued requests into batches and embed every batch with one call"""
+        while (first := self._queue.get()) is not None:
+            batch = [first]
+            size = len(first.texts)
+            deadline = time.perf_counter() + self.max_wait_ms / 1000
+            closed = False
+            while size < self.max_batch_size:
+                try:
+                    request = self._queue.get(timeout=max(deadline - time.perf_counter(), 0))
+                except queue.Empty:
+                    break
+                if request is None:
+                    closed = True
+                    break
+                batch.append(request)
+                size += len(request.texts)
+
+            try:
+                embeddings = self.embedder.get_embeddings([text for request in batch for text in request.texts])
+                offset = 0
+                for request in batch:
+                    request.result = embeddings[offset : offset + len(request.texts)]
+                    offset += len(request.texts)
+            except Exception as e:
+                for request in batch:
+                    request.error = e
+            self.stats["requests"] += len(batch)
+            self.stats["batches"] += 1
+            self.stats["texts"] += size
+            for request in batch:
+                request.done.set()
+            if closed:
+                return
+
+
+class RemoteEmbedder:
+    def __init__(self, address: str | tuple[str, int], authkey: bytes | None = None):
+        """Initialize client of an EmbeddingServer with the interface of Embedder.
+        The model is not loaded in this process, every thread keeps its own connection.
+        Args:
+            address: Address of the server, "host:port" or a Unix socket path
+            authkey: Secret the server was started with, by default the key the server generated
+                is read from key_path(address) on every connect, so a restarted server is followed
+        """
+        self.address = parse_address(address) if isinstance(address, str) else address
+        self.authkey = authkey
+        self._local = threading.local()
+        self._info: dict | None = None
+
+    @property
+    def model_name(self) -> str:
+        """Name of the model loaded by the server"""
+        return self._server_info()["model_name"]
+
+    @property
+    def is_loaded(self) -> bool:
+        """The model is loaded by the server"""
+        return True
+
+    def get_embeddings(self, texts: list[str]) -> NDArray[np.float32]:
+        """Get embeddings for a list of texts from the server
+        Args:
+            texts: List of texts to embed
+        Returns:
+            NDArray of embeddings as float32
+        """
+        return self._call("embed", list(texts))
+
+    def get_embedding_dimension(self) -> int:
+        """Get the dimension of the embeddings"""
+        return self._server_info()["dimension"]
+
+    def close(self) -> None:
+        """Close the connection of the calling thread"""
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+    def _server_info(self) -> dict:
+        if self._info is None:
+            self._info = self._call("info", None)
+        return self._info
+
+    def _authkey(self) -> bytes:
+        """Key to authenticate with, the configured one or the one generated by the server"""
+        if self.authkey is not None:
+            return self.authkey
+        path = key_path(self.address)
+        try:
+            with open(path, "rb") as f:
+                # Replies are unpickled, a key planted by another user must not be trusted
+                info = os.fstat(f.fileno())
+                if info.st_uid != os.getuid() or info.st_mode & 0o077:
+                    raise PermissionError(
+                        f"Key file {path} of the embedding server must be owned by this user "
+                        "and not accessible to others"
+                    )
+                return f.read()
+        except FileNotFoundError:
+            raise FileNotFoundError(
+                f"No key file {path} of the embedding server, set EMBEDDING_SERVER_AUTHKEY"
+            ) from None
+
+    def _call(self, op: str, payload):
+        """Send a request, reconnecting once if the server was restarted"""
+        for attempt in range(2):
+            connection = getattr(self._local, "connection", None)
+            try:
+                if connection is None:
+                    connection = self._local.connection = Client(self.address, authkey=self._authkey())
+                connection.send((op, payload))
+                status, result = connection.recv()
+                break
+            except (EOFError, OSError):
+                self.close()
+                if attempt == 1:
+                    raise
+        if status == "error":
+            raise RuntimeError(f"Embedding server error: {result}")
+        return result
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--address", default=os.getenv("EMBEDDING_SERVER"), help="Unix socket path or host:port")
+    parser.add_argument("--model", default="intfloat/multilingual-e5-small")
+    parser.add_argument("--backend", default="torch", choices=["torch", "onnx"])
+    parser.add_argument("--embedding-cache", default=os.getenv("EMBEDDING_CACHE_PATH"))
+    parser.add_argument("--max-batch-size", type=int, default=64)
+    parser.add_argument("--max-wait-ms", type=float, default=2.0)
+    args = parser.parse_args()
+    if not args.address:
+        parser.error("--address or EMBEDDING_SERVER is required")
+
+    embedder = Embedder(
+        model_name=args.model,
+        backend=args.backend,
+        cache=EmbeddingCache(args.embedding_cache) if args.embedding_cache else None,
+    )
+    # Load the model before clients connect, so that the first request is not slow
+    embedder.get_embedding_dimension()
+    authkey = os.getenv("EMBEDDING_SERVER_AUTHKEY")
+    server = EmbeddingServer(
+        embedder,
+        parse_address(args.address),
+        authkey=authkey.encode() if authkey else None,
+        max_batch_size=args.max_batch_size,
+        max_wait_ms=args.max_wait_ms,
+    )
+    try:
+        server.start()
+    except ValueError as e:
+        parser.error(str(e))
+    print(f"Serving embeddings of {args.model} on {args.address}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.close()
+
+
+if __name__ == "__main__":
+    main()
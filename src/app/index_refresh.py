@@ -0,0 +1,97 @@
+import hashlib
+import unicodedata
+from dataclasses import replace
+from chunk_store import Chunk
+from vector_store import VectorStore
+from embedder import Embedder
+
+
+def normalize_text(text: str) -> str:
+    """Normalize chunk text so that formatting-only changes keep the same fingerprint"""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def chunk_fingerprint(source: str, text: str) -> str:
+    """Get a stable fingerprint of a chunk
+    Args:
+        source: URL of the page the chunk comes from
+        text: Chunk text
+    Returns:
+        Hex digest of the source URL plus a hash of the normalized content
+    """
+    content_hash = hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+    return hashlib.sha256(f"{source}\n{content_hash}".encode("utf-8")).hexdigest()
+
+
+def page_fingerprints(source: str, chunks: list[Chunk | str]) -> dict[str, Chunk]:
+    """Fingerprint the embedded text of every chunk of a page, repeated chunks are kept once
+    Args:
+        source: URL of the page
+        chunks: Chunks of the page (records or formatted text)
+    Returns:
+        Dictionary mapping fingerprint to the first chunk with it, chunks without a source get the page URL
+    """
+    fingerprints = {}
+    for position, chunk in enumerate(chunks):
+        if not isinstance(chunk, Chunk):
+            chunk = Chunk.from_text(chunk, position)
+        if chunk.source is None:
+            chunk = replace(chunk, source=source)
+        fingerprints.setdefault(chunk_fingerprint(source, chunk.embedding_text), chunk)
+    return fingerprints
+
+
+def refresh_index(
+    vectorstore: VectorStore, embedder: Embedder, pages: dict[str, list[Chunk | str]]
+) -> dict[str, int]:
+    """Bring the vector store in sync with the current chunks of the given pages.
+    Only new or changed chunks are embedded, chunks that disappeared from a page are removed by ID
+    and vectors of untouched chunks are reused, with their metadata (e.g. position) updated.
+    Chunks of pages missing from pages (e.g. pages that failed to fetch) are left untouched,
+    a page is removed from the store by passing it with an empty list of chunks.
+    Args:
+        vectorstore: VectorStore to refresh in place
+        embedder: Embedder used for new chunks
+        pages: Dictionary mapping page URL to the list of its chunks (records or formatted text)
+    Returns:
+        Dictionary with numbers of added, removed and reused chunks
+    """
+    current = {}
+    for source, chunks in pages.items():
+        for fingerprint, chunk in page_fingerprints(source, chunks).items():
+            current.setdefault(fingerprint, chunk)
+
+    # Chunks added without a fingerprint cannot be matched and are replaced as well,
+    # chunks without a source cannot be attributed to a page and are always replaced
+    kept = {
+        idx
+        for fingerprint, idx in vectorstore.fingerprints.items()
+        if fingerprint in current
+    }
+    stale = [
+        idx
+        for idx, chunk in vectorstore.chunks.items()
+        if idx not in kept and (chunk.source is None or chunk.source in pages)
+    ]
+    new = [fingerprint for fingerprint in current if fingerprint not in vectorstore.fingerprints]
+    moved = {
+        idx: current[fingerprint]
+        for fingerprint, idx in vectorstore.fingerprints.items()
+        if idx in kept and vectorstore.chunks[idx] != current[fingerprint]
+    }
+
+    vectorstore.remove_ids(stale)
+    vectorstore.update_chunks(moved)
+    if new:
+        chunks = [current[fingerprint] for fingerprint in new]
+        embeddings = embedder.get_embeddings([chunk.embedding_text for chunk in chunks])
+        # Chunks that failed to embed are not added and keep no fingerprint
+        added = len(vectorstore.add_chunks(chunks, embeddings, fingerprints=new))
+    else:
+        added = 0
+
+    return {
+        "added": added,
+        "removed": len(stale),
+        "reused": len(current) - len(new),
+    }
@@ -0,0 +1,356 @@
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from collections.abc import Iterator
+from contextlib import contextmanager
+from vector_store import VectorStore
+
+# Base name of the store files inside a version or checkpoint directory
+STORE_NAME = "store"
+
+
+class IndexRepository:
+    def __init__(self, root: str, keep: int = 3):
+        """Initialize directory of immutable, versioned vector stores.
+        Every build is written to versions/<version>.tmp, checksummed into a manifest and renamed
+        to versions/<version>. The CURRENT file names the published version and is replaced
+        atomically, so readers only ever see a complete store and a rollback is a pointer change.
+        Unfinished builds keep a checkpoint under checkpoints/, named by the CHECKPOINT file.
+        Writers of concurrent processes are serialized by an exclusive lock on root/.lock,
+        readers never take it.
+        Args:
+            root: Directory of the repository. A store saved by VectorStore.save() at this base
+                path (root.faiss, root.json, ...) is read until the first version is published
+            keep: Number of published versions kept on disk, older ones are removed on publish
+        """
+        self.root = root
+        self.keep = keep
+        # The lock file is held while the depth is above zero, nested lock() calls of the
+        # owning thread reuse it, other threads of the process wait for the thread lock
+        self._lock_file = None
+        self._lock_depth = 0
+        self._thread_lock = threading.RLock()
+
+    @property
+    def versions_dir(self) -> str:
+        return os.path.join(self.root, "versions")
+
+    @property
+    def checkpoints_dir(self) -> str:
+        return os.path.join(self.root, "checkpoints")
+
+    @contextmanager
+    def lock(self, blocking: bool = True) -> Iterator[bool]:
+        """Hold the exclusive write lock of the repository.
+        Publishing, rollback, pruning and checkpoints take it, and a build holds it from start
+        to publish, so that concurrent builders do not interleave. The lock is re-entrant for
+        the thread holding it, excludes other threads as well as other processes, and is
+        released if the process dies.
+        Args:
+            blocking: Wait for another process to release the lock, otherwise give up at once
+        Returns:
+            Context manager yielding whether the lock is held
+        """
+        acquired = self._acquire_lock(blocking)
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                self._release_lock()
+
+    def versions(self) -> list[str]:
+        """Get published versions, oldest first"""
+        try:
+            names = os.listdir(self.versions_dir)
+        except FileNotFoundError:
+            return []
+        return sorted(name for name in names if not name.endswith(".tmp"))
+
+    def current_version(self) -> str | None:
+        """Get the version CURRENT points to, None if nothing was published"""
+        return self._read_pointer(os.path.join(self.root, "CURRENT"))
+
+    def current_path(self) -> str | None:
+        """Get base path of the store files of the current version
+        Returns:
+            Base path for VectorStore.from_path, the legacy store at the root path
+            if nothing was published, or None if there is no store
+        """
+        return self._version_path(self.current_version())
+
+    def _version_path(self, version: str | None) -> str | None:
+        """Base path of the store files of a version, or of the legacy store if it is None"""
+        if version is not None:
+            return self._store_path(os.path.join(self.versions_dir, version))
+        if os.path.exists(f"{self.root}.faiss") and os.path.exists(f"{self.root}.json"):
+            return self.root
+        return None
+
+    def manifest(self, version: str | None = None) -> dict | None:
+        """Get manifest of a published version
+        Args:
+            version: Published version (default: current)
+        Returns:
+            Manifest dictionary or None if there is no such version
+        """
+        version = version or self.current_version()
+        if version is None:
+            return None
+        try:
+            with open(os.path.join(self.versions_dir, version, "manifest.json"), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def load(self, mmap: bool = False, verify: bool = False) -> VectorStore:
+        """Load the current version
+        Args:
+            mmap: Memory-map the store files
+            verify: Check SHA-256 of every file, by default only file sizes are checked
+        Returns:
+            Loaded VectorStore
+        """
+        # CURRENT is read once, a concurrent publish cannot mix up the verified and loaded version
+        version = self.current_version()
+        path = self._version_path(version)
+        if path is None:
+            raise FileNotFoundError(f"No vector store published in {self.root}")
+        if version is not None:
+            self.verify(version, checksums=verify)
+        return VectorStore.from_path(path, mmap=mmap)
+
+    def verify(self, version: str, checksums: bool = True) -> None:
+        """Check that files of a version match its manifest
+        Args:
+            version: Published version
+            checksums: Compare SHA-256 of the files, not only their sizes
+        """
+        manifest = self.manifest(version)
+        if manifest is None:
+            raise ValueError(f"Version {version} has no manifest")
+        directory = os.path.join(self.versions_dir, version)
+        for name, expected in manifest["files"].items():
+            path = os.path.join(directory, name)
+            if not os.path.exists(path) or os.path.getsize(path) != expected["size"]:
+                raise ValueError(f"File {name} of version {version} is missing or truncated")
+            if checksums and self._sha256(path) != expected["sha256"]:
+                raise ValueError(f"Checksum of {name} of version {version} does not match")
+
+    def publish(self, vectorstore: VectorStore, progress: dict | None = None, **metadata) -> str:
+        """Save the vector store as a new version and point CURRENT to it
+        Args:
+            vectorstore: VectorStore to publish
+            progress: Optional build state recorded in the manifest for the next build
+                (e.g. fingerprints of chunks dropped by deduplication)
+            metadata: Build settings recorded in the manifest (e.g. model name, chunk parameters)
+        Returns:
+            Published version, the current one if the store did not change since it was published
+        """
+        with self.lock():
+            current = self.manifest()
+            if current is not None and current["store_version"] == vectorstore.version:
+                return current["version"]
+
+            # Version names sort in publication order
+            now = time.time_ns()
+            version = f"{time.strftime('%Y%m%d-%H%M%S', time.gmtime(now // 10**9))}-{now % 10**9:09d}"
+            directory = os.path.join(self.versions_dir, version)
+            self._write_store(f"{directory}.tmp", vectorstore, version, metadata, progress)
+            os.replace(f"{directory}.tmp", directory)
+            self._fsync_dir(self.versions_dir)
+            self._write_pointer(os.path.join(self.root, "CURRENT"), version)
+            self.prune()
+            return version
+
+    def rollback(self, version: str | None = None) -> str:
+        """Point CURRENT to an earlier version
+        Args:
+            version: Published version to switch to (default: the one before the current)
+        Returns:
+            Version CURRENT points to now
+        """
+        with self.lock():
+            versions = self.versions()
+            if version is None:
+                current = self.current_version()
+                older = [name for name in versions if current is None or name < current]
+                if not older:
+                    raise ValueError("No earlier version to roll back to")
+                version = older[-1]
+            elif version not in versions:
+                raise ValueError(f"Unknown version {version}")
+            self.verify(version, checksums=False)
+            self._write_pointer(os.path.join(self.root, "CURRENT"), version)
+            return version
+
+    def prune(self) -> None:
+        """Remove old versions beyond keep, the current version is always kept.
+        Readers that memory-mapped a removed version keep their mapping until they close it.
+        """
+        with self.lock():
+            current = self.current_version()
+            for name in self.versions()[: -self.keep or None]:
+                if name != current:
+                    shutil.rmtree(os.path.join(self.versions_dir, name), ignore_errors=True)
+
+    def save_checkpoint(self, vectorstore: VectorStore, progress: dict, **metadata) -> None:
+        """Save an unfinished build so that it can be resumed
+        Args:
+            vectorstore: VectorStore built so far
+            progress: Build progress, e.g. fingerprints of completed pages
+            metadata: Build settings, a checkpoint is only resumed with the same settings
+        """
+        name = uuid.uuid4().hex
+        directory = os.path.join(self.checkpoints_dir, name)
+        with self.lock():
+            self._write_store(f"{directory}.tmp", vectorstore, name, metadata, progress)
+            os.replace(f"{directory}.tmp", directory)
+            previous = self._read_pointer(os.path.join(self.root, "CHECKPOINT"))
+            self._write_pointer(os.path.join(self.root, "CHECKPOINT"), name)
+            if previous is not None:
+                shutil.rmtree(os.path.join(self.checkpoints_dir, previous), ignore_errors=True)
+
+    def load_checkpoint(self, vectorstore: VectorStore, **metadata) -> dict | None:
+        """Load the checkpoint of an unfinished build into the vector store
+        Args:
+            vectorstore: VectorStore to load the checkpoint into, in place
+            metadata: Settings of the build to resume
+        Returns:
+            Progress saved with the checkpoint, None if there is no checkpoint for these settings
+        """
+        name = self._read_pointer(os.path.join(self.root, "CHECKPOINT"))
+        if name is None:
+            return None
+        directory = os.path.join(self.checkpoints_dir, name)
+        try:
+            with open(os.path.join(directory, "manifest.json"), "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Error loading checkpoint {name}: {e}")
+            return None
+        if manifest["metadata"] != metadata:
+            return None
+        vectorstore.load(self._store_path(directory))
+        return manifest["progress"]
+
+    def clear_checkpoint(self) -> None:
+        """Remove the checkpoint after the build was published"""
+        with self.lock():
+            try:
+                os.remove(os.path.join(self.root, "CHECKPOINT"))
+            except FileNotFoundError:
+                pass
+            shutil.rmtree(self.checkpoints_dir, ignore_errors=True)
+
+    def _acquire_lock(self, blocking: bool) -> bool:
+        """Take the thread lock, then the lock file unless the thread already holds it"""
+        if not self._thread_lock.acquire(blocking=blocking):
+            return False
+        if self._lock_depth == 0:
+            os.makedirs(self.root, exist_ok=True)
+            lock_file = open(os.path.join(self.root, ".lock"), "a")
+            try:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+            except BlockingIOError:
+                lock_file.close()
+                self._thread_lock.release()
+                return False
+            self._lock_file = lock_file
+        self._lock_depth += 1
+        return True
+
+    def _release_lock(self) -> None:
+        """Release the lock file when the outermost lock() of the thread exits"""
+        self._lock_depth -= 1
+        if self._lock_depth == 0:
+            # Closing the file releases the flock
+            self._lock_file.close()
+            self._lock_file = None
+        self._thread_lock.release()
+
+    def _write_store(
+        self,
+        directory: str,
+        vectorstore: VectorStore,
+        version: str,
+        metadata: dict,
+        progress: dict | None = None,
+    ) -> None:
+        """Save the store into a new directory and write its manifest last"""
+        shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(directory)
+        vectorstore.save(self._store_path(directory))
+        files = {}
+        for name in sorted(os.listdir(directory)):
+            path = os.path.join(directory, name)
+            with open(path, "rb") as f:
+                os.fsync(f.fileno())
+            files[name] = {"size": os.path.getsize(path), "sha256": self._sha256(path)}
+
+        manifest = {
+            "version": version,
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "store_version": vectorstore.version,
+            "dimension": vectorstore.dimension,
+            "chunks": len(vectorstore.chunks),
+            "metadata": metadata,
+            "files": files,
+        }
+        if progress is not None:
+            manifest["progress"] = progress
+        with open(os.path.join(directory, "manifest.json"), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        self._fsync_dir(directory)
+
+    @staticmethod
+    def _store_path(directory: str) -> str:
+        return os.path.join(directory, STORE_NAME)
+
+    @staticmethod
+    def _read_pointer(path: str) -> str | None:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    @classmethod
+    def _write_pointer(cls, path: str, value: str) -> None:
+        """Replace a pointer file atomically, readers see either the old or the new value"""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(value)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        cls._fsync_dir(os.path.dirname(path) or ".")
+
+    @staticmethod
+    def _fsync_dir(path: str) -> None:
+        """Persist renames in the directory, not supported on every platform"""
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(fd)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+
+    @staticmethod
+    def _sha256(path: str) -> str:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        return digest.hexdigest()
@@ -0,0 +1,108 @@
+import threading
+import time
+from typing import Any, Callable
+import numpy as np
+from index_repository import IndexRepository
+from vector_store import VectorStore
+
+
+class IndexWatcher:
+    def __init__(
+        self,
+        repository: IndexRepository,
+        targets: list[Any],
+        interval: float = 30.0,
+        mmap: bool = True,
+        on_swap: Callable[[VectorStore], None] | None = None,
+    ):
+        """Initialize watcher that swaps newly published index versions into running components.
+        A new version is loaded and warmed up in the background, then assigned to the vectorstore
+        attribute of every target. A query reads the attribute once, so queries in flight finish
+        on the old store, which is freed when the last of them drops it. The embedder and every
+        other component stay loaded.
+        Args:
+            repository: IndexRepository the index is published to
+            targets: Objects with a vectorstore attribute, e.g. CourseAdvisor and MicroBatcher
+            interval: Seconds between checks of the published version
+            mmap: Memory-map the loaded store
+            on_swap: Optional callback with the new store after it was swapped in
+        """
+        self.repository = repository
+        self.targets = targets
+        self.interval = interval
+        self.mmap = mmap
+        self.on_swap = on_swap
+        self.stats = {"checks": 0, "swaps": 0, "errors": 0, "load_s": 0.0}
+        self._failed: str | None = None
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def vectorstore(self) -> VectorStore:
+        """Store the targets currently search"""
+        return self.targets[0].vectorstore
+
+    def start(self) -> None:
+        """Start checking for new versions in a daemon thread"""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="index-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the background thread"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def check(self) -> bool:
+        """Swap in the published version if it differs from the one the targets search
+        Returns:
+            Whether a new store was swapped in
+        """
+        with self._lock:
+            self.stats["checks"] += 1
+            manifest = self.repository.manifest()
+            if manifest is None or manifest["store_version"] == self.vectorstore.version:
+                return False
+            if manifest["version"] == self._failed:
+                return False
+
+            start = time.perf_counter()
+            try:
+                vectorstore = self.repository.load(mmap=self.mmap)
+                self._warm_up(vectorstore)
+            except Exception as e:
+                # The old store keeps serving, a broken version is not retried until the next publish
+                self.stats["errors"] += 1
+                self._failed = manifest["version"]
+                print(f"Error loading index version {manifest['version']}: {e}")
+                return False
+            self.stats["load_s"] = time.perf_counter() - start
+
+            for target in self.targets:
+                target.vectorstore = vectorstore
+            self.stats["swaps"] += 1
+            self._failed = None
+            if self.on_swap is not None:
+                self.on_swap(vectorstore)
+            return True
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:
+                print(f"Error checking index version: {e}")
+
+    @staticmethod
+    def _warm_up(vectorstore: VectorStore) -> None:
+        """Run a search, so that the first query does not pay for page faults and lazy state"""
+        if vectorstore.index.ntotal == 0:
+            return
+        query = np.ones((1, vectorstore.dimension), dtype=np.float32)
+        query /= np.linalg.norm(query)
+        vectorstore.hybrid_search(query, "курс", k=1)
@@ -0,0 +1,177 @@
+import asyncio
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+import numpy as np
+from numpy.typing import NDArray
+from embedder import Embedder
+from vector_store import VectorStore
+
+
+@dataclass
+class PendingQuery:
+    """Query waiting in the micro-batching queue"""
+
+    query: str
+    k: int
+    sources: tuple[str, ...] | None
+    future: asyncio.Future
+    # Embedding computed by an earlier embed call, k of 0 only embeds the query
+    embedding: NDArray[np.float32] | None = None
+
+
+class MicroBatcher:
+    def __init__(
+        self,
+        vectorstore: VectorStore,
+        embedder: Embedder,
+        max_batch_size: int = 32,
+        max_wait_ms: float = 5.0,
+        hybrid: bool = True,
+    ):
+        """Initialize scheduler that embeds and searches concurrent queries together.
+        The first query of a batch waits at most max_wait_ms for others to arrive, then the
+        whole batch is embedded with one model call and searched with one FAISS call per
+        distinct source filter. While a batch is processed, new queries queue up for the next one.
+        Args:
+            vectorstore: VectorStore to search
+            embedder: Embedder for the queries
+            max_batch_size: Maximum number of queries in one batch
+            max_wait_ms: Maximum time in milliseconds the first query waits for a batch to fill
+            hybrid: Fuse dense search with BM25 keyword search (default: True)
+        """
+        self.vectorstore = vectorstore
+        self.embedder = embedder
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.hybrid = hybrid
+        self.stats = {"batches": 0, "queries": 0}
+        self._queue: asyncio.Queue[PendingQuery] | None = None
+        self._task: asyncio.Task | None = None
+        # Batches are processed one at a time, the model and the index are not shared with other threads
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="micro-batcher")
+
+    async def start(self) -> None:
+        """Start the batching loop on the running event loop"""
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the batching loop"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        self._executor.shutdown(wait=False)
+
+    async def search(
+        self,
+        query: str,
+        k: int = 5,
+        sources: list[str] | None = None,
+        embedding: NDArray[np.float32] | None = None,
+    ) -> tuple[NDArray[np.float32], list[dict[str, float]]]:
+        """Embed and search a query as part of the next batch
+        Args:
+            query: Query text
+            k: Number of results to return
+            sources: Optional glob patterns of source URLs to restrict the search to
+            embedding: Optional embedding of the query returned by embed, it is not embedded again
+        Returns:
+            Tuple of the query embedding and the search results
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put(
+            PendingQuery(query, k, tuple(sources) if sources else None, future, embedding)
+        )
+        return await future
+
+    async def embed(self, query: str) -> NDArray[np.float32]:
+        """Embed a query as part of the next batch without searching it
+        Args:
+            query: Query text
+        Returns:
+            Embedding of the query
+        """
+        embedding, _ = await self.search(query, k=0)
+        return embedding
+
+    @property
+    def average_batch_size(self) -> float:
+        """Average number of queries per processed batch"""
+        return self.stats["queries"] / self.stats["batches"] if self.stats["batches"] else 0.0
+
+    async def _run(self) -> None:
+        """Collect queries into batches and process them in the worker thread"""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait_ms / 1000
+            while len(batch) < self.max_batch_size:
+                # Take queries that are already waiting, then wait for more until the deadline
+                if self._queue.empty() and (timeout := deadline - loop.time()) > 0:
+                    try:
+                        batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+                elif not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                else:
+                    break
+
+            # Requests of clients that went away are dropped
+            batch = [request for request in batch if not request.future.done()]
+            if not batch:
+                continue
+            try:
+                results = await loop.run_in_executor(self._executor, self._process, batch)
+            except Exception as e:
+                print(f"Error processing search batch: {e}")
+                for request in batch:
+                    if not request.future.done():
+                        request.future.set_exception(e)
+                continue
+
+            for request, result in zip(batch, results):
+                if not request.future.done():
+                    request.future.set_result(result)
+
+    def _process(
+        self, batch: list[PendingQuery]
+    ) -> list[tuple[NDArray[np.float32], list[dict[str, float]]]]:
+        """Embed all queries with one model call and search them grouped by source filter"""
+        queries = [request.query for request in batch]
+        # The whole batch searches one store, even if a new one is swapped in meanwhile
+        vectorstore = self.vectorstore
+        # Queries embedded by an earlier embed call are not embedded again
+        missing = [request.query for request in batch if request.embedding is None]
+        computed = iter(self.embedder.get_embeddings(missing) if missing else [])
+        embeddings = np.vstack(
+            [
+                request.embedding if request.embedding is not None else next(computed)
+                for request in batch
+            ]
+        ).astype(np.float32, copy=False)
+        self.stats["batches"] += 1
+        self.stats["queries"] += len(batch)
+
+        groups = defaultdict(list)
+        for i, request in enumerate(batch):
+            # Queries that are only embedded are not searched
+            if request.k > 0:
+                groups[request.sources].append(i)
+
+        results: list[list[dict[str, float]]] = [[] for _ in batch]
+        for sources, rows in groups.items():
+            k = max(batch[i].k for i in rows)
+            sources = list(sources) if sources else None
+            if self.hybrid:
+                found = vectorstore.hybrid_search_batch(
+                    embeddings[rows], [queries[i] for i in rows], k, sources=sources
+                )
+            else:
+                found = vectorstore.similarity_search_batch(embeddings[rows], k, sources=sources)
+            for i, row_results in zip(rows, found):
+                results[i] = row_results[: batch[i].k]
+
+        return [(embeddings[i : i + 1], results[i]) for i in range(len(batch))]
@@ -0,0 +1,69 @@
+import numpy as np
+from numpy.typing import NDArray
+
+# Rows scored per matrix multiplication, bounds the score buffer for large stores
+BLOCK_SIZE = 65536
+
+
+class MmapFlatIndex:
+    def __init__(self, path: str, ids: NDArray[np.int64]):
+        """Open exact inner product index over a memory-mapped matrix of vectors.
+        FAISS reads flat indexes into the memory of every process, the .npy file written by
+        VectorStore.save is mapped read-only instead, so all processes serving the same store
+        share one copy of the vectors through the OS page cache.
+        Args:
+            path: Path to the (n, d) float32 .npy file, rows ordered by chunk ID
+            ids: Sorted chunk IDs of the rows
+        """
+        self.vectors = np.load(path, mmap_mode="r")
+        self.ids = ids
+        if len(self.vectors) != len(ids):
+            raise ValueError(f"{path} has {len(self.vectors)} vectors for {len(ids)} chunks")
+        self.d = self.vectors.shape[1]
+        self.is_trained = True
+
+    @property
+    def ntotal(self) -> int:
+        return len(self.ids)
+
+    def search(
+        self, queries: NDArray[np.float32], k: int, allowed: NDArray[np.int64] | None = None
+    ) -> tuple[NDArray[np.float32], NDArray[np.int64]]:
+        """Find the k vectors with the highest inner product, like IndexFlatIP.search
+        Args:
+            queries: (n, d) float32 query matrix
+            k: Number of results per query
+            allowed: Optional IDs to restrict the search to
+        Returns:
+            Tuple of (n, k) arrays of scores and IDs sorted by descending score
+        """
+        rows = None if allowed is None else np.searchsorted(self.ids, np.sort(allowed))
+        total = self.ntotal if rows is None else len(rows)
+        k = min(k, total)
+        best_scores = np.empty((len(queries), 0), dtype=np.float32)
+        best_ids = np.empty((len(queries), 0), dtype=np.int64)
+        for start in range(0, total, BLOCK_SIZE):
+            if rows is None:
+                block, block_ids = self.vectors[start : start + BLOCK_SIZE], self.ids[start : start + BLOCK_SIZE]
+            else:
+                block_rows = rows[start : start + BLOCK_SIZE]
+                block, block_ids = self.vectors[block_rows], self.ids[block_rows]
+            # Keep the k best of the previous blocks and this one
+            scores = np.hstack([best_scores, queries @ block.T])
+            ids = np.hstack([best_ids, np.broadcast_to(block_ids, (len(queries), len(block_ids)))])
+            if scores.shape[1] > k:
+                top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+                scores = np.take_along_axis(scores, top, axis=1)
+                ids = np.take_along_axis(ids, top, axis=1)
+            best_scores, best_ids = scores, ids
+
+        order = np.argsort(-best_scores, axis=1, kind="stable")
+        return np.take_along_axis(best_scores, order, axis=1), np.take_along_axis(best_ids, order, axis=1)
+
+    def reconstruct(self, idx: int) -> NDArray[np.float32]:
+        """Get the stored vector of a chunk ID"""
+        return np.array(self.vectors[int(np.searchsorted(self.ids, idx))])
+
+    def reconstruct_batch(self, ids: NDArray[np.int64]) -> NDArray[np.float32]:
+        """Get the stored vectors of chunk IDs, reading only their rows"""
+        return np.asarray(self.vectors[np.searchsorted(self.ids, ids)], dtype=np.float32)
@@ -0,0 +1,157 @@
+import hashlib
+import json
+import os
+
+
+class PageCache:
+    def __init__(self, directory: str, max_entries: int = 200):
+        """Initialize persistent on-disk cache of fetched pages
+        Every entry stores the raw HTML, HTTP validators (ETag / Last-Modified),
+        a content hash and the chunks produced from the page last time.
+        Least recently used entries are evicted above max_entries.
+        Args:
+            directory: Directory to keep cache files in
+            max_entries: Maximum number of cached pages
+        """
+        self.directory = directory
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def get(self, url: str) -> dict | None:
+        """Get cache entry metadata for the URL
+        Args:
+            url: URL of the page
+        Returns:
+            Entry dictionary or None if the page is not cached
+        """
+        try:
+            with open(self._path(url, "json"), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def get_html(self, url: str) -> str | None:
+        """Get cached raw HTML for the URL"""
+        try:
+            with open(self._path(url, "html"), "r", encoding="utf-8") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def validators(self, url: str) -> dict[str, str]:
+        """Get conditional request headers for the URL
+        Args:
+            url: URL of the page
+        Returns:
+            Dictionary with If-None-Match / If-Modified-Since headers (empty if not cached)
+        """
+        entry = self.get(url)
+        if entry is None:
+            return {}
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def lookup_chunks(
+        self, url: str, html: str | None, chunk_params: str
+    ) -> list[str | dict] | None:
+        """Get cached chunks if the page has not changed since it was cached
+        Args:
+            url: URL of the page
+            html: Freshly fetched HTML, or None if the server answered 304 Not Modified
+            chunk_params: Identifier of the splitter settings the chunks were produced with
+        Returns:
+            Cached chunks, or None on cache miss
+        """
+        entry = self.get(url)
+        unchanged = entry is not None and (
+            html is None or entry["content_hash"] == self._hash(html)
+        )
+        if unchanged and entry.get("chunk_params") == chunk_params:
+            self.hits += 1
+            # Mark the entry as recently used without rewriting it
+            os.utime(self._path(url, "json"))
+            return entry["chunks"]
+
+        self.misses += 1
+        return None
+
+    def put(
+        self,
+        url: str,
+        html: str,
+        chunks: list[str | dict],
+        chunk_params: str,
+        etag: str | None = None,
+        last_modified: str | None = None,
+    ) -> None:
+        """Store page HTML, validators and produced chunks
+        Args:
+            url: URL of the page
+            html: Raw HTML of the page
+            chunks: Chunks produced from the page, as strings or JSON-serializable records
+            chunk_params: Identifier of the splitter settings the chunks were produced with
+            etag: ETag response header
+            last_modified: Last-Modified response header
+        """
+        self._atomic_write(self._path(url, "html"), html)
+        entry = {
+            "url": url,
+            "etag": etag,
+            "last_modified": last_modified,
+            "content_hash": self._hash(html),
+            "chunk_params": chunk_params,
+            "chunks": chunks,
+        }
+        self._write_entry(url, entry)
+        self.evict()
+
+    def evict(self) -> int:
+        """Remove least recently used entries above max_entries
+        Returns:
+            Number of evicted entries
+        """
+        entries = [
+            os.path.join(self.directory, name)
+            for name in os.listdir(self.directory)
+            if name.endswith(".json")
+        ]
+        excess = len(entries) - self.max_entries
+        if excess <= 0:
+            return 0
+
+        entries.sort(key=os.path.getmtime)
+        for path in entries[:excess]:
+            for file in (path, path[: -len("json")] + "html"):
+                if os.path.exists(file):
+                    os.remove(file)
+        return excess
+
+    @property
+    def stats(self) -> dict[str, int]:
+        """Hit and miss counters"""
+        return {"hits": self.hits, "misses": self.misses}
+
+    def _write_entry(self, url: str, entry: dict) -> None:
+        """Write entry metadata, which also marks it as recently used (by mtime)"""
+        self._atomic_write(self._path(url, "json"), json.dumps(entry, ensure_ascii=False))
+
+    def _path(self, url: str, extension: str) -> str:
+        key = hashlib.sha1(url.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, f"{key}.{extension}")
+
+    @staticmethod
+    def _hash(html: str) -> str:
+        return hashlib.sha256(html.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _atomic_write(path: str, content: str) -> None:
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
@@ -0,0 +1,141 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from sentence_transformers import CrossEncoder
+
+
+class Reranker:
+    def __init__(
+        self,
+        model_name: str = "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1",
+        candidates: int = 20,
+        budget_ms: float = 200.0,
+        batch_size: int = 32,
+        max_length: int = 256,
+        cache_size: int = 10_000,
+        device: str = "cpu",
+    ):
+        """Initialize cross-encoder re-ranker of search results.
+        All uncached (query, chunk) pairs are scored in one batched pass. Time per pair is
+        tracked, and if scoring all pairs of a query is expected to exceed budget_ms, only the
+        leading results that fit the budget are re-ranked, or none if fewer than two fit.
+        The model is loaded and warmed up on first use, outside of the timed pass.
+        Args:
+            model_name: Name of the multilingual cross-encoder model
+            candidates: Number of search results to fetch for re-ranking
+            budget_ms: Maximum expected time of scoring one query in milliseconds
+            batch_size: Maximum number of pairs in one forward pass
+            max_length: Maximum number of tokens of a (query, chunk) pair
+            cache_size: Number of (query, chunk) scores kept in memory
+            device: Device to use for inference
+        """
+        self.model_name = model_name
+        self.candidates = candidates
+        self.budget_ms = budget_ms
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self.cache_size = cache_size
+        self.device = device
+        self.stats = {"reranked": 0, "truncated": 0, "skipped": 0, "pairs": 0, "cache_hits": 0}
+        # Moving average of the scoring time of one pair, None until the first pass
+        self.pair_ms: float | None = None
+        self._scores: OrderedDict[tuple[str, str], float] = OrderedDict()
+        self._model = None
+        self._warm = False
+        self._lock = threading.Lock()
+
+    @property
+    def model(self) -> "CrossEncoder":
+        """CrossEncoder model, loaded on first access"""
+        if self._model is None:
+            with self._lock:
+                self._load_model()
+        return self._model
+
+    def warm_up(self) -> "CrossEncoder":
+        """Load the model and score one pair, so that timed passes exclude one-off startup costs
+        Returns:
+            Loaded CrossEncoder model
+        """
+        if not self._warm:
+            # Requests arriving meanwhile wait for the lock instead of loading the model again
+            with self._lock:
+                if not self._warm:
+                    self._load_model()
+                    self._model.predict([("warm up", "warm up")], show_progress_bar=False)
+                    self._warm = True
+        return self._model
+
+    def _load_model(self) -> None:
+        """Load the model if it is not loaded yet, the caller holds the lock"""
+        if self._model is None:
+            from sentence_transformers import CrossEncoder
+
+            self._model = CrossEncoder(
+                self.model_name, max_length=self.max_length, device=self.device
+            )
+
+    def rerank(self, query: str, results: list[dict], k: int) -> list[dict]:
+        """Order search results by cross-encoder relevance to the query
+        Args:
+            query: Query text
+            results: Search results with "text" (or "chunk") of every chunk
+            k: Number of results to return
+        Returns:
+            Top k results, the re-ranked ones with "rerank_score"
+        """
+        texts = [result.get("text", result["chunk"]) for result in results]
+        with self._lock:
+            scores = [self._scores.get((query, text)) for text in texts]
+            for text, score in zip(texts, scores):
+                if score is not None:
+                    self._scores.move_to_end((query, text))
+        missing = [i for i, score in enumerate(scores) if score is None]
+        self.stats["cache_hits"] += len(results) - len(missing)
+
+        if missing and self.pair_ms is not None and self.pair_ms * len(missing) > self.budget_ms:
+            # Re-rank only the leading results whose scoring fits the budget, the rest keep their order
+            affordable = int(self.budget_ms / self.pair_ms)
+            if affordable < 2:
+                self.stats["skipped"] += 1
+                # Skipped queries are not timed, decay the estimate so that a slow spell
+                # (e.g. a busy CPU) is re-measured instead of disabling re-ranking for good
+                self.pair_ms *= 0.8
+                return results[:k]
+            self.stats["truncated"] += 1
+            end = missing[affordable]
+            reranked = self.rerank(query, results[:end], end)
+            return (reranked + results[end:])[:k]
+
+        if missing:
+            try:
+                model = self.warm_up()
+                start = time.perf_counter()
+                predicted = model.predict(
+                    [(query, texts[i]) for i in missing],
+                    batch_size=self.batch_size,
+                    show_progress_bar=False,
+                )
+            except Exception as e:
+                print(f"Error re-ranking results: {e}")
+                self.stats["skipped"] += 1
+                return results[:k]
+
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            pair_ms = elapsed_ms / len(missing)
+            # Moving average smooths out noise of single passes
+            self.pair_ms = pair_ms if self.pair_ms is None else 0.8 * self.pair_ms + 0.2 * pair_ms
+            self.stats["pairs"] += len(missing)
+            with self._lock:
+                for i, score in zip(missing, predicted.tolist()):
+                    scores[i] = score
+                    self._scores[(query, texts[i])] = score
+                while len(self._scores) > self.cache_size:
+                    self._scores.popitem(last=False)
+
+        self.stats["reranked"] += 1
+        order = sorted(range(len(results)), key=lambda i: scores[i], reverse=True)
+        return [{**results[i], "rerank_score": scores[i]} for i in order[:k]]
@@ -0,0 +1,170 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+import faiss
+import numpy as np
+from numpy.typing import NDArray
+
+
+@dataclass
+class CachedAnswer:
+    """Answer to a previously asked question"""
+
+    question: str
+    answer: str
+    created: float
+    scope: str | None = None
+
+
+def cache_scope(sources: str | list[str] | None = None, **kwargs) -> str | None:
+    """Get the cache scope of everything besides the question that changes the answer
+    Args:
+        sources: Glob pattern(s) of page URLs the answer was restricted to
+        kwargs: Completion parameters the answer was generated with
+    Returns:
+        Canonical key, None for an unfiltered question with default parameters
+    """
+    if sources is None and not kwargs:
+        return None
+    if isinstance(sources, str):
+        sources = [sources]
+    return json.dumps(
+        {"sources": sorted(sources) if sources is not None else None, "kwargs": kwargs},
+        sort_keys=True,
+        default=str,
+    )
+
+
+class SemanticCache:
+    def __init__(self, threshold: float = 0.95, ttl: float = 24 * 3600, max_entries: int = 1000):
+        """Initialize in-memory cache of answers looked up by question similarity.
+        Questions are kept in small exact FAISS indexes, so a paraphrase of an answered question
+        hits the cache. Answers are only reused within the same scope (source filter and completion
+        parameters, see cache_scope). Entries expire after ttl seconds, least recently used ones are
+        evicted above max_entries, and all entries are dropped when the course index version changes.
+        Args:
+            threshold: Minimum cosine similarity of questions to reuse an answer
+            ttl: Time to live of an answer in seconds
+            max_entries: Maximum number of cached answers
+        """
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # Scope -> index of the questions answered in it
+        self.indexes: dict[str | None, faiss.IndexIDMap2] = {}
+        # Vector ID -> answer, ordered from least to most recently used
+        self.entries: OrderedDict[int, CachedAnswer] = OrderedDict()
+        self.index_version: str | None = None
+        self.stats = {"hits": 0, "misses": 0, "expired": 0, "evicted": 0, "invalidations": 0}
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def get(
+        self,
+        question_embedding: NDArray[np.float32],
+        index_version: str | None = None,
+        scope: str | None = None,
+    ) -> str | None:
+        """Look up an answer to a similar question
+        Args:
+            question_embedding: Embedding of the question
+            index_version: Version of the course index the answer must have been produced with
+            scope: Scope the answer must have been produced in (see cache_scope)
+        Returns:
+            Cached answer, or None on cache miss
+        """
+        with self._lock:
+            self._check_version(index_version)
+            index = self.indexes.get(scope)
+            if index is None or index.ntotal == 0:
+                self.stats["misses"] += 1
+                return None
+
+            scores, ids = index.search(self._normalize(question_embedding), 1)
+            idx = int(ids[0][0])
+            if idx < 0 or scores[0][0] < self.threshold:
+                self.stats["misses"] += 1
+                return None
+
+            entry = self.entries[idx]
+            if time.time() - entry.created > self.ttl:
+                self._remove([idx])
+                self.stats["expired"] += 1
+                self.stats["misses"] += 1
+                return None
+
+            self.entries.move_to_end(idx)
+            self.stats["hits"] += 1
+            return entry.answer
+
+    def put(
+        self,
+        question: str,
+        question_embedding: NDArray[np.float32],
+        answer: str,
+        index_version: str | None = None,
+        scope: str | None = None,
+    ) -> None:
+        """Store an answer and evict least recently used answers above max_entries
+        Args:
+            question: Question text
+            question_embedding: Embedding of the question
+            answer: Generated answer
+            index_version: Version of the course index the answer was produced with
+            scope: Scope the answer was produced in (see cache_scope)
+        """
+        embedding = self._normalize(question_embedding)
+        with self._lock:
+            self._check_version(index_version)
+            if scope not in self.indexes:
+                self.indexes[scope] = faiss.IndexIDMap2(faiss.IndexFlatIP(embedding.shape[1]))
+
+            self.indexes[scope].add_with_ids(embedding, np.array([self._next_id], dtype=np.int64))
+            self.entries[self._next_id] = CachedAnswer(question, answer, time.time(), scope)
+            self._next_id += 1
+
+            overflow = len(self.entries) - self.max_entries
+            if overflow > 0:
+                self._remove(list(self.entries)[:overflow])
+                self.stats["evicted"] += overflow
+
+    def invalidate(self) -> None:
+        """Drop all cached answers"""
+        with self._lock:
+            self._clear()
+
+    @property
+    def hit_rate(self) -> float:
+        """Share of lookups answered from the cache"""
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return self.stats["hits"] / lookups if lookups else 0.0
+
+    def _check_version(self, index_version: str | None) -> None:
+        """Drop all answers if they were produced with a different course index"""
+        if index_version != self.index_version:
+            if self.entries:
+                self.stats["invalidations"] += 1
+            self._clear()
+            self.index_version = index_version
+
+    def _clear(self) -> None:
+        """Drop all entries, the caller holds the lock"""
+        self.indexes.clear()
+        self.entries.clear()
+
+    def _remove(self, ids: list[int]) -> None:
+        """Remove entries by vector ID, the caller holds the lock"""
+        for idx in ids:
+            scope = self.entries.pop(idx).scope
+            self.indexes[scope].remove_ids(np.array([idx], dtype=np.int64))
+            if self.indexes[scope].ntotal == 0:
+                del self.indexes[scope]
+
+    @staticmethod
+    def _normalize(embedding: NDArray[np.float32]) -> NDArray[np.float32]:
+        """Get an L2-normalized float32 copy of the embedding as a (1, d) matrix"""
+        embedding = np.array(embedding, dtype=np.float32).reshape(1, -1)
+        faiss.normalize_L2(embedding)
+        return embedding
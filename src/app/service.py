@@ -0,0 +1,196 @@
+import os
+from contextlib import asynccontextmanager
+from dotenv import load_dotenv
+from fastapi import FastAPI
+from pydantic import BaseModel, Field
+from adaptive_retrieval import AdaptiveK
+from async_course_advisor import AsyncCourseAdvisor
+from config import OFF_TOPIC_ANSWER
+from embedder import Embedder
+from embedding_server import RemoteEmbedder
+from index_repository import IndexRepository
+from index_watcher import IndexWatcher
+from micro_batcher import MicroBatcher
+from reranker import Reranker
+from semantic_cache import SemanticCache, cache_scope
+from vector_store import VectorStore
+
+load_dotenv()
+
+
+class SearchRequest(BaseModel):
+    query: str
+    k: int = Field(5, ge=1, le=100)
+    # Glob patterns of page URLs to search in, e.g. "*/simulator*"
+    sources: list[str] | None = None
+
+
+class AnswerRequest(BaseModel):
+    question: str
+    sources: list[str] | None = None
+
+
+def create_app(
+    vectorstore: VectorStore | None = None,
+    embedder: Embedder | None = None,
+    advisor: AsyncCourseAdvisor | None = None,
+    max_batch_size: int | None = None,
+    max_wait_ms: float | None = None,
+    watcher_interval: float | None = None,
+) -> FastAPI:
+    """Create HTTP service answering /search and /answer over the course index.
+    Concurrent requests are embedded and searched together by a MicroBatcher, the LLM calls
+    of /answer go through the connection pool and concurrency limit of AsyncCourseAdvisor.
+    Components that are not passed are created from the same environment variables as the
+    Streamlit app. Run with: uvicorn service:create_app --factory
+    Args:
+        vectorstore: VectorStore to search, the current version of the VECTOR_STORE_PATH repository by default
+        embedder: Embedder for the queries, a RemoteEmbedder of EMBEDDING_SERVER if it is set
+        advisor: AsyncCourseAdvisor generating the answers
+        max_batch_size: Maximum number of queries in one batch (env MAX_BATCH_SIZE, default: 32)
+        max_wait_ms: Maximum time the first query of a batch waits for others (env MAX_BATCH_WAIT_MS, default: 5)
+        watcher_interval: Seconds between checks for a newly published index version when the store
+            is loaded from the repository (env INDEX_POLL_INTERVAL, default: 30, 0 disables hot reload)
+    Returns:
+        FastAPI application
+    """
+    repository = None
+    if vectorstore is None:
+        repository = IndexRepository(os.getenv("VECTOR_STORE_PATH"))
+        vectorstore = repository.load(mmap=True)
+    if embedder is None:
+        # Workers share the model of an embedding server if one is configured
+        address = os.getenv("EMBEDDING_SERVER")
+        authkey = os.getenv("EMBEDDING_SERVER_AUTHKEY")
+        embedder = (
+            RemoteEmbedder(address, authkey=authkey.encode() if authkey else None)
+            if address
+            else Embedder()
+        )
+    if advisor is None:
+        # The answer cache is off unless a threshold is configured: with a small embedding model,
+        # questions that differ only in the course name can be more similar than 0.95
+        threshold = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0"))
+        # Adaptive retrieval is opt-in as well, its thresholds depend on the embedding model
+        relevance_floor = float(os.getenv("RELEVANCE_FLOOR", "0"))
+        reranker_model = os.getenv("RERANKER_MODEL")
+        advisor = AsyncCourseAdvisor(
+            vectorstore=vectorstore,
+            embedder=embedder,
+            cache=(
+                SemanticCache(threshold=threshold, ttl=float(os.getenv("SEMANTIC_CACHE_TTL", str(24 * 3600))))
+                if threshold > 0
+                else None
+            ),
+            adaptive_k=(
+                AdaptiveK(
+                    max_k=int(os.getenv("MAX_CONTEXT_CHUNKS", "10")),
+                    min_score=float(os.getenv("MIN_CHUNK_SCORE", "0.82")),
+                    relevance_floor=relevance_floor,
+                )
+                if relevance_floor > 0
+                else None
+            ),
+            reranker=(
+                Reranker(reranker_model, budget_ms=float(os.getenv("RERANK_BUDGET_MS", "200")))
+                if reranker_model
+                else None
+            ),
+            max_concurrent_requests=int(os.getenv("MAX_CONCURRENT_LLM_REQUESTS", "16")),
+            timeout=float(os.getenv("LLM_TIMEOUT", "60")),
+        )
+    batcher = MicroBatcher(
+        vectorstore,
+        embedder,
+        max_batch_size=max_batch_size or int(os.getenv("MAX_BATCH_SIZE", "32")),
+        max_wait_ms=max_wait_ms if max_wait_ms is not None else float(os.getenv("MAX_BATCH_WAIT_MS", "5")),
+        hybrid=advisor.hybrid,
+    )
+
+    if watcher_interval is None:
+        watcher_interval = float(os.getenv("INDEX_POLL_INTERVAL", "30"))
+    # New index versions are swapped into the advisor and the batcher without a restart
+    watcher = (
+        IndexWatcher(repository, [advisor, batcher], interval=watcher_interval)
+        if repository is not None and watcher_interval > 0
+        else None
+    )
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        await batcher.start()
+        if watcher is not None:
+            watcher.start()
+        yield
+        if watcher is not None:
+            watcher.stop()
+        await batcher.stop()
+        advisor.close()
+
+    app = FastAPI(title="Karpov.Courses navigator", lifespan=lifespan)
+    app.state.batcher = batcher
+    app.state.advisor = advisor
+    app.state.watcher = watcher
+
+    @app.get("/health")
+    async def health() -> dict:
+        return {
+            "status": "ok",
+            "index_version": batcher.vectorstore.version,
+            "chunks": len(batcher.vectorstore.chunks),
+            "batches": batcher.stats["batches"],
+            "average_batch_size": batcher.average_batch_size,
+        }
+
+    @app.post("/search")
+    async def search(request: SearchRequest) -> dict:
+        _, results = await batcher.search(request.query, k=request.k, sources=request.sources)
+        return {"results": results}
+
+    @app.post("/answer")
+    async def answer(request: AnswerRequest) -> dict:
+        index_version = batcher.vectorstore.version
+        # Answers restricted to some pages are only reused for the same restriction
+        scope = cache_scope(request.sources)
+        if advisor.cache is not None:
+            # Cached answers are returned before the search and re-ranking, which are only
+            # run on a miss. Their sources are not known without the search
+            question_embedding = await batcher.embed(request.question)
+            cached = advisor.cache.get(question_embedding, index_version, scope)
+            if cached is not None:
+                return {"answer": cached, "cached": True, "sources": []}
+            _, results = await batcher.search(
+                request.question,
+                k=advisor.search_k,
+                sources=request.sources,
+                embedding=question_embedding,
+            )
+        else:
+            question_embedding, results = await batcher.search(
+                request.question, k=advisor.search_k, sources=request.sources
+            )
+        results = await advisor.aselect_results(request.question, results)
+        if not results:
+            # Off-topic questions are refused without calling the LLM
+            advisor.context_stats["off_topic"] += 1
+            return {"answer": OFF_TOPIC_ANSWER, "cached": False, "sources": []}
+
+        context = advisor.build_context(results)
+        text = await advisor.agenerate_completion(request.question, context.text)
+        # Failed completions and answers from a replaced index are not cached
+        if advisor.cache is not None and text and index_version == batcher.vectorstore.version:
+            advisor.cache.put(request.question, question_embedding, text, index_version, scope)
+        return {
+            "answer": text,
+            "cached": False,
+            "sources": _sources(results),
+            "context_tokens": context.tokens,
+            "saved_tokens": context.saved_tokens,
+        }
+
+    return app
+
+
+def _sources(results: list[dict]) -> list[str]:
+    """Get distinct source URLs of search results in rank order"""
+    return list(dict.fromkeys(result["source"] for result in results if result.get("source")))
@@ -0,0 +1,181 @@
+import math
+import re
+import unicodedata
+from collections import Counter
+from functools import lru_cache
+from typing import Mapping
+import numpy as np
+import snowballstemmer
+from numpy.typing import NDArray
+
+# Words with inner "/", "-" or "." and trailing "+" / "#" stay whole: "a/b", "analytics-hard", "c++"
+TOKEN_PATTERN = re.compile(r"\w+(?:[/.-]\w+)*[+#]*")
+CYRILLIC = re.compile(r"[а-я]")
+RUSSIAN_STEMMER = snowballstemmer.stemmer("russian")
+ENGLISH_STEMMER = snowballstemmer.stemmer("english")
+
+
+@lru_cache(maxsize=100_000)
+def stem(word: str) -> str:
+    """Stem a lowercase word with the Russian or English Snowball stemmer"""
+    if CYRILLIC.search(word):
+        return RUSSIAN_STEMMER.stemWord(word)
+    return ENGLISH_STEMMER.stemWord(word)
+
+
+def tokenize(text: str) -> list[str]:
+    """Split text into lowercase stemmed terms, hyphenated words also yield their parts
+    Args:
+        text: Text to tokenize
+    Returns:
+        List of terms in text order
+    """
+    text = unicodedata.normalize("NFC", text).lower().replace("ё", "е")
+    terms = []
+    for token in TOKEN_PATTERN.findall(text):
+        terms.append(stem(token))
+        if "-" in token:
+            terms.extend(stem(part) for part in token.split("-") if part)
+    return terms
+
+
+def reciprocal_rank_fusion(rankings: list[list[int]], k: int = 60) -> list[tuple[int, float]]:
+    """Fuse ranked lists of IDs with reciprocal rank fusion
+    Args:
+        rankings: Lists of IDs, each sorted from best to worst
+        k: Smoothing constant, higher values flatten the difference between top ranks
+    Returns:
+        List of (ID, fused score) sorted by descending score
+    """
+    scores: dict[int, float] = {}
+    for ranking in rankings:
+        for rank, idx in enumerate(ranking):
+            scores[idx] = scores.get(idx, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+class SparseIndex:
+    def __init__(
+        self,
+        ids: NDArray[np.int64],
+        terms: list[str],
+        term_offsets: NDArray[np.int64],
+        rows: NDArray[np.int32],
+        weights: NDArray[np.float32],
+    ):
+        """Initialize BM25 inverted index from its arrays, use SparseIndex.build to create one.
+        Postings of term i are rows[term_offsets[i]:term_offsets[i + 1]] with their BM25 weights
+        precomputed, so a query only sums weights of its terms.
+        Args:
+            ids: Chunk ID of every document row
+            terms: Vocabulary, position in the list is the term ID
+            term_offsets: Start of the postings of every term, plus the total number of postings
+            rows: Document rows of all postings
+            weights: BM25 weights of all postings
+        """
+        self.ids = ids
+        self.vocabulary = {term: term_id for term_id, term in enumerate(terms)}
+        self.term_offsets = term_offsets
+        self.rows = rows
+        self.weights = weights
+
+    @classmethod
+    def build(cls, texts: Mapping[int, str], k1: float = 1.5, b: float = 0.75) -> "SparseIndex":
+        """Build BM25 index over texts
+        Args:
+            texts: Mapping of chunk ID to the text to index
+            k1: BM25 term frequency saturation
+            b: BM25 document length normalization
+        Returns:
+            Built SparseIndex
+        """
+        ids = np.array(list(texts), dtype=np.int64)
+        postings: dict[str, list[tuple[int, int]]] = {}
+        lengths = np.zeros(len(ids), dtype=np.float32)
+        for row, text in enumerate(texts.values()):
+            terms = tokenize(text)
+            lengths[row] = len(terms)
+            for term, count in Counter(terms).items():
+                postings.setdefault(term, []).append((row, count))
+
+        average_length = float(lengths.mean()) if len(ids) else 0.0
+        terms = sorted(postings)
+        term_offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        rows, weights = [], []
+        for term_id, term in enumerate(terms):
+            term_rows, counts = (np.array(column) for column in zip(*postings[term]))
+            idf = math.log(1 + (len(ids) - len(term_rows) + 0.5) / (len(term_rows) + 0.5))
+            norm = k1 * (1 - b + b * lengths[term_rows] / max(average_length, 1.0))
+            rows.append(term_rows)
+            weights.append(idf * counts * (k1 + 1) / (counts + norm))
+            term_offsets[term_id + 1] = term_offsets[term_id] + len(term_rows)
+
+        return cls(
+            ids,
+            terms,
+            term_offsets,
+            np.concatenate(rows).astype(np.int32) if rows else np.empty(0, dtype=np.int32),
+            np.concatenate(weights).astype(np.float32) if weights else np.empty(0, dtype=np.float32),
+        )
+
+    def search(
+        self, query: str, k: int = 5, allowed: NDArray[np.int64] | None = None
+    ) -> tuple[NDArray[np.float32], NDArray[np.int64]]:
+        """Find chunks with the highest BM25 score for the query
+        Args:
+            query: Query text
+            k: Maximum number of results
+            allowed: Optional IDs to restrict the search to
+        Returns:
+            Tuple of scores and IDs sorted by descending score, chunks without query terms are skipped
+        """
+        scores = np.zeros(len(self.ids), dtype=np.float32)
+        for term in set(tokenize(query)):
+            term_id = self.vocabulary.get(term)
+            if term_id is None:
+                continue
+            start, end = self.term_offsets[term_id], self.term_offsets[term_id + 1]
+            # Every document appears once in the postings of a term
+            scores[self.rows[start:end]] += self.weights[start:end]
+
+        if allowed is not None:
+            scores[~np.isin(self.ids, allowed)] = 0
+        candidates = np.flatnonzero(scores)
+        if k <= 0:
+            candidates = candidates[:0]
+        elif len(candidates) > k:
+            candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return scores[candidates], self.ids[candidates]
+
+    def save(self, path: str) -> None:
+        """Save the index arrays to an uncompressed .npz file
+        Args:
+            path: Path to the file
+        """
+        with open(path, "wb") as f:
+            np.savez(
+                f,
+                ids=self.ids,
+                terms=np.array(list(self.vocabulary), dtype=str),
+                term_offsets=self.term_offsets,
+                rows=self.rows,
+                weights=self.weights,
+            )
+
+    @classmethod
+    def load(cls, path: str) -> "SparseIndex":
+        """Load an index saved with save()
+        Args:
+            path: Path to the file
+        Returns:
+            Loaded SparseIndex
+        """
+        with np.load(path) as data:
+            return cls(
+                data["ids"],
+                data["terms"].tolist(),
+                data["term_offsets"],
+                data["rows"],
+                data["weights"],
+            )
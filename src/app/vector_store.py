@@ -1,87 +1,702 @@
+import fnmatch
+import os
+import uuid
 import numpy as np
 import faiss
 import json
+from dataclasses import asdict, dataclass
+from typing import Mapping
 from numpy.typing import NDArray
+from chunk_store import Chunk, ChunkStore
+from mmap_index import MmapFlatIndex
+from sparse_index import SparseIndex, reciprocal_rank_fusion
+
+INDEX_KINDS = ("flat", "hnsw", "ivf", "ivfpq", "fp16", "sq8", "pq")
+
+
+@dataclass
+class IndexSpec:
+    """Type and parameters of the FAISS index used by VectorStore"""
+
+    # "flat" (exact), "hnsw" (graph), "ivf" (inverted lists), "ivfpq" (inverted lists with product
+    # quantization), or exhaustive search over compressed vectors: "fp16" (half precision, 2 bytes
+    # per dimension), "sq8" (8-bit scalar quantization, 1 byte per dimension) or "pq" (product
+    # quantization, pq_m * pq_nbits bits per vector)
+    kind: str = "flat"
+    # HNSW: neighbours per node, build-time and search-time candidate list sizes
+    hnsw_m: int = 32
+    ef_construction: int = 40
+    ef_search: int = 64
+    # IVF: number of clusters and number of clusters visited per query
+    nlist: int = 100
+    nprobe: int = 8
+    # PQ: number of sub-quantizers (must divide the dimension) and bits per code
+    pq_m: int = 16
+    pq_nbits: int = 8
+    # Re-score rescore * k candidates of approximate kinds with exact float32 vectors, which are
+    # kept in a memory-mapped file next to the index (0 disables re-scoring)
+    rescore: int = 0
+
+    def __post_init__(self):
+        if self.kind not in INDEX_KINDS:
+            raise ValueError(f"Unknown index kind {self.kind!r}, expected one of {INDEX_KINDS}")
+
+    def factory_string(self) -> str:
+        """Get the faiss.index_factory description of the index"""
+        return {
+            "flat": "Flat",
+            "hnsw": f"HNSW{self.hnsw_m},Flat",
+            "ivf": f"IVF{self.nlist},Flat",
+            "ivfpq": f"IVF{self.nlist},PQ{self.pq_m}x{self.pq_nbits}",
+            "fp16": "SQfp16",
+            "sq8": "SQ8",
+            "pq": f"PQ{self.pq_m}x{self.pq_nbits}",
+        }[self.kind]
+
+    @property
+    def min_training_points(self) -> int:
+        """Number of vectors training needs at least: IVF clusters, PQ centroids or SQ ranges"""
+        return {
+            "ivf": self.nlist,
+            "ivfpq": max(self.nlist, 2**self.pq_nbits),
+            "pq": 2**self.pq_nbits,
+            "sq8": 1,
+        }.get(self.kind, 0)
+
+    @property
+    def training_size(self) -> int:
+        """Number of vectors to train on for good quality"""
+        if self.kind == "sq8":
+            # Value ranges of every dimension, estimated from a sample
+            return 1000
+        return self.min_training_points * 4
+
+    @property
+    def stores_exact_vectors(self) -> bool:
+        """Whether float32 vectors are kept next to the index for re-scoring"""
+        return self.rescore > 0 and self.kind != "flat"
 
 
 class VectorStore:
-    def __init__(self, dimension: int):
+    def __init__(self, dimension: int, index_spec: IndexSpec | None = None):
         """Initialize FAISS index with inner product similarity (cosine similarity for normalized vectors)
         Args:
             dimension: Dimension of the vectors (depends on the embedder model)
+            index_spec: Type and parameters of the index (default: exact IndexFlatIP)
         """
         self.dimension = dimension
-        # Use IndexFlatIP for inner product similarity (cosine similarity with normalized vectors)
-        self.index = faiss.IndexFlatIP(dimension)
-        self.texts: list[str] = []
+        self.index_spec = index_spec or IndexSpec()
+        self.index = self._create_index()
+        # Exact float32 vectors of approximate indexes for re-scoring, memory-mapped after load()
+        self.exact_vectors: faiss.Index | MmapFlatIndex | None = (
+            self._create_exact_index() if self.index_spec.stores_exact_vectors else None
+        )
+        # Vector ID -> chunk, a read-only ChunkStore after load()
+        self.chunks: Mapping[int, Chunk] = {}
+        self._fingerprints: dict[str, int] | None = {}
+        # BM25 index over the same chunks, rebuilt lazily after changes
+        self._sparse_index: SparseIndex | None = None
+        # Changes on every modification, lets caches of answers detect a rebuilt index
+        self.version = uuid.uuid4().hex
+        # Base path of memory-mapped files, set while the store is read-only
+        self._mmap_path: str | None = None
+        self.next_id = 0
+
+    @classmethod
+    def from_path(cls, path: str, mmap: bool = False) -> "VectorStore":
+        """Create a vector store from files written by save(), the dimension is read from the index
+        Args:
+            path: Base path for loading files (without extension)
+            mmap: Memory-map the chunk store and, where FAISS supports it, the index
+        Returns:
+            Loaded VectorStore
+        """
+        store = cls.__new__(cls)
+        store.load(path, mmap=mmap)
+        return store
+
+    @property
+    def fingerprints(self) -> dict[str, int]:
+        """Chunk fingerprint -> vector ID, used for incremental refresh"""
+        if self._fingerprints is None:
+            self._fingerprints = self.chunks.fingerprints()
+        return self._fingerprints
+
+    @fingerprints.setter
+    def fingerprints(self, fingerprints: dict[str, int]) -> None:
+        self._fingerprints = fingerprints
+
+    @property
+    def sparse_index(self) -> SparseIndex:
+        """BM25 index over the stored chunks, built on first access after a change"""
+        if self._sparse_index is None:
+            self._sparse_index = SparseIndex.build(
+                {idx: chunk.embedding_text for idx, chunk in self.chunks.items()}
+            )
+        return self._sparse_index
 
-    def add_texts(self, texts: list[str], embeddings: NDArray[np.float32]) -> None:
+    def add_texts(
+        self,
+        texts: list[str],
+        embeddings: NDArray[np.float32],
+        fingerprints: list[str] | None = None,
+    ) -> list[int]:
         """Add texts and their embeddings to the index.
+        Texts formatted with a "Page name / Page source" header are stored as chunks with that metadata.
         Vectors must be L2-normalized before passing to this method.
         Args:
             texts: List of texts to add
             embeddings: Array of L2-normalized embeddings as float32
+            fingerprints: Optional stable fingerprints of the texts (see index_refresh)
+        Returns:
+            List of IDs assigned to the added texts, texts with all-zero embeddings are skipped
         """
-        if not texts or embeddings.size == 0:
+        return self.add_chunks([Chunk.from_text(text) for text in texts], embeddings, fingerprints)
+
+    def add_chunks(
+        self,
+        chunks: list[Chunk],
+        embeddings: NDArray[np.float32],
+        fingerprints: list[str] | None = None,
+    ) -> list[int]:
+        """Add chunks with their metadata and embeddings to the index.
+        Vectors must be L2-normalized before passing to this method.
+        Args:
+            chunks: List of chunks to add
+            embeddings: Array of L2-normalized embeddings as float32
+            fingerprints: Optional stable fingerprints of the chunks (see index_refresh)
+        Returns:
+            List of IDs assigned to the added chunks, chunks with all-zero embeddings are skipped
+        """
+        if not chunks or embeddings.size == 0:
+            return []
+
+        # Embedder returns zero rows for texts that failed to embed. Such a vector matches no query
+        # and would take the chunk's fingerprint, so the chunk is skipped and embedded again next time
+        embedded = np.any(embeddings, axis=1)
+        if not embedded.all():
+            print(f"Error adding chunks: skipped {int((~embedded).sum())} chunks that failed to embed")
+            chunks = [chunk for chunk, ok in zip(chunks, embedded) if ok]
+            embeddings = embeddings[embedded]
+            if fingerprints is not None:
+                fingerprints = [fingerprint for fingerprint, ok in zip(fingerprints, embedded) if ok]
+            if not chunks:
+                return []
+
+        self._ensure_writable()
+        if not self.index.is_trained:
+            self.train(embeddings)
+
+        ids = np.arange(self.next_id, self.next_id + len(chunks), dtype=np.int64)
+        self.index.add_with_ids(embeddings, ids)
+        if self.exact_vectors is not None:
+            self.exact_vectors.add_with_ids(embeddings, ids)
+        self.next_id += len(chunks)
+        self.chunks.update(zip(ids.tolist(), chunks))
+        self._mark_changed()
+        if fingerprints is not None:
+            self.fingerprints.update(zip(fingerprints, ids.tolist()))
+        return ids.tolist()
+
+    def update_chunks(self, chunks: dict[int, Chunk]) -> None:
+        """Replace metadata of stored chunks without touching their vectors
+        Args:
+            chunks: Dictionary mapping vector ID to the updated chunk
+        """
+        if not chunks:
             return
 
-        self.index.add(embeddings)
-        self.texts.extend(texts)
+        self._ensure_writable()
+        self.chunks.update(chunks)
+        self._mark_changed()
+
+    def remove_ids(self, ids: list[int]) -> None:
+        """Remove vectors and chunks by ID
+        Args:
+            ids: List of IDs to remove
+        """
+        if not ids:
+            return
+
+        self._ensure_writable()
+        removed = set(ids)
+        if self.index_spec.kind == "hnsw":
+            # HNSW graphs do not support removal, rebuild the index from the remaining vectors
+            kept = np.array([idx for idx in self.chunks if idx not in removed], dtype=np.int64)
+            vectors = np.vstack([self.index.reconstruct(int(idx)) for idx in kept]) if len(kept) else None
+            self.index = self._create_index()
+            if vectors is not None:
+                self.index.add_with_ids(vectors, kept)
+        else:
+            self.index.remove_ids(np.array(ids, dtype=np.int64))
+        if self.exact_vectors is not None:
+            self.exact_vectors.remove_ids(np.array(ids, dtype=np.int64))
+        for idx in removed:
+            self.chunks.pop(idx, None)
+        self._mark_changed()
+        self.fingerprints = {
+            fingerprint: idx
+            for fingerprint, idx in self.fingerprints.items()
+            if idx not in removed
+        }
+
+    def train(self, embeddings: NDArray[np.float32]) -> None:
+        """Train the index (IVF centroids and PQ codebooks) on a representative sample.
+        Called automatically with the first added batch if the index is not trained yet.
+        Args:
+            embeddings: Array of L2-normalized training vectors as float32
+        """
+        # k-means needs at least as many points as IVF clusters and PQ centroids
+        min_points = self.index_spec.min_training_points
+        if len(embeddings) < min_points:
+            raise ValueError(
+                f"Need at least {min_points} vectors to train a {self.index_spec.kind} index, "
+                f"got {len(embeddings)}"
+            )
+        self.index.train(embeddings)
+
+    def configure_search(
+        self, ef_search: int | None = None, nprobe: int | None = None, rescore: int | None = None
+    ) -> None:
+        """Change search-time accuracy/speed trade-off
+        Args:
+            ef_search: HNSW candidate list size (higher is more accurate and slower)
+            nprobe: Number of IVF clusters visited per query (higher is more accurate and slower)
+            rescore: Candidates per result re-scored with exact vectors, 0 disables re-scoring
+                (only stores created with rescore > 0 keep exact vectors)
+        """
+        if ef_search is not None:
+            self.index_spec.ef_search = ef_search
+        if nprobe is not None:
+            self.index_spec.nprobe = nprobe
+        if rescore is not None:
+            self.index_spec.rescore = rescore
+        self._apply_search_params(self.index)
 
     def similarity_search(
-        self, query_embedding: NDArray[np.float32], k: int = 5
+        self,
+        query_embedding: NDArray[np.float32],
+        k: int = 5,
+        sources: str | list[str] | None = None,
     ) -> list[dict[str, float]]:
         """Search for most similar vectors using cosine similarity.
         Query vector must be L2-normalized before passing to this method.
         Args:
             query_embedding: L2-normalized query embedding as float32 array
             k: Number of results to return (will be capped by number of stored texts)
+            sources: Optional glob pattern(s) of source URLs to restrict the search to, e.g. "*/simulator*"
+        Returns:
+            List of dictionaries containing chunk, score and chunk metadata for all retrieved chunks
+        """
+        return self.similarity_search_batch(query_embedding, k, sources=sources)[0]
+
+    def similarity_search_batch(
+        self,
+        query_embeddings: NDArray[np.float32],
+        k: int = 5,
+        sources: str | list[str] | None = None,
+    ) -> list[list[dict[str, float]]]:
+        """Run similarity_search for many queries with a single FAISS call
+        Args:
+            query_embeddings: (n, d) array of L2-normalized query embeddings
+            k: Number of results per query
+            sources: Optional glob pattern(s) of source URLs to restrict the search to
         Returns:
-            List of dictionaries containing chunk and score for all retrieved chunks
-        """
-        # Ensure query embedding is 2D
-        if query_embedding.ndim == 1:
-            query_embedding = query_embedding.reshape(1, -1)
-            
-        # Limit k to the number of stored texts
-        k = min(k, len(self.texts))
-        
+            List with the results of every query in the format of similarity_search
+        """
+        scores, indices = self.search_batch(query_embeddings, k, sources=sources)
+
+        # Convert to list of dictionaries with text content, similarity score and metadata
+        return [
+            [
+                self._result(idx, score)
+                for idx, score in zip(row_ids, row_scores)
+                if idx >= 0
+            ]
+            for row_ids, row_scores in zip(indices.tolist(), scores.tolist())
+        ]
+
+    def hybrid_search(
+        self,
+        query_embedding: NDArray[np.float32],
+        query_text: str,
+        k: int = 5,
+        sources: str | list[str] | None = None,
+        candidates: int = 20,
+        rrf_k: int = 60,
+    ) -> list[dict[str, float]]:
+        """Search with the dense index and the BM25 index and fuse both rankings with reciprocal rank fusion.
+        Keyword matching catches exact course and tool names the embedding model ranks poorly.
+        Args:
+            query_embedding: L2-normalized query embedding as float32 array
+            query_text: Query text for keyword search
+            k: Number of results to return
+            sources: Optional glob pattern(s) of source URLs to restrict the search to
+            candidates: Number of candidates taken from each index before fusion
+            rrf_k: Reciprocal rank fusion smoothing constant
+        Returns:
+            List of dictionaries containing chunk, fused score, dense score (cosine similarity,
+            computed from the stored vector for keyword-only matches), sparse score (None if
+            the chunk was not retrieved by keyword search) and chunk metadata
+        """
+        return self.hybrid_search_batch(
+            query_embedding, [query_text], k, sources=sources, candidates=candidates, rrf_k=rrf_k
+        )[0]
+
+    def hybrid_search_batch(
+        self,
+        query_embeddings: NDArray[np.float32],
+        query_texts: list[str],
+        k: int = 5,
+        sources: str | list[str] | None = None,
+        candidates: int = 20,
+        rrf_k: int = 60,
+    ) -> list[list[dict[str, float]]]:
+        """Run hybrid_search for many queries, the dense side is a single FAISS call
+        Args:
+            query_embeddings: (n, d) array of L2-normalized query embeddings
+            query_texts: Texts of the n queries for keyword search
+            k: Number of results per query
+            sources: Optional glob pattern(s) of source URLs to restrict the search to
+            candidates: Number of candidates taken from each index before fusion
+            rrf_k: Reciprocal rank fusion smoothing constant
+        Returns:
+            List with the results of every query in the format of hybrid_search
+        """
+        dense_scores, dense_ids = self.search_batch(query_embeddings, candidates, sources=sources)
+        allowed = None
+        if sources is not None:
+            allowed = self.ids_from_sources([sources] if isinstance(sources, str) else sources)
+
+        queries = np.atleast_2d(query_embeddings)
+        results = []
+        for query, row_ids, row_scores, query_text in zip(
+            queries, dense_ids.tolist(), dense_scores.tolist(), query_texts
+        ):
+            sparse_scores, sparse_ids = self.sparse_index.search(query_text, candidates, allowed=allowed)
+            dense = {idx: score for idx, score in zip(row_ids, row_scores) if idx >= 0}
+            sparse = dict(zip(sparse_ids.tolist(), sparse_scores.tolist()))
+            fused = reciprocal_rank_fusion([list(dense), list(sparse)], k=rrf_k)
+            # Keyword-only matches get their similarity too, relevance cutoffs rely on it
+            keyword_only = [idx for idx, _ in fused[:k] if idx not in dense]
+            if keyword_only:
+                dense.update(zip(keyword_only, self._similarities(query, keyword_only)))
+            results.append(
+                [
+                    self._result(idx, score, dense_score=dense.get(idx), sparse_score=sparse.get(idx))
+                    for idx, score in fused[:k]
+                ]
+            )
+        return results
+
+    def search_batch(
+        self,
+        query_embeddings: NDArray[np.float32],
+        k: int = 5,
+        sources: str | list[str] | None = None,
+    ) -> tuple[NDArray[np.float32], NDArray[np.int64]]:
+        """Search nearest neighbours of many queries in a single FAISS call.
+        Query vectors must be L2-normalized before passing to this method.
+        Args:
+            query_embeddings: (n, d) array of L2-normalized query embeddings, a single (d,) query is accepted too
+            k: Number of results per query (will be capped by number of stored texts)
+            sources: Optional glob pattern(s) of source URLs to restrict the search to,
+                applied inside FAISS with an ID selector
+        Returns:
+            Tuple of (n, k) arrays of scores and IDs sorted by descending score,
+            missing results of approximate indexes have ID -1 (use get_texts to materialize chunks)
+        """
+        # FAISS needs a C-contiguous float32 2D matrix
+        queries = np.ascontiguousarray(np.atleast_2d(query_embeddings), dtype=np.float32)
+        params = None
+        allowed = None
+        if sources is not None:
+            allowed = self.ids_from_sources([sources] if isinstance(sources, str) else sources)
+            k = min(k, len(allowed))
+            if not isinstance(self.index, MmapFlatIndex):
+                # The selector must stay referenced until the search is done
+                selector = faiss.IDSelectorBatch(allowed)
+                params = self._search_params(selector)
+        k = min(k, len(self.chunks))
         if k == 0:
-            return []
+            return (
+                np.empty((len(queries), 0), dtype=np.float32),
+                np.empty((len(queries), 0), dtype=np.int64),
+            )
+
+        # Inner product is equivalent to cosine similarity for normalized vectors
+        if isinstance(self.index, MmapFlatIndex):
+            return self.index.search(queries, k, allowed=allowed)
+        if self.exact_vectors is None or self.index_spec.rescore <= 0:
+            return self.index.search(queries, k, params=params)
 
-        # Get nearest neighbors using inner product (equivalent to cosine similarity for normalized vectors)
-        scores, indices = self.index.search(query_embedding, k)
+        # Approximate scores only select the candidates, results are ranked by exact scores
+        _, ids = self.index.search(queries, k * self.index_spec.rescore, params=params)
+        return self._rescore(queries, ids, k)
 
-        # Convert to list of dictionaries with text content and similarity score
+    def get_texts(self, ids: NDArray[np.int64]) -> list[list[str]]:
+        """Materialize chunk texts for IDs returned by search_batch
+        Args:
+            ids: (n, k) array of IDs
+        Returns:
+            List with a list of formatted chunk texts per query, missing results (-1) are skipped
+        """
         return [
-            {"chunk": self.texts[idx], "score": float(score)}
-            for idx, score in zip(indices[0], scores[0])
+            [self.chunks[idx].formatted for idx in row if idx >= 0]
+            for row in np.atleast_2d(ids).tolist()
         ]
 
+    def ids_from_sources(self, patterns: list[str]) -> NDArray[np.int64]:
+        """Get IDs of chunks whose source URL matches any of the glob patterns
+        Args:
+            patterns: fnmatch-style patterns, e.g. "*/simulator*"
+        Returns:
+            Array of matching chunk IDs
+        """
+        if isinstance(self.chunks, ChunkStore):
+            return self.chunks.ids_from_sources(patterns)
+
+        # Match every distinct source once
+        matches = {}
+        ids = []
+        for idx, chunk in self.chunks.items():
+            if chunk.source not in matches:
+                matches[chunk.source] = chunk.source is not None and any(
+                    fnmatch.fnmatchcase(chunk.source, pattern) for pattern in patterns
+                )
+            if matches[chunk.source]:
+                ids.append(idx)
+        return np.array(ids, dtype=np.int64)
+
     def save(self, path: str) -> None:
         """Save the vector store to files
         Args:
             path: Base path for saving files (without extension)
         """
-        # Save FAISS index
+        # Memory-mapped IVF lists cannot be serialized, read the index into memory first
+        self._ensure_writable()
+
+        # Save FAISS index, files are replaced atomically so that memory-mapped readers stay valid
         index_path = f"{path}.faiss"
-        faiss.write_index(self.index, index_path)
-        
-        # Save texts
+        faiss.write_index(self.index, f"{index_path}.tmp")
+        os.replace(f"{index_path}.tmp", index_path)
+
+        # Save chunks with their IDs, metadata and fingerprints
+        id_to_fingerprint = {idx: fingerprint for fingerprint, idx in self.fingerprints.items()}
+        ChunkStore.write(f"{path}.chunks", self.chunks, id_to_fingerprint)
+
+        # Flat and exact vectors are also saved as a matrix ordered by ID, which readers memory-map
+        vectors_path = f"{path}.vectors.npy"
+        exact_index = self.index if self.index_spec.kind == "flat" else self.exact_vectors
+        if exact_index is not None:
+            with open(f"{vectors_path}.tmp", "wb") as f:
+                np.save(f, self._flat_vectors(exact_index))
+            os.replace(f"{vectors_path}.tmp", vectors_path)
+        elif os.path.exists(vectors_path):
+            os.remove(vectors_path)
+
+        # Save BM25 index next to the dense one
+        self.sparse_index.save(f"{path}.bm25.npz.tmp")
+        os.replace(f"{path}.bm25.npz.tmp", f"{path}.bm25.npz")
+
         texts_path = f"{path}.json"
-        with open(texts_path, 'w', encoding='utf-8') as f:
-            json.dump(self.texts, f, ensure_ascii=False, indent=2)
+        data = {"format": "chunks", "version": self.version, "index_spec": asdict(self.index_spec)}
+        with open(f"{texts_path}.tmp", 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(f"{texts_path}.tmp", texts_path)
 
-    def load(self, path: str) -> None:
-        """Load the vector store from files
+    def load(self, path: str, mmap: bool = False) -> None:
+        """Load the vector store from files.
+        A memory-mapped store is read-only until the first change, which reads it into memory.
         Args:
             path: Base path for loading files (without extension)
+            mmap: Memory-map the chunk store and, where FAISS supports it, the index
         """
-        # Load FAISS index
-        index_path = f"{path}.faiss"
-        self.index = faiss.read_index(index_path)
-        
         # Load texts
         texts_path = f"{path}.json"
         with open(texts_path, 'r', encoding='utf-8') as f:
-            self.texts = json.load(f)
+            data = json.load(f)
+        spec = IndexSpec(**data["index_spec"]) if isinstance(data, dict) and "index_spec" in data else IndexSpec()
+
+        # Load FAISS index (only IVF inverted lists are memory-mapped by FAISS),
+        # flat vectors are memory-mapped from their .npy copy instead of being read
+        index_path = f"{path}.faiss"
+        vectors_path = f"{path}.vectors.npy"
+        has_vectors = os.path.exists(vectors_path)
+        shared = mmap and has_vectors and spec.kind == "flat"
+        if not shared:
+            io_flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY if mmap else 0
+            self.index = faiss.read_index(index_path, io_flags)
+            self.dimension = self.index.d
+        self._mmap_path = path if mmap else None
+        self.exact_vectors = None
+
+        if isinstance(data, list):
+            # Stores saved before ID support: plain index and a list of texts
+            data = {"ids": list(range(len(data))), "texts": data, "fingerprints": []}
+            vectors = self.index.reconstruct_n(0, self.index.ntotal)
+            self.index_spec = IndexSpec()
+            self.index = self._create_index()
+            self.index.add_with_ids(vectors, np.array(data["ids"], dtype=np.int64))
+            self._mmap_path = None
+
+        self.index_spec = spec
+        self.version = data.get("version") or uuid.uuid4().hex
+
+        if "texts" in data:
+            # Stores saved before the binary chunk store keep texts in the JSON file
+            self.chunks = {
+                idx: Chunk.from_text(text) for idx, text in zip(data["ids"], data["texts"])
+            }
+            self.fingerprints = {
+                fingerprint: idx
+                for idx, fingerprint in zip(data["ids"], data["fingerprints"])
+                if fingerprint is not None
+            }
+        else:
+            self.chunks = ChunkStore(f"{path}.chunks", mmap=mmap)
+            # Fingerprints are only needed for refresh and are decoded on first access
+            self._fingerprints = None
+        if shared:
+            self.index = MmapFlatIndex(vectors_path, self.chunks.ids)
+            self.dimension = self.index.d
+        elif has_vectors and self.index_spec.stores_exact_vectors:
+            # Only the rows of re-scored candidates are read from the memory-mapped file
+            self.exact_vectors = MmapFlatIndex(vectors_path, self.chunks.ids)
+            if not mmap:
+                self.exact_vectors = self._exact_index_from(self.exact_vectors)
+        self._apply_search_params(self.index)
+        self.next_id = max(self.chunks, default=-1) + 1
+
+        # Stores saved without a BM25 index build it on first hybrid search
+        sparse_path = f"{path}.bm25.npz"
+        self._sparse_index = SparseIndex.load(sparse_path) if os.path.exists(sparse_path) else None
+
+    def _mark_changed(self) -> None:
+        """Drop derived state after chunks were added, removed or updated"""
+        self._sparse_index = None
+        self.version = uuid.uuid4().hex
+
+    def _ensure_writable(self) -> None:
+        """Read a memory-mapped store into memory before it is changed"""
+        if not isinstance(self.chunks, dict):
+            fingerprints = self.fingerprints
+            self.chunks = dict(self.chunks.items())
+            self.fingerprints = fingerprints
+        if self._mmap_path is not None:
+            self.index = faiss.read_index(f"{self._mmap_path}.faiss")
+            self._apply_search_params(self.index)
+            self._mmap_path = None
+        if isinstance(self.exact_vectors, MmapFlatIndex):
+            self.exact_vectors = self._exact_index_from(self.exact_vectors)
+
+    def _create_index(self) -> faiss.Index:
+        """Create an empty index from the spec that stores vectors by ID.
+        IVF indexes keep IDs in their inverted lists, other kinds are wrapped in IndexIDMap2.
+        """
+        if self.index_spec.kind in ("ivf", "ivfpq"):
+            index = faiss.index_factory(
+                self.dimension, self.index_spec.factory_string(), faiss.METRIC_INNER_PRODUCT
+            )
+            # Hashtable direct map allows reconstruction by ID and removal
+            index.set_direct_map_type(faiss.DirectMap.Hashtable)
+        else:
+            index = faiss.index_factory(
+                self.dimension,
+                f"IDMap2,{self.index_spec.factory_string()}",
+                faiss.METRIC_INNER_PRODUCT,
+            )
+        base_index = self._base_index(index)
+        if isinstance(base_index, (faiss.IndexIVFPQ, faiss.IndexPQ)):
+            # Polysemous codes are only used for Hamming filtering and make training very slow
+            base_index.do_polysemous_training = False
+        if isinstance(base_index, faiss.IndexHNSW):
+            base_index.hnsw.efConstruction = self.index_spec.ef_construction
+        self._apply_search_params(index)
+        return index
+
+    def _result(self, idx: int, score: float, **scores: float | None) -> dict[str, float]:
+        """Build a search result with chunk text, scores and chunk metadata"""
+        chunk = self.chunks[idx]
+        return {
+            "chunk": chunk.formatted,
+            "text": chunk.text,
+            "score": score,
+            **scores,
+            "source": chunk.source,
+            "title": chunk.title,
+            "position": chunk.position,
+            "section": chunk.section,
+        }
+
+    def _search_params(self, selector: faiss.IDSelector) -> faiss.SearchParameters:
+        """Get search parameters of the index type that restrict results to the selected IDs"""
+        base_index = self._base_index(self.index)
+        if isinstance(base_index, faiss.IndexHNSW):
+            return faiss.SearchParametersHNSW(sel=selector, efSearch=self.index_spec.ef_search)
+        if faiss.try_extract_index_ivf(base_index):
+            return faiss.SearchParametersIVF(sel=selector, nprobe=self.index_spec.nprobe)
+        return faiss.SearchParameters(sel=selector)
+
+    def _apply_search_params(self, index: faiss.Index | MmapFlatIndex) -> None:
+        """Set efSearch / nprobe from the spec on the index"""
+        if isinstance(index, MmapFlatIndex):
+            return
+        base_index = self._base_index(index)
+        if isinstance(base_index, faiss.IndexHNSW):
+            base_index.hnsw.efSearch = self.index_spec.ef_search
+        if ivf := faiss.try_extract_index_ivf(base_index):
+            ivf.nprobe = self.index_spec.nprobe
+
+    def _create_exact_index(self) -> faiss.Index:
+        """Create an empty index keeping exact vectors by ID"""
+        return faiss.IndexIDMap2(faiss.IndexFlatIP(self.dimension))
+
+    def _exact_index_from(self, vectors: MmapFlatIndex) -> faiss.Index:
+        """Read memory-mapped exact vectors into an index that can be changed"""
+        index = self._create_exact_index()
+        if vectors.ntotal:
+            index.add_with_ids(np.ascontiguousarray(vectors.vectors), np.asarray(vectors.ids, dtype=np.int64))
+        return index
+
+    def _rescore(
+        self, queries: NDArray[np.float32], candidates: NDArray[np.int64], k: int
+    ) -> tuple[NDArray[np.float32], NDArray[np.int64]]:
+        """Rank candidate IDs by the exact inner product with the queries and keep the top k"""
+        valid = candidates >= 0
+        if not valid.any():
+            return np.full((len(queries), k), -np.inf, dtype=np.float32), candidates[:, :k]
+        # Missing results (ID -1) read any stored vector and are ranked last
+        vectors = self.exact_vectors.reconstruct_batch(np.where(valid, candidates, candidates.max()).ravel())
+        vectors = vectors.reshape(*candidates.shape, -1)
+        scores = np.einsum("nkd,nd->nk", vectors, queries)
+        scores[~valid] = -np.inf
+        order = np.argsort(-scores, axis=1, kind="stable")[:, :k]
+        scores = np.take_along_axis(scores, order, axis=1).astype(np.float32)
+        ids = np.take_along_axis(candidates, order, axis=1)
+        ids[np.isneginf(scores)] = -1
+        return scores, ids
+
+    def _similarities(self, query: NDArray[np.float32], ids: list[int]) -> list[float | None]:
+        """Inner product of the query with stored vectors, approximate for compressed kinds
+        without exact vectors, None if the index cannot reconstruct them"""
+        index = self.exact_vectors if self.exact_vectors is not None else self.index
+        try:
+            vectors = index.reconstruct_batch(np.array(ids, dtype=np.int64))
+        except RuntimeError as e:
+            print(f"Error reconstructing vectors: {e}")
+            return [None] * len(ids)
+        return (np.asarray(vectors, dtype=np.float32) @ query.astype(np.float32)).tolist()
+
+    def _flat_vectors(self, index: faiss.Index) -> NDArray[np.float32]:
+        """Get vectors of an IndexIDMap2 with a flat index as a matrix with rows ordered by chunk ID"""
+        ids = faiss.vector_to_array(index.id_map)
+        vectors = self._base_index(index).reconstruct_n(0, index.ntotal)
+        return np.ascontiguousarray(vectors[np.argsort(ids)], dtype=np.float32)
+
+    @staticmethod
+    def _base_index(index: faiss.Index) -> faiss.Index:
+        """Unwrap IndexIDMap2 to get the index doing the actual search"""
+        if isinstance(index, faiss.IndexIDMap2):
+            return faiss.downcast_index(index.index)
+        return index
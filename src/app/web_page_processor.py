@@ -1,6 +1,16 @@
-from typing import List
+import asyncio
+import bisect
+from collections import defaultdict
+from dataclasses import asdict
+from typing import AsyncIterator, List
+from bs4 import BeautifulSoup
+from langchain_core.documents import Document
 from langchain_community.document_loaders import WebBaseLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
+from chunk_store import Chunk
+from crawler import AsyncCrawler, Page
+from page_cache import PageCache
+from deduplicator import ChunkDeduplicator
 
 
 class WebPageProcessor:
@@ -8,14 +18,23 @@ class WebPageProcessor:
         self,
         chunk_size: int = 500,
         chunk_overlap: int = 100,
+        crawler: AsyncCrawler | None = None,
+        cache: PageCache | None = None,
+        deduplicator: ChunkDeduplicator | None = None,
     ):
         """Initialize document processor
         Args:
             chunk_size: Size of text chunks
             chunk_overlap: Overlap between chunks
+            crawler: Optional AsyncCrawler to fetch pages concurrently (default: sequential WebBaseLoader)
+            cache: Optional PageCache to skip parsing and chunking of unchanged pages
+            deduplicator: Optional ChunkDeduplicator to drop site chrome and near-duplicate chunks across pages
         """
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
+        self.crawler = crawler
+        self.cache = cache
+        self.deduplicator = deduplicator
 
     def process_urls(self, urls: List[str]) -> List[str]:
         """Load URLs and split into chunks
@@ -24,22 +43,200 @@ class WebPageProcessor:
         Returns:
             List of text chunks with page names
         """
-        # Load documents
-        loader = WebBaseLoader(urls)
-        docs = loader.load()
+        pages = self.process_pages(urls)
+        return [chunk.formatted for url in urls for chunk in pages.get(url, [])]
 
-        # Split documents
+    def process_pages(self, urls: List[str], failed: List[str] | None = None) -> dict[str, List[Chunk]]:
+        """Load URLs and split every page into chunks
+        Args:
+            urls: List of URLs to process
+            failed: Optional list the URLs of pages that could not be loaded are appended to
+        Returns:
+            Dictionary mapping page URL to the list of its chunks with metadata,
+            pages that could not be loaded are missing
+        """
+        if self.crawler is None and self.cache is None:
+            # Load documents
+            loader = WebBaseLoader(urls)
+            docs = loader.load()
+            pages = {doc.metadata["source"]: self.split_records([doc]) for doc in docs}
+            if failed is not None:
+                failed.extend(url for url in urls if url not in pages)
+        else:
+            pages = asyncio.run(self._load_concurrently(urls, failed))
+
+        if self.deduplicator is not None:
+            pages = self.deduplicator.deduplicate(pages)
+        return pages
+
+    async def astream_chunks(self, urls: List[str]) -> AsyncIterator[List[Chunk]]:
+        """Fetch URLs concurrently and yield chunks of each page as soon as it arrives.
+        Deduplication needs every page and is not applied to the stream.
+        Args:
+            urls: List of URLs to process
+        Returns:
+            Async iterator over lists of chunks, one list per page
+        """
+        crawler = self.crawler or AsyncCrawler()
+        async for page in crawler.crawl(urls, cache=self.cache):
+            yield self.process_page(page)
+
+    def process_page(self, page: Page) -> List[Chunk]:
+        """Split a fetched page into chunks, reusing cached chunks if the page is unchanged
+        Args:
+            page: Fetched page
+        Returns:
+            List of chunks with metadata
+        """
+        chunks, page = self.lookup_page(page)
+        if chunks is not None:
+            return chunks
+
+        chunks = self.split_page(page)
+        self.cache_page(page, chunks)
+        return chunks
+
+    def split_page(self, page: Page) -> List[Chunk]:
+        """Parse a fetched page and split it into chunks without using the cache
+        Args:
+            page: Fetched page with HTML
+        Returns:
+            List of chunks with metadata
+        """
+        return self.split_records([self.parse_page(page)])
+
+    def lookup_page(self, page: Page) -> tuple[List[Chunk] | None, Page]:
+        """Look up cached chunks of a fetched page
+        Args:
+            page: Fetched page
+        Returns:
+            Tuple of the cached chunks (None on cache miss) and the page to split on a miss,
+            which has the cached HTML if the server answered 304 Not Modified
+        """
+        if self.cache is None:
+            return None, page
+
+        html = None if page.not_modified else page.html
+        chunks = self.cache.lookup_chunks(page.url, html, self._chunk_params)
+        if chunks is not None:
+            return [Chunk(**chunk) for chunk in chunks], page
+
+        if page.not_modified:
+            # Splitter settings changed since the page was cached, re-parse the cached HTML
+            entry = self.cache.get(page.url) or {}
+            page = Page(
+                url=page.url,
+                html=self.cache.get_html(page.url) or "",
+                status=200,
+                etag=page.etag or entry.get("etag"),
+                last_modified=page.last_modified or entry.get("last_modified"),
+            )
+        return None, page
+
+    def cache_page(self, page: Page, chunks: List[Chunk]) -> None:
+        """Store chunks of a page split after a cache miss
+        Args:
+            page: Page returned by lookup_page
+            chunks: Chunks the page was split into
+        """
+        if self.cache is None:
+            return
+
+        self.cache.put(
+            page.url,
+            page.html,
+            [asdict(chunk) for chunk in chunks],
+            self._chunk_params,
+            page.etag,
+            page.last_modified,
+        )
+
+    @property
+    def _chunk_params(self) -> str:
+        """Identifier of the splitter settings cached chunks were produced with"""
+        return f"{self.chunk_size}:{self.chunk_overlap}:records"
+
+    def parse_page(self, page: Page) -> Document:
+        """Extract text and metadata from raw HTML the same way WebBaseLoader does
+        Args:
+            page: Fetched page
+        Returns:
+            Document with page text, title, source and offsets of section headings in the text
+        """
+        soup = BeautifulSoup(page.html, "html.parser")
+        text = soup.get_text()
+        metadata = {"source": page.url}
+        if title := soup.find("title"):
+            metadata["title"] = title.get_text()
+
+        # Text of every heading is a contiguous piece of the page text, find them in order
+        headings = []
+        offset = 0
+        for heading in soup.find_all(["h1", "h2", "h3"]):
+            heading_text = heading.get_text()
+            name = " ".join(heading_text.split())
+            position = text.find(heading_text, offset)
+            if name and position >= 0:
+                headings.append((position, name))
+                offset = position + len(heading_text)
+        metadata["headings"] = headings
+        return Document(page_content=text, metadata=metadata)
+
+    def split_documents(self, docs: List[Document]) -> List[str]:
+        """Split documents into chunks prefixed with page name and source
+        Args:
+            docs: List of loaded documents
+        Returns:
+            List of text chunks with page names
+        """
+        return [chunk.formatted for chunk in self.split_records(docs)]
+
+    def split_records(self, docs: List[Document]) -> List[Chunk]:
+        """Split documents into chunks that keep page metadata in separate fields
+        Args:
+            docs: List of loaded documents
+        Returns:
+            List of chunks with source, title, position within the page and section heading
+        """
+        # Split documents, the splitter records where every chunk starts in the page text
         splitter = RecursiveCharacterTextSplitter(
-            chunk_size=self.chunk_size, chunk_overlap=self.chunk_overlap
+            chunk_size=self.chunk_size,
+            chunk_overlap=self.chunk_overlap,
+            add_start_index=True,
         )
-        chunks = splitter.split_documents(docs)
+        records = []
+        positions = defaultdict(int)
+        for doc in docs:
+            headings = doc.metadata.get("headings", [])
+            offsets = [offset for offset, _ in headings]
+            metadata = {key: value for key, value in doc.metadata.items() if key != "headings"}
+            page = Document(page_content=doc.page_content, metadata=metadata)
+            for chunk in splitter.split_documents([page]):
+                source = chunk.metadata.get("source", "Unknown")
+                # Nearest heading at or above the start of the chunk, or the first one inside it
+                start = chunk.metadata["start_index"]
+                heading = bisect.bisect_right(offsets, start) - 1
+                if heading < 0 and offsets and offsets[0] < start + len(chunk.page_content):
+                    heading = 0
+                records.append(
+                    Chunk(
+                        text=chunk.page_content,
+                        source=source,
+                        title=chunk.metadata.get("title"),
+                        position=positions[source],
+                        section=headings[heading][1] if heading >= 0 else None,
+                    )
+                )
+                positions[source] += 1
 
-        # Extract text content and source from chunks
-        formatted_chunks = []
-        for chunk in chunks:
-            page_name = chunk.metadata.get("title", "Unknown")
-            page_source = chunk.metadata.get("source", "Unknown")
-            formatted_text = f"Page name:\n{page_name}\nPage source:\n{page_source}\nPage content:\n{chunk.page_content}\n"
-            formatted_chunks.append(formatted_text)
+        return records
 
-        return formatted_chunks
+    async def _load_concurrently(
+        self, urls: List[str], failed: List[str] | None = None
+    ) -> dict[str, List[Chunk]]:
+        """Fetch all URLs with the crawler and return chunks of every page by URL"""
+        chunks = {}
+        crawler = self.crawler or AsyncCrawler()
+        async for page in crawler.crawl(urls, cache=self.cache, failed=failed):
+            chunks[page.url] = self.process_page(page)
+        return chunks
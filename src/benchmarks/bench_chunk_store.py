@@ -0,0 +1,113 @@
+"""Compare load time and resident memory of the JSON text sidecar and the binary chunk store.
+
+A synthetic corpus of chunks with the usual "Page name / Page source" headers is
+saved in both formats, then every variant is loaded in a fresh interpreter that
+reports load time, RSS growth and the time to read the texts of k search hits.
+Small vectors are used so that the text storage dominates memory. Run with:
+    PYTHONPATH=src:src/app python -m benchmarks.bench_chunk_store
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from dataclasses import asdict
+import numpy as np
+from app.chunk_store import format_chunk
+from app.vector_store import VectorStore
+
+CHILD = """
+import json, sys, time
+import numpy as np
+from vector_store import VectorStore
+
+def rss_mb():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * 4096 / 2**20
+
+before = rss_mb()
+start = time.perf_counter()
+store = VectorStore.from_path(sys.argv[1], mmap=sys.argv[2] == "1")
+loaded = time.perf_counter()
+query = np.ones(store.dimension, dtype=np.float32) / np.sqrt(store.dimension)
+store.similarity_search(query, k=5)
+searched = time.perf_counter()
+print(json.dumps({
+    "load_s": loaded - start,
+    "search_ms": (searched - loaded) * 1000,
+    "rss_mb": rss_mb() - before,
+}))
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--chunks", type=int, default=100000)
+    parser.add_argument("--pages", type=int, default=500)
+    parser.add_argument("--dimension", type=int, default=16)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    words = ["аналитика", "данных", "курс", "Python", "SQL", "обучение", "проект", "ментор"]
+    texts = [
+        format_chunk(
+            f"Курс {i % args.pages} — Karpov Courses",
+            f"https://karpov.courses/course-{i % args.pages}",
+            " ".join(rng.choice(words, 60)),
+        )
+        for i in range(args.chunks)
+    ]
+    embeddings = rng.standard_normal((args.chunks, args.dimension)).astype(np.float32)
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    store = VectorStore(args.dimension)
+    store.add_texts(texts, embeddings, fingerprints=[f"{i:064x}" for i in range(args.chunks)])
+
+    directory = tempfile.mkdtemp()
+    chunks_path = os.path.join(directory, "chunks")
+    store.save(chunks_path)
+    # Same store in the previous format: every text in an indented JSON sidecar
+    json_path = os.path.join(directory, "json")
+    store.save(json_path)
+    with open(f"{json_path}.json", "w", encoding="utf-8") as f:
+        json.dump(
+            {
+                "index_spec": asdict(store.index_spec),
+                "ids": list(store.chunks),
+                "texts": [chunk.formatted for chunk in store.chunks.values()],
+                "fingerprints": [f"{i:064x}" for i in range(args.chunks)],
+            },
+            f,
+            ensure_ascii=False,
+            indent=2,
+        )
+    os.remove(f"{json_path}.chunks")
+    sizes = {
+        "json": os.path.getsize(f"{json_path}.json"),
+        "chunks": os.path.getsize(f"{chunks_path}.chunks"),
+    }
+
+    app_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app")
+    env = {**os.environ, "PYTHONPATH": app_dir}
+    for name, path, mmap in (
+        ("json", json_path, "0"),
+        ("chunks", chunks_path, "0"),
+        ("chunks mmap", chunks_path, "1"),
+    ):
+        output = subprocess.run(
+            [sys.executable, "-c", CHILD, path, mmap],
+            capture_output=True,
+            text=True,
+            check=True,
+            env=env,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(
+            f"{name:>12}: file {sizes[name.split()[0]] / 2**20:.1f}MB, load {result['load_s']:.3f}s, "
+            f"first search {result['search_ms']:.2f}ms, RSS +{result['rss_mb']:.1f}MB"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""Compare sequential WebBaseLoader fetching with the async crawler.
+
+A local HTTP server stands in for karpov.courses and serves the catalog pages
+with artificial delays. Run with:
+    PYTHONPATH=src:src/app python -m benchmarks.bench_crawler
+"""
+
+import argparse
+import asyncio
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+from app.config import COURSE_URLS
+from app.crawler import AsyncCrawler
+from app.web_page_processor import WebPageProcessor
+
+
+def make_handler(delays: dict[str, float]) -> type[BaseHTTPRequestHandler]:
+    """Build a request handler that sleeps for the configured delay of each path"""
+
+    class DelayedHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(delays.get(self.path, 0.0))
+            name = self.path.strip("/")
+            paragraphs = "".join(
+                f"<p>Курс {name}: раздел {i}. " + "Описание программы курса. " * 20 + "</p>"
+                for i in range(30)
+            )
+            body = f"<html><head><title>Курс {name}</title></head><body>{paragraphs}</body></html>"
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.end_headers()
+            self.wfile.write(body.encode("utf-8"))
+
+        def log_message(self, *args):
+            pass
+
+    return DelayedHandler
+
+
+def start_server(min_delay: float, max_delay: float) -> ThreadingHTTPServer:
+    """Start the stand-in server in a background thread"""
+    rng = random.Random(0)
+    delays = {urlsplit(url).path: rng.uniform(min_delay, max_delay) for url in COURSE_URLS}
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(delays))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+async def stream(processor: WebPageProcessor, urls: list[str]) -> tuple[float, int]:
+    """Consume the chunk stream, returning time to first page and chunk count"""
+    start = time.perf_counter()
+    first_page = None
+    count = 0
+    async for chunks in processor.astream_chunks(urls):
+        first_page = first_page or time.perf_counter() - start
+        count += len(chunks)
+    return first_page, count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--min-delay", type=float, default=0.1)
+    parser.add_argument("--max-delay", type=float, default=0.6)
+    parser.add_argument("--per-host-limit", type=int, default=8)
+    args = parser.parse_args()
+
+    server = start_server(args.min_delay, args.max_delay)
+    base = f"http://127.0.0.1:{server.server_port}"
+    urls = [base + urlsplit(url).path for url in COURSE_URLS]
+
+    try:
+        start = time.perf_counter()
+        chunks = WebPageProcessor().process_urls(urls)
+        sequential = time.perf_counter() - start
+        print(f"sequential: {sequential:.2f}s, {len(chunks)} chunks")
+
+        crawler = AsyncCrawler(per_host_limit=args.per_host_limit)
+        start = time.perf_counter()
+        chunks = WebPageProcessor(crawler=crawler).process_urls(urls)
+        concurrent = time.perf_counter() - start
+        print(f"async crawler: {concurrent:.2f}s, {len(chunks)} chunks ({sequential / concurrent:.1f}x)")
+
+        first_page, count = asyncio.run(stream(WebPageProcessor(crawler=crawler), urls))
+        print(f"streaming: first page after {first_page:.2f}s, {count} chunks")
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
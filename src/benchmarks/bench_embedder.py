@@ -0,0 +1,67 @@
+"""Compare query latency and batch throughput of Embedder backends.
+
+Run with:
+    PYTHONPATH=src:src/app python -m benchmarks.bench_embedder
+"""
+
+import argparse
+import tempfile
+import time
+import numpy as np
+from app.embedder import Embedder
+from tests.constants import EXPECTED_FIRST_CHUNKS, TEST_EMBEDDING, TEST_QUESTION, TEST_TEXT
+
+
+def measure(embedder: Embedder, queries: int, chunks: list[str]) -> dict[str, float]:
+    """Measure single-query latency percentiles and batch throughput"""
+    embedder.get_embeddings([TEST_QUESTION])  # warm up
+    latencies = []
+    for i in range(queries):
+        start = time.perf_counter()
+        embedder.get_embeddings([f"{TEST_QUESTION} {i}"])
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    embedder.get_embeddings(chunks)
+    seconds = time.perf_counter() - start
+
+    actual = embedder.get_embeddings(TEST_TEXT)
+    expected = np.array(TEST_EMBEDDING[0])
+    return {
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+        "chunks_per_sec": len(chunks) / seconds,
+        "cosine": float(actual @ expected / (np.linalg.norm(actual) * np.linalg.norm(expected))),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--chunks", type=int, default=500)
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--quantization", default="avx2")
+    args = parser.parse_args()
+
+    chunks = [EXPECTED_FIRST_CHUNKS[i % len(EXPECTED_FIRST_CHUNKS)] + str(i) for i in range(args.chunks)]
+    onnx_dir = tempfile.mkdtemp(prefix="onnx-")
+    backends = {
+        "torch float32": dict(device="cpu"),
+        "onnx float32": dict(backend="onnx", intra_op_threads=args.threads, onnx_dir=onnx_dir),
+        f"onnx int8 ({args.quantization})": dict(
+            backend="onnx",
+            quantization=args.quantization,
+            intra_op_threads=args.threads,
+            onnx_dir=onnx_dir,
+        ),
+    }
+    for name, kwargs in backends.items():
+        result = measure(Embedder(**kwargs), args.queries, chunks)
+        print(
+            f"{name:>24}: query p50 {result['p50_ms']:.1f}ms p95 {result['p95_ms']:.1f}ms, "
+            f"{result['chunks_per_sec']:.0f} chunks/s, cosine vs float32 {result['cosine']:.4f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Recall@k gained by cross-encoder re-ranking against the latency it adds.
+
+Known-item evaluation over a saved course index: every query is a sentence taken from
+a random chunk, and the chunk and its neighbours on the same page are the relevant
+results. Retrieval is measured without re-ranking (top k of the search) and with
+re-ranking of the top --candidates results, together with the re-ranking latency.
+Run with:
+    PYTHONPATH=src:src/app python -m benchmarks.bench_reranker --index vector_store
+"""
+
+import argparse
+import re
+import time
+import numpy as np
+from app.embedder import Embedder
+from app.reranker import Reranker
+from app.vector_store import VectorStore
+
+SENTENCE = re.compile(r"[^.!?\n]{30,200}")
+
+
+def make_queries(
+    store: VectorStore, count: int, rng: np.random.Generator
+) -> list[tuple[str, set[tuple[str, int]]]]:
+    """Take a sentence of random chunks as queries, relevant are the chunk and its page neighbours"""
+    queries = []
+    for idx in rng.permutation(list(store.chunks)).tolist():
+        chunk = store.chunks[idx]
+        sentences = SENTENCE.findall(chunk.text)
+        if not sentences:
+            continue
+        # Results are identified by page and position, neighbours share text through the overlap
+        relevant = {(chunk.source, chunk.position + offset) for offset in (-1, 0, 1)}
+        queries.append((sentences[rng.integers(len(sentences))].strip(), relevant))
+        if len(queries) == count:
+            break
+    return queries
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--index", required=True, help="Base path of a saved VectorStore")
+    parser.add_argument("--model", default="intfloat/multilingual-e5-small")
+    parser.add_argument("--reranker", default="cross-encoder/mmarco-mMiniLMv2-L12-H384-v1")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--candidates", type=int, nargs="+", default=[10, 20, 40])
+    parser.add_argument("-k", type=int, default=5)
+    args = parser.parse_args()
+
+    store = VectorStore.from_path(args.index)
+    embedder = Embedder(model_name=args.model)
+    queries = make_queries(store, args.queries, np.random.default_rng(0))
+    embeddings = embedder.get_embeddings([query for query, _ in queries])
+    search = store.similarity_search_batch(embeddings, max(args.candidates))
+
+    def recall(found: list[list[dict]]) -> float:
+        return float(
+            np.mean(
+                [
+                    bool({(result["source"], result["position"]) for result in results} & relevant)
+                    for results, (_, relevant) in zip(found, queries)
+                ]
+            )
+        )
+
+    print(f"{len(queries)} queries, hit rate @{args.k} (any relevant chunk in the top {args.k})")
+    print(f"no re-ranking: {recall([results[: args.k] for results in search]):.3f}")
+    for candidates in args.candidates:
+        # A fresh re-ranker per run, so the score cache does not hide the model cost
+        reranker = Reranker(args.reranker, candidates=candidates, budget_ms=float("inf"))
+        reranker.rerank(queries[0][0], search[0][:candidates], args.k)
+        reranker._scores.clear()
+
+        latencies, found = [], []
+        for (query, _), results in zip(queries, search):
+            start = time.perf_counter()
+            found.append(reranker.rerank(query, results[:candidates], args.k))
+            latencies.append((time.perf_counter() - start) * 1000)
+        print(
+            f"re-rank top {candidates:3d}: {recall(found):.3f}, added latency "
+            f"p50 {np.percentile(latencies, 50):.1f}ms p95 {np.percentile(latencies, 95):.1f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
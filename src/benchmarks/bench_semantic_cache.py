@@ -0,0 +1,57 @@
+"""Replay a skewed stream of student questions through SemanticCache.
+
+Questions are drawn from a Zipf distribution over a pool of intents, and every
+ask is a paraphrase (the intent's embedding plus noise). Cache misses are charged
+a fixed completion latency, so the report shows hit rate, lookup cost and the
+resulting p50 / mean answer latency with and without the cache. Run with:
+    PYTHONPATH=src:src/app python -m benchmarks.bench_semantic_cache
+"""
+
+import argparse
+import time
+import numpy as np
+from app.semantic_cache import SemanticCache
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--intents", type=int, default=500)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--zipf", type=float, default=1.3)
+    parser.add_argument("--noise", type=float, default=0.15, help="Paraphrase noise relative to the embedding norm")
+    parser.add_argument("--threshold", type=float, default=0.95)
+    parser.add_argument("--completion-ms", type=float, default=3000.0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    intents = rng.standard_normal((args.intents, 384)).astype(np.float32)
+    intents /= np.linalg.norm(intents, axis=1, keepdims=True)
+    asked = (rng.zipf(args.zipf, args.requests) - 1) % args.intents
+
+    cache = SemanticCache(threshold=args.threshold, max_entries=args.intents)
+    latencies, lookups = [], []
+    for intent in asked:
+        question = intents[intent] + args.noise * rng.standard_normal(384).astype(np.float32) / np.sqrt(384)
+        start = time.perf_counter()
+        answer = cache.get(question, "v1")
+        lookup_ms = (time.perf_counter() - start) * 1000
+        lookups.append(lookup_ms)
+        if answer is None:
+            cache.put(f"intent {intent}", question, f"answer {intent}", "v1")
+            latencies.append(lookup_ms + args.completion_ms)
+        else:
+            latencies.append(lookup_ms)
+
+    print(
+        f"hit rate {cache.hit_rate:.1%}, lookup p50 {np.percentile(lookups, 50):.3f}ms "
+        f"p95 {np.percentile(lookups, 95):.3f}ms"
+    )
+    print(
+        f"answer latency without cache: p50 {args.completion_ms:.0f}ms; "
+        f"with cache: p50 {np.percentile(latencies, 50):.0f}ms, mean {np.mean(latencies):.0f}ms, "
+        f"LLM calls {args.requests - cache.stats['hits']} of {args.requests}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""Load-test the /search endpoint of the HTTP service with and without micro-batching.
+
+Starts the service with uvicorn in a separate process over a synthetic index, then fires
+--requests queries from --concurrency concurrent clients. Every batch size in
+--batch-sizes gets its own server, max batch size 1 is the unbatched baseline.
+Reports throughput, latency percentiles and the average batch size the server
+formed. Run with:
+    PYTHONPATH=src:src/app python -m benchmarks.bench_service
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import socket
+import time
+import aiohttp
+import httpx
+import numpy as np
+import uvicorn
+from app.embedder import Embedder
+from app.service import create_app
+from app.vector_store import VectorStore
+
+QUESTIONS = [
+    "Какой курс выбрать для старта в аналитике?",
+    "Чем отличается ML start от ML hard?",
+    "Где научиться писать SQL запросы?",
+    "Есть ли курс по A/B-тестам?",
+    "Что нужно знать для курса по инженерии данных?",
+    "Подойдет ли симулятор аналитика новичку?",
+    "Какой курс по Docker для начинающих?",
+    "Как перейти из аналитики в data science?",
+]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def load(url: str, requests: int, concurrency: int, k: int) -> tuple[float, list[float]]:
+    """Send requests from concurrent clients, returns wall time and per-request latencies"""
+    latencies = []
+    queue = iter(range(requests))
+
+    async def client(session: aiohttp.ClientSession):
+        for i in queue:
+            start = time.perf_counter()
+            query = f"{QUESTIONS[i % len(QUESTIONS)]} {i}"
+            async with session.post(f"{url}/search", json={"query": query, "k": k}) as response:
+                response.raise_for_status()
+                await response.read()
+            latencies.append(time.perf_counter() - start)
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        start = time.perf_counter()
+        await asyncio.gather(*(client(session) for _ in range(concurrency)))
+        return time.perf_counter() - start, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--model", default="intfloat/multilingual-e5-small")
+    parser.add_argument("--chunks", type=int, default=20_000)
+    parser.add_argument("--requests", type=int, default=512)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 32])
+    parser.add_argument("--max-wait-ms", type=float, default=5.0)
+    parser.add_argument("-k", type=int, default=5)
+    args = parser.parse_args()
+
+    embedder = Embedder(model_name=args.model)
+    dimension = embedder.get_embedding_dimension()
+    rng = np.random.default_rng(0)
+    embeddings = rng.standard_normal((args.chunks, dimension)).astype(np.float32)
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    store = VectorStore(dimension)
+    store.add_texts(
+        [f"Фрагмент {i} о курсе {QUESTIONS[i % len(QUESTIONS)]}" for i in range(args.chunks)], embeddings
+    )
+    # Warm up the model outside of the measurement
+    embedder.get_embeddings(QUESTIONS)
+
+    for max_batch_size in args.batch_sizes:
+        app = create_app(store, embedder, max_batch_size=max_batch_size, max_wait_ms=args.max_wait_ms)
+        port = free_port()
+        url = f"http://127.0.0.1:{port}"
+        # The server gets its own process (forked with the built index), so the load generator
+        # does not compete with it for the GIL
+        server = multiprocessing.get_context("fork").Process(
+            target=uvicorn.run, args=(app,), kwargs={"port": port, "log_level": "warning"}
+        )
+        server.start()
+        while True:
+            try:
+                httpx.get(f"{url}/health")
+                break
+            except httpx.ConnectError:
+                time.sleep(0.05)
+
+        elapsed, latencies = asyncio.run(load(url, args.requests, args.concurrency, args.k))
+        health = httpx.get(f"{url}/health").json()
+        print(
+            f"max batch {max_batch_size:3d}: {args.requests / elapsed:7.1f} req/s, "
+            f"p50 {np.percentile(latencies, 50) * 1000:7.1f}ms, p95 {np.percentile(latencies, 95) * 1000:7.1f}ms, "
+            f"avg batch {health['average_batch_size']:.1f}"
+        )
+        server.terminate()
+        server.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""Per-worker memory of several serving processes with private and shared index and model.
+
+Starts --workers processes that each load a synthetic flat store, embed a query and search
+it, then hold their memory until all of them were measured. Compared configurations:
+  private: store read into memory, model loaded by every worker (the previous behaviour)
+  mmap:    store memory-mapped (vectors from .vectors.npy, chunks from the chunk store)
+  shared:  store memory-mapped and queries embedded by one embedding server process
+RSS counts shared pages in every process, PSS (Linux) divides them between the processes
+that map them, so the sum of PSS is what the workers really cost. Run with:
+    PYTHONPATH=src:src/app python -m benchmarks.bench_shared_memory --workers 4
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+from app.embedder import Embedder
+from app.vector_store import VectorStore
+
+CHILD = """
+import json, sys
+from vector_store import VectorStore
+mode, path, model, address = sys.argv[1:]
+store = VectorStore.from_path(path, mmap=mode != "private")
+if address:
+    from embedding_server import RemoteEmbedder
+    embedder = RemoteEmbedder(address)
+else:
+    from embedder import Embedder
+    embedder = Embedder(model_name=model)
+embedding = embedder.get_embeddings(["query: курсы по аналитике данных"])
+store.similarity_search(embedding, k=5)
+memory = {}
+with open("/proc/self/smaps_rollup") as f:
+    for line in f:
+        name, _, value = line.partition(":")
+        if name in ("Rss", "Pss"):
+            memory[name.lower() + "_mb"] = int(value.split()[0]) / 1024
+print(json.dumps(memory), flush=True)
+sys.stdin.read()
+"""
+
+
+def measure(mode: str, path: str, model: str, address: str, workers: int, env: dict) -> list[dict]:
+    """Start the workers, wait until each of them searched once and read their memory"""
+    processes = [
+        subprocess.Popen(
+            [sys.executable, "-c", CHILD, mode, path, model, address],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            text=True,
+            env=env,
+        )
+        for _ in range(workers)
+    ]
+    # Every worker reports after its search and then waits, so all of them are alive when read
+    reports = [json.loads(process.stdout.readline()) for process in processes]
+    for process in processes:
+        process.stdin.close()
+        process.wait()
+    return reports
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--chunks", type=int, default=100_000)
+    parser.add_argument("--model", default="intfloat/multilingual-e5-small")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, "store")
+    rng = np.random.default_rng(0)
+    dimension = Embedder(model_name=args.model).get_embedding_dimension()
+    embeddings = rng.standard_normal((args.chunks, dimension)).astype(np.float32)
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    store = VectorStore(dimension)
+    store.add_texts([f"Фрагмент курса {i}: " + "текст " * 60 for i in range(args.chunks)], embeddings)
+    store.save(path)
+    del store, embeddings
+
+    app_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app")
+    env = {**os.environ, "PYTHONPATH": app_dir}
+    address = os.path.join(directory, "embedder.sock")
+    server = subprocess.Popen(
+        [sys.executable, "-m", "embedding_server", "--address", address, "--model", args.model],
+        env=env,
+        stdout=subprocess.DEVNULL,
+    )
+    try:
+        while not os.path.exists(address):
+            if server.poll() is not None:
+                raise RuntimeError("Embedding server exited")
+            time.sleep(0.1)
+
+        print(f"{args.workers} workers, {args.chunks} chunks, vectors {args.chunks * dimension * 4 / 2**20:.0f} MB")
+        print(f"{'mode':<8}{'RSS/worker':>12}{'PSS/worker':>12}{'PSS total':>11}")
+        for mode in ("private", "mmap", "shared"):
+            reports = measure(
+                mode, path, args.model, address if mode == "shared" else "", args.workers, env
+            )
+            rss = np.mean([report["rss_mb"] for report in reports])
+            pss = [report["pss_mb"] for report in reports]
+            print(f"{mode:<8}{rss:>10.0f}MB{np.mean(pss):>10.0f}MB{sum(pss):>9.0f}MB")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    main()
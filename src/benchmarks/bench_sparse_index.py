@@ -0,0 +1,75 @@
+"""Measure BM25 build time and query latency, and the overhead of hybrid search over dense search.
+
+A synthetic corpus of Russian course descriptions with random embeddings is
+indexed, then dense, sparse and hybrid (RRF-fused) searches are timed per query.
+Run with:
+    PYTHONPATH=src:src/app python -m benchmarks.bench_sparse_index
+"""
+
+import argparse
+import time
+import numpy as np
+from app.chunk_store import Chunk
+from app.vector_store import VectorStore
+
+WORDS = (
+    "курс аналитика данных инженер python sql docker kubernetes статистика a/b-тесты "
+    "машинное обучение симулятор задачи проект ментор карьера hadoop spark airflow "
+    "визуализация дашборды продуктовая метрики программа обучения стоимость рассрочка"
+).split()
+QUERIES = [
+    "Есть ли курс по Docker?",
+    "Сколько стоит обучение аналитике данных",
+    "симулятор SQL для начинающих",
+    "Где изучить A/B-тесты и статистику",
+    "airflow и spark для инженеров данных",
+]
+
+
+def timed(search, runs: int) -> list[float]:
+    """Run search for every query runs times and return latencies in milliseconds"""
+    latencies = []
+    for _ in range(runs):
+        for i, query in enumerate(QUERIES):
+            start = time.perf_counter()
+            search(i, query)
+            latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--chunks", type=int, default=5000)
+    parser.add_argument("--runs", type=int, default=50)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    chunks = [
+        Chunk(" ".join(rng.choice(WORDS, 60)), f"https://karpov.courses/course-{i % 50}", f"Курс {i % 50}", i)
+        for i in range(args.chunks)
+    ]
+    embeddings = rng.standard_normal((args.chunks, 384)).astype(np.float32)
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    queries = rng.standard_normal((len(QUERIES), 384)).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+    store = VectorStore(384)
+    store.add_chunks(chunks, embeddings)
+    start = time.perf_counter()
+    store.sparse_index
+    print(f"BM25 build over {args.chunks} chunks: {time.perf_counter() - start:.2f}s")
+
+    for name, search in (
+        ("dense", lambda i, query: store.similarity_search(queries[i], k=5)),
+        ("sparse", lambda i, query: store.sparse_index.search(query, k=20)),
+        ("hybrid", lambda i, query: store.hybrid_search(queries[i], query, k=5)),
+    ):
+        latencies = timed(search, args.runs)
+        print(
+            f"{name:>6}: p50 {np.percentile(latencies, 50):.3f}ms, "
+            f"p95 {np.percentile(latencies, 95):.3f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Measure import time, time-to-ready and peak RSS of the app's startup path.
+
+Every measurement runs in a fresh interpreter so that module caches do not
+hide import cost. A synthetic vector store is saved to a temporary directory
+and loaded the same way app.py does. Run with:
+    PYTHONPATH=src:src/app python -m benchmarks.bench_startup
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import numpy as np
+from app.vector_store import VectorStore
+
+CHILD = """
+import json, resource, sys, time
+start = time.perf_counter()
+from course_advisor import CourseAdvisor
+from vector_store import VectorStore
+from embedder import Embedder
+imported = time.perf_counter()
+vectorstore = VectorStore.from_path(sys.argv[1])
+advisor = CourseAdvisor(vectorstore=vectorstore, embedder=Embedder())
+ready = time.perf_counter()
+first_query = None
+if sys.argv[2] == "1":
+    advisor.retrieve_context("Какие курсы подойдут для начинающего аналитика данных?")
+    first_query = time.perf_counter() - ready
+print(json.dumps({
+    "import_s": imported - start,
+    "ready_s": ready - start,
+    "first_query_s": first_query,
+    "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "heavy_modules": sorted({"torch", "sentence_transformers", "openai", "langchain_community"} & set(sys.modules)),
+}))
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--chunks", type=int, default=5000)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--query", action="store_true", help="Also time the first query (loads the model)")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, "store")
+    rng = np.random.default_rng(0)
+    embeddings = rng.standard_normal((args.chunks, 384)).astype(np.float32)
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    store = VectorStore(384)
+    store.add_texts([f"Page content:\nchunk {i}" * 20 for i in range(args.chunks)], embeddings)
+    store.save(path)
+
+    app_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app")
+    env = {**os.environ, "PYTHONPATH": app_dir}
+    for run in range(args.runs):
+        output = subprocess.run(
+            [sys.executable, "-c", CHILD, path, "1" if args.query else "0"],
+            capture_output=True,
+            text=True,
+            check=True,
+            env=env,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        first_query = (
+            f", first query {result['first_query_s']:.2f}s" if result["first_query_s"] else ""
+        )
+        print(
+            f"run {run + 1}: import {result['import_s']:.2f}s, ready {result['ready_s']:.2f}s"
+            f"{first_query}, peak RSS {result['peak_rss_mb']:.0f}MB, "
+            f"heavy modules loaded: {result['heavy_modules'] or 'none'}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Recall@k, query latency and memory of approximate VectorStore indexes against exact Flat search.
+
+Vectors are drawn from a mixture of Gaussians and L2-normalized, which is closer
+to real sentence embeddings than uniform noise. The index size is what a process keeps
+in memory, compressed kinds with re-scoring also keep float32 vectors on disk, of which
+loaded stores memory-map only the pages of re-scored candidates. Run with:
+    PYTHONPATH=src:src/app python -m benchmarks.bench_vector_store
+"""
+
+import argparse
+import time
+import faiss
+import numpy as np
+from app.vector_store import IndexSpec, VectorStore
+
+
+def make_vectors(n: int, dimension: int, clusters: int, rng: np.random.Generator) -> np.ndarray:
+    """Sample L2-normalized vectors around random cluster centers"""
+    centers = rng.standard_normal((clusters, dimension))
+    vectors = centers[rng.integers(0, clusters, n)] + 0.6 * rng.standard_normal((n, dimension))
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors.astype(np.float32)
+
+
+def evaluate(store: VectorStore, queries: np.ndarray, truth: np.ndarray, k: int) -> dict[str, float]:
+    """Measure single-query and batched latency and recall@k against ground truth IDs"""
+    latencies = []
+    found = []
+    for query in queries:
+        start = time.perf_counter()
+        _, ids = store.search_batch(query.reshape(1, -1), k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        found.append(ids[0])
+    start = time.perf_counter()
+    store.search_batch(queries, k)
+    batch_ms = (time.perf_counter() - start) * 1000 / len(queries)
+    recall = np.mean([len(set(f) & set(t)) / k for f, t in zip(found, truth)])
+    exact = store.exact_vectors.ntotal if store.exact_vectors is not None else 0
+    return {
+        "recall": float(recall),
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+        "batch_ms": batch_ms,
+        "size_mb": faiss.serialize_index(store.index).nbytes / 2**20,
+        "exact_mb": exact * store.dimension * 4 / 2**20,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--vectors", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--dimension", type=int, default=384)
+    parser.add_argument("--k", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    vectors = make_vectors(args.vectors + args.queries, args.dimension, 200, rng)
+    corpus, queries = vectors[: args.vectors], vectors[args.vectors :]
+    texts = [str(i) for i in range(len(corpus))]
+    nlist = int(4 * np.sqrt(args.vectors))
+
+    configs = [
+        ("flat", IndexSpec(), {}),
+        *[(f"hnsw ef={ef}", IndexSpec(kind="hnsw"), {"ef_search": ef}) for ef in (16, 64, 128)],
+        *[(f"ivf nprobe={p}", IndexSpec(kind="ivf", nlist=nlist), {"nprobe": p}) for p in (1, 8, 32)],
+        *[
+            (f"ivfpq nprobe={p}", IndexSpec(kind="ivfpq", nlist=nlist, pq_m=48), {"nprobe": p})
+            for p in (8, 32)
+        ],
+        # Compressed kinds keep exact vectors, searched with and without re-scoring
+        *[
+            (f"{kind} rescore={r}", IndexSpec(kind=kind, pq_m=48, rescore=4), {"rescore": r})
+            for kind in ("fp16", "sq8", "pq")
+            for r in (0, 4, 16)
+        ],
+    ]
+
+    truth = None
+    built = {}
+    for name, spec, search_params in configs:
+        key = spec.factory_string()
+        if key not in built:
+            start = time.perf_counter()
+            store = VectorStore(args.dimension, index_spec=spec)
+            store.add_texts(texts, corpus)
+            built[key] = (store, time.perf_counter() - start)
+        store, build_seconds = built[key]
+        store.configure_search(**search_params)
+
+        if truth is None:
+            _, truth = store.search_batch(queries, args.k)
+        result = evaluate(store, queries, truth, args.k)
+        print(
+            f"{name:>18}: recall@{args.k} {result['recall']:.3f}, "
+            f"p50 {result['p50_ms']:.3f}ms p95 {result['p95_ms']:.3f}ms, "
+            f"batched {result['batch_ms']:.3f}ms/query, "
+            f"build {build_seconds:.1f}s, index {result['size_mb']:.1f}MB, "
+            f"exact vectors {result['exact_mb']:.1f}MB"
+        )
+
+
+if __name__ == "__main__":
+    main()
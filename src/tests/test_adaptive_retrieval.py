@@ -0,0 +1,35 @@
+from app.adaptive_retrieval import AdaptiveK
+
+
+def results(scores: list[float | None], hybrid: bool = False) -> list[dict]:
+    if hybrid:
+        return [{"chunk": str(i), "score": 1 / (61 + i), "dense_score": score} for i, score in enumerate(scores)]
+    return [{"chunk": str(i), "score": score} for i, score in enumerate(scores)]
+
+
+def test_cutoffs():
+    """Test min score cutoff, elbow detection and the off-topic floor"""
+    adaptive = AdaptiveK(min_k=1, max_k=10, min_score=0.82, relevance_floor=0.78)
+
+    # Scores flat above min_score: all are kept up to max_k
+    assert len(adaptive.select(results([0.9, 0.89, 0.89, 0.88, 0.88, 0.87]))) == 6
+    # Sharp drop after the second result
+    assert len(adaptive.select(results([0.91, 0.9, 0.84, 0.835, 0.83]))) == 2
+    # Only results above min_score, but never fewer than min_k
+    assert len(adaptive.select(results([0.85, 0.84, 0.81, 0.80]))) == 2
+    assert len(adaptive.select(results([0.8, 0.79]))) == 1
+    # Nothing reaches the relevance floor
+    assert adaptive.select(results([0.77, 0.76, 0.75])) == []
+    assert adaptive.select([]) == []
+
+
+def test_hybrid_results():
+    """Test that hybrid results are cut by dense scores, keeping their fused order"""
+    adaptive = AdaptiveK(min_score=0.82, relevance_floor=0.78)
+    # A result without a similarity is kept by its rank
+    hybrid = results([0.86, None, 0.85, 0.7], hybrid=True)
+    assert [result["chunk"] for result in adaptive.select(hybrid)] == ["0", "1", "2"]
+    # The fused leader with a weak dense score is dropped, not the second best dense match
+    hybrid = results([0.8, 0.9, 0.89], hybrid=True)
+    assert [result["chunk"] for result in adaptive.select(hybrid)] == ["1", "2"]
+    assert adaptive.select(results([None, 0.7], hybrid=True)) == []
@@ -0,0 +1,73 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+import httpx
+import numpy as np
+import openai
+from app.async_course_advisor import AsyncCourseAdvisor
+from app.vector_store import VectorStore
+
+
+class FakeEmbedder:
+    """Embedder stand-in returning the same unit vector for every text"""
+
+    def get_embeddings(self, texts: list[str]) -> np.ndarray:
+        embedding = np.zeros((len(texts), 384), dtype=np.float32)
+        embedding[:, 0] = 1.0
+        return embedding
+
+
+class FakeCompletions:
+    """Chat completions stand-in that tracks concurrency and fails the first calls with 429"""
+
+    def __init__(self, failures: int = 0):
+        self.failures = failures
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def create(self, **kwargs):
+        if self.failures:
+            self.failures -= 1
+            response = httpx.Response(429, request=httpx.Request("POST", "https://llm/chat"))
+            raise openai.RateLimitError("Rate limited", response=response, body=None)
+
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.01)
+        self.in_flight -= 1
+        message = SimpleNamespace(content="Начните с аналитики")
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+
+def make_advisor(completions: FakeCompletions, **kwargs) -> AsyncCourseAdvisor:
+    store = VectorStore(384)
+    store.add_texts(["Курс по аналитике"], FakeEmbedder().get_embeddings(["Курс по аналитике"]))
+    advisor = AsyncCourseAdvisor(store, FakeEmbedder(), backoff=0.001, **kwargs)
+    advisor._create_async_client = lambda: SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    return advisor
+
+
+def test_concurrency_limit_and_retries():
+    """Test that in-flight LLM calls are capped and rate limited calls are retried"""
+    completions = FakeCompletions(failures=2)
+    advisor = make_advisor(completions, max_concurrent_requests=3)
+
+    async def ask_all():
+        return await asyncio.gather(*(advisor.aprocess_query(f"Вопрос {i}") for i in range(10)))
+
+    assert asyncio.run(ask_all()) == ["Начните с аналитики"] * 10
+    assert completions.max_in_flight == 3
+    assert advisor.stats["retries"] == 2 and advisor.stats["failed"] == 0
+
+
+def test_sync_calls_share_background_loop():
+    """Test that sync callers from several threads are served by the background event loop"""
+    completions = FakeCompletions()
+    advisor = make_advisor(completions)
+    try:
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            with_threads = list(pool.map(advisor.process_query, ["Вопрос"] * 4))
+        assert with_threads == ["Начните с аналитики"] * 4
+        assert len(advisor._loop_state) == 1
+    finally:
+        advisor.close()
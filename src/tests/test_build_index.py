@@ -0,0 +1,184 @@
+import numpy as np
+import pytest
+from app.build_index import IndexBuilder
+from app.crawler import Page
+from app.deduplicator import ChunkDeduplicator
+from app.index_repository import IndexRepository
+from app.vector_store import VectorStore
+from app.web_page_processor import WebPageProcessor
+from tests.test_index_refresh import CountingEmbedder
+
+
+class FakeCrawler:
+    """Crawler stand-in yielding pages with the given body text, other URLs fail"""
+
+    def __init__(self, bodies: dict[str, str]):
+        self.bodies = bodies
+
+    async def crawl(self, urls: list[str], cache=None, failed: list[str] | None = None):
+        for url in urls:
+            if url not in self.bodies:
+                if failed is not None:
+                    failed.append(url)
+                continue
+            yield Page(url=url, html=self.html(url, self.bodies[url]), status=200)
+
+    @staticmethod
+    def html(url: str, body: str) -> str:
+        return f"<html><head><title>{url}</title></head><body>{body}</body></html>"
+
+
+def paragraphs(topic: str, count: int) -> str:
+    return "\n\n".join(f"{topic} урок {i}: " + "практика " * 8 for i in range(count))
+
+
+def build(store: VectorStore, embedder: CountingEmbedder, bodies: dict[str, str], workers: int) -> IndexBuilder:
+    processor = WebPageProcessor(chunk_size=100, chunk_overlap=0, crawler=FakeCrawler(bodies))
+    builder = IndexBuilder(store, embedder, processor, workers=workers, batch_size=4, queue_size=2)
+    builder.build(list(bodies))
+    return builder
+
+
+def test_pipeline_matches_serial_split():
+    """Test that the pipeline indexes every chunk of every page and reports stage stats"""
+    bodies = {
+        "https://karpov.courses/analytics": paragraphs("SQL", 6),
+        "https://karpov.courses/docker": paragraphs("Docker", 5),
+    }
+    store, embedder = VectorStore(384), CountingEmbedder()
+    builder = build(store, embedder, bodies, workers=2)
+
+    processor = WebPageProcessor(chunk_size=100, chunk_overlap=0)
+    expected = sorted(
+        chunk.text
+        for url, body in bodies.items()
+        for chunk in processor.split_page(Page(url, FakeCrawler.html(url, body), 200))
+    )
+    assert sorted(chunk.text for chunk in store.chunks.values()) == expected
+    assert builder.stats["pages"] == 2 and builder.stats["added"] == len(expected) == store.index.ntotal
+    assert builder.stages["embed"].items == len(expected)
+    assert "append" in builder.report()
+
+
+def test_pipeline_refreshes_existing_store():
+    """Test that a rebuild embeds only changed chunks and removes chunks of vanished pages"""
+    bodies = {
+        "https://karpov.courses/analytics": paragraphs("SQL", 4),
+        "https://karpov.courses/docker": paragraphs("Docker", 3),
+    }
+    store, embedder = VectorStore(384), CountingEmbedder()
+    build(store, embedder, bodies, workers=0)
+    embedded = embedder.embedded
+    docker = sum(chunk.source.endswith("docker") for chunk in store.chunks.values())
+    analytics = store.index.ntotal - docker
+
+    bodies = {"https://karpov.courses/analytics": paragraphs("SQL", 5)}
+    builder = build(store, embedder, bodies, workers=0)
+    assert embedder.embedded - embedded == builder.stats["added"] == 1
+    assert builder.stats["reused"] == analytics and builder.stats["removed"] == docker
+    assert {chunk.source for chunk in store.chunks.values()} == {"https://karpov.courses/analytics"}
+    assert np.array_equal(sorted(store.chunks), sorted(store.fingerprints.values()))
+
+
+class FailingEmbedder(CountingEmbedder):
+    """Embedder that fails after embedding a number of texts, like a killed build"""
+
+    def __init__(self, fail_after: int):
+        super().__init__()
+        self.fail_after = fail_after
+
+    def get_embeddings(self, texts: list[str]) -> np.ndarray:
+        if self.embedded + len(texts) > self.fail_after:
+            raise RuntimeError("Build interrupted")
+        return super().get_embeddings(texts)
+
+
+def test_interrupted_build_resumes(tmp_path):
+    """Test that a build resumes from its checkpoint and publishes the complete store"""
+    bodies = {f"https://karpov.courses/course-{i}": paragraphs(f"Курс {i}", 3) for i in range(6)}
+    repository = IndexRepository(str(tmp_path / "index"))
+    processor = WebPageProcessor(chunk_size=100, chunk_overlap=0, crawler=FakeCrawler(bodies))
+
+    builder = IndexBuilder(
+        VectorStore(384), FailingEmbedder(12), processor, workers=0, batch_size=4,
+        repository=repository, checkpoint_every=4,
+    )
+    with pytest.raises(RuntimeError):
+        builder.build(list(bodies))
+    assert repository.current_version() is None and builder.stats["checkpoints"] > 0
+
+    embedder = CountingEmbedder()
+    builder = IndexBuilder(
+        VectorStore(384), embedder, processor, workers=0, batch_size=4, repository=repository
+    )
+    builder.build(list(bodies))
+    assert builder.stats["resumed"] > 0
+    assert builder.published_version == repository.current_version()
+
+    store = repository.load()
+    total = store.index.ntotal
+    assert embedder.embedded < total and builder.stats["added"] == embedder.embedded
+    assert {chunk.source for chunk in store.chunks.values()} == set(bodies)
+    assert repository.load_checkpoint(VectorStore(384), **builder.metadata) is None
+
+
+def test_failed_pages_are_kept_and_not_published(tmp_path):
+    """Test that chunks of pages that failed to fetch are kept and such a build is not published"""
+    bodies = {
+        "https://karpov.courses/analytics": paragraphs("SQL", 3),
+        "https://karpov.courses/docker": paragraphs("Docker", 3),
+    }
+    repository = IndexRepository(str(tmp_path / "index"))
+    urls = list(bodies)
+
+    def build_with(bodies: dict[str, str], **kwargs) -> IndexBuilder:
+        store = repository.load() if repository.current_version() else VectorStore(384)
+        processor = WebPageProcessor(chunk_size=100, chunk_overlap=0, crawler=FakeCrawler(bodies))
+        builder = IndexBuilder(store, CountingEmbedder(), processor, workers=0, repository=repository, **kwargs)
+        builder.build(urls)
+        return builder
+
+    first = build_with(bodies).published_version
+    docker = {chunk.text for chunk in repository.load().chunks.values() if chunk.source.endswith("docker")}
+
+    # The docker page fails to fetch: its chunks stay and the build is only checkpointed
+    builder = build_with({"https://karpov.courses/analytics": paragraphs("SQL", 4)})
+    assert builder.stats["failed"] == 1 and builder.stats["removed"] == 0
+    assert builder.published_version is None and repository.current_version() == first
+    assert docker <= {chunk.text for chunk in builder.vectorstore.chunks.values()}
+
+    builder = build_with({"https://karpov.courses/analytics": paragraphs("SQL", 4)}, allow_partial=True)
+    assert builder.published_version == repository.current_version() != first
+    assert docker <= {chunk.text for chunk in repository.load().chunks.values()}
+
+
+def test_deduplicated_chunks_are_not_embedded_again(tmp_path):
+    """Test that chunks dropped as boilerplate are not re-embedded by the next build"""
+    footer = "Подписывайтесь на наш телеграм канал и читайте блог школы каждый день"
+    bodies = {
+        f"https://karpov.courses/{name}": " ".join(f"{name}{i}" for i in range(12)) + "\n\n" + footer
+        for name in ("analytics", "docker", "python", "statistics")
+    }
+    repository = IndexRepository(str(tmp_path / "index"))
+
+    def build_with(bodies: dict[str, str]) -> tuple[IndexBuilder, CountingEmbedder]:
+        store = repository.load() if repository.current_version() else VectorStore(384)
+        processor = WebPageProcessor(
+            chunk_size=100, chunk_overlap=0, crawler=FakeCrawler(bodies), deduplicator=ChunkDeduplicator()
+        )
+        embedder = CountingEmbedder()
+        builder = IndexBuilder(store, embedder, processor, workers=0, repository=repository)
+        builder.build(list(bodies))
+        return builder, embedder
+
+    build_with(bodies)
+    assert not any(footer in chunk.text for chunk in repository.load().chunks.values())
+
+    builder, embedder = build_with(bodies)
+    assert embedder.embedded == 0 and builder.stats["added"] == 0 and builder.stats["removed"] == 0
+
+    # On two pages only the footer is no longer site chrome, its first copy is embedded now
+    bodies = {url: body for url, body in list(bodies.items())[:2]}
+    builder, embedder = build_with(bodies)
+    assert embedder.embedded == builder.stats["added"] == 1
+    assert sum(footer in chunk.text for chunk in repository.load().chunks.values()) == 1
@@ -0,0 +1,59 @@
+import json
+import numpy as np
+from app.chunk_store import Chunk, ChunkStore, format_chunk
+
+
+def test_round_trip(tmp_path):
+    """Test that chunks, IDs and fingerprints survive writing and memory-mapped reading"""
+    chunks = {
+        3: Chunk("Первый фрагмент", "https://example.com/sql", "Курс SQL", 0, "Программа"),
+        7: Chunk("Второй фрагмент\n", "https://example.com/sql", "Курс SQL", 1),
+        9: Chunk("Text without the page header"),
+    }
+    path = str(tmp_path / "store.chunks")
+    ChunkStore.write(path, chunks, {3: "a" * 64, 9: "b" * 64})
+
+    for mmap in (True, False):
+        store = ChunkStore(path, mmap=mmap)
+        assert list(store) == [3, 7, 9]
+        assert dict(store.items()) == chunks
+        assert 7 in store and 4 not in store
+        assert store.fingerprints() == {"a" * 64: 3, "b" * 64: 9}
+        # Both chunks of the page share one entry of the page table
+        assert store.pages == [("Курс SQL", "https://example.com/sql")]
+        assert store.ids_from_sources(["*/sql"]).tolist() == [3, 7]
+
+
+def test_chunk_from_text():
+    """Test that formatted chunk text is split into header fields and formatted back unchanged"""
+    text = format_chunk("Курс SQL", "https://example.com/sql", "Page content:\nфрагмент")
+    chunk = Chunk.from_text(text)
+    assert (chunk.title, chunk.source) == ("Курс SQL", "https://example.com/sql")
+    assert chunk.formatted == text
+    assert Chunk.from_text("plain text").formatted == "plain text"
+
+
+def test_read_first_format(tmp_path):
+    """Test that stores written in the CHUNKS01 format (no positions and sections) stay readable"""
+    contents = ["Первый фрагмент".encode("utf-8"), b"Text without the page header"]
+    header = json.dumps({"count": 2, "blob_size": sum(map(len, contents)), "pages": [["Курс SQL", "https://a"]]})
+    header = header.encode("utf-8")
+    header += b" " * (-len(header) % 8)
+    arrays = [
+        np.array([3, 9], dtype=np.int64),
+        np.array([0, len(contents[0]), len(contents[0]) + len(contents[1])], dtype=np.int64),
+        np.array([0, -1], dtype=np.int32),
+        np.array([b"a" * 64, b""], dtype="S64"),
+    ]
+    path = tmp_path / "store.chunks"
+    with open(path, "wb") as f:
+        f.write(b"CHUNKS01" + np.uint64(len(header)).tobytes() + header)
+        for array in arrays:
+            data = array.tobytes()
+            f.write(data + b"\0" * (-len(data) % 8))
+        f.write(b"".join(contents))
+
+    store = ChunkStore(str(path))
+    assert store[3] == Chunk("Первый фрагмент", "https://a", "Курс SQL", 0, None)
+    assert store[9] == Chunk("Text without the page header")
+    assert store.fingerprints() == {"a" * 64: 3}
@@ -0,0 +1,58 @@
+from app.chunk_store import Chunk, format_chunk
+from app.context_builder import ContextBuilder
+
+PAGE = "https://karpov.courses/analytics"
+TEXTS = [
+    "Курс учит SQL, Python и статистике для аналитиков с нуля",
+    "статистике для аналитиков с нуля. Выпускники строят дашборды",
+    "Стоимость обучения зависит от тарифа",
+]
+
+
+def word_count(text: str) -> int:
+    return len(text.split())
+
+
+def result(text: str, position: int, score: float, source: str | None = PAGE) -> dict:
+    chunk = Chunk(text=text, source=source, title="Аналитик данных", position=position)
+    return {
+        "chunk": chunk.formatted,
+        "text": text,
+        "score": score,
+        "source": source,
+        "title": chunk.title,
+        "position": position,
+    }
+
+
+def test_merges_overlap_and_headers():
+    """Test that chunks of a page get one header and the overlap of neighbours is printed once"""
+    builder = ContextBuilder(max_tokens=1000, token_counter=word_count, min_overlap=10)
+    results = [result(TEXTS[1], 1, 0.9), result(TEXTS[0], 0, 0.8), result(TEXTS[2], 5, 0.7)]
+
+    context = builder.build(results)
+    body = (
+        "Курс учит SQL, Python и статистике для аналитиков с нуля. Выпускники строят дашборды"
+        f"\n...\n{TEXTS[2]}"
+    )
+    assert context.text == format_chunk("Аналитик данных", PAGE, body)
+    assert context.text.count("Page source:") == 1
+    assert context.chunks == 3
+    assert context.saved_tokens == word_count("\n".join(r["chunk"] for r in results)) - context.tokens > 0
+
+
+def test_token_budget():
+    """Test that results are added by score while they fit and shorter lower ranked ones still fill the budget"""
+    long_text = " ".join(["слово"] * 50)
+    results = [
+        result(TEXTS[0], 0, 0.9),
+        result(long_text, 3, 0.8, source="https://karpov.courses/docker"),
+        result("Курс по SQL", 0, 0.7, source=None),
+    ]
+    builder = ContextBuilder(max_tokens=30, token_counter=word_count)
+
+    context = builder.build(results)
+    assert context.tokens <= 30 and context.chunks == 2
+    assert TEXTS[0] in context.text and "Курс по SQL" in context.text
+    assert "docker" not in context.text
+    assert ContextBuilder(max_tokens=1, token_counter=word_count).build(results).text == ""
@@ -1,8 +1,13 @@
+import asyncio
+from types import SimpleNamespace
+import numpy as np
+from app.adaptive_retrieval import AdaptiveK
 from app.course_advisor import CourseAdvisor
+from app.semantic_cache import SemanticCache
 from app.web_page_processor import WebPageProcessor
 from app.vector_store import VectorStore
 from app.embedder import Embedder
-from app.config import COURSE_URLS
+from app.config import COURSE_URLS, OFF_TOPIC_ANSWER
 from tests.constants import TEST_QUESTION, TEST_ANSWER
 from dotenv import load_dotenv
 
@@ -35,3 +40,107 @@ def test_course_advisor_response():
     assert (
         response.strip() == TEST_ANSWER.strip()
     ), f"Expected answer:\n{TEST_ANSWER}\n\nGot:\n{response}"
+
+
+class FakeEmbedder:
+    """Embedder stand-in returning the same unit vector for every text"""
+
+    def get_embeddings(self, texts: list[str]) -> np.ndarray:
+        embedding = np.zeros((len(texts), 384), dtype=np.float32)
+        embedding[:, 0] = 1.0
+        return embedding
+
+
+def fake_chunks(deltas: list[str]) -> list[SimpleNamespace]:
+    """Streaming chat completion chunks with the given content deltas"""
+    return [
+        SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=delta))])
+        for delta in deltas
+    ]
+
+
+class FakeAsyncStream:
+    def __init__(self, chunks: list[SimpleNamespace]):
+        self.chunks = iter(chunks)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self.chunks)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+def test_stream_query():
+    """Test that answers are streamed as deltas with timings, and cached answers are returned whole"""
+    store = VectorStore(384)
+    store.add_texts(["Курс по аналитике"], FakeEmbedder().get_embeddings(["Курс по аналитике"]))
+    advisor = CourseAdvisor(store, FakeEmbedder(), cache=SemanticCache())
+
+    requests = []
+
+    def create(**kwargs):
+        requests.append(kwargs)
+        return iter(fake_chunks(["Начните ", None, "с аналитики"]))
+
+    async def acreate(**kwargs):
+        return FakeAsyncStream(fake_chunks(["Начните ", "с аналитики"]))
+
+    advisor._client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    advisor._async_client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=acreate)))
+
+    timings = {}
+    assert list(advisor.stream_query("С чего начать?", timings=timings)) == ["Начните ", "с аналитики"]
+    assert requests[0]["stream"] is True
+    assert "Курс по аналитике" in requests[0]["messages"][0]["content"]
+    assert 0 < timings["ttft_s"] <= timings["total_s"] and not timings["cached"]
+
+    # The same question is answered from the cache in one piece
+    assert list(advisor.stream_query("С чего начать?", timings=timings)) == ["Начните с аналитики"]
+    assert timings["cached"] and len(requests) == 1
+
+    async def collect():
+        advisor.cache = None
+        return [delta async for delta in advisor.astream_query("С чего начать?", timings=timings)]
+
+    assert asyncio.run(collect()) == ["Начните ", "с аналитики"]
+    assert not timings["cached"] and timings["ttft_s"] <= timings["total_s"]
+
+
+def test_failed_stream_is_not_cached():
+    """Test that an answer whose stream broke off midway is flagged and not cached"""
+    store = VectorStore(384)
+    store.add_texts(["Курс по аналитике"], FakeEmbedder().get_embeddings(["Курс по аналитике"]))
+    advisor = CourseAdvisor(store, FakeEmbedder(), cache=SemanticCache())
+
+    def create(**kwargs):
+        yield from fake_chunks(["Начните "])
+        raise ConnectionError("stream closed")
+
+    advisor._client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+
+    timings = {}
+    assert list(advisor.stream_query("С чего начать?", timings=timings)) == ["Начните "]
+    assert timings["failed"] and "total_s" in timings
+    assert advisor.cache.get(FakeEmbedder().get_embeddings(["С чего начать?"])) is None
+
+
+def test_off_topic_fast_path():
+    """Test that questions without relevant chunks are refused without calling the LLM"""
+    store = VectorStore(384)
+    unrelated = np.zeros((1, 384), dtype=np.float32)
+    unrelated[0, 1] = 1.0
+    store.add_texts(["Курс по аналитике"], unrelated)
+    advisor = CourseAdvisor(store, FakeEmbedder(), adaptive_k=AdaptiveK())
+
+    def create(**kwargs):
+        raise AssertionError("LLM must not be called for off-topic questions")
+
+    advisor._client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    assert advisor.process_query("Какая завтра погода?") == OFF_TOPIC_ANSWER
+
+    timings = {}
+    assert list(advisor.stream_query("Какая завтра погода?", timings=timings)) == [OFF_TOPIC_ANSWER]
+    assert timings["off_topic"] and advisor.context_stats["off_topic"] == 2
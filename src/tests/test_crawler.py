@@ -0,0 +1,87 @@
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from app.crawler import AsyncCrawler
+from app.web_page_processor import WebPageProcessor
+
+
+class FlakyHandler(BaseHTTPRequestHandler):
+    """Serves a tiny course page, failing the first request to /flaky with 503"""
+
+    failed_once = False
+
+    def do_GET(self):
+        if self.path == "/missing":
+            self.send_response(404)
+            self.end_headers()
+            self.wfile.write(b"<html><body>Page not found</body></html>")
+            return
+        if self.path == "/flaky" and not FlakyHandler.failed_once:
+            FlakyHandler.failed_once = True
+            self.send_response(503)
+            self.end_headers()
+            return
+        body = f"<html><head><title>Course {self.path}</title></head><body>About {self.path}</body></html>"
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.end_headers()
+        self.wfile.write(body.encode("utf-8"))
+
+    def log_message(self, *args):
+        pass
+
+
+def start_server() -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FlakyHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+async def crawl(crawler: AsyncCrawler, urls: list[str], failed: list[str] | None = None) -> list:
+    return [page async for page in crawler.crawl(urls, failed=failed)]
+
+
+def test_crawl_retries_failed_pages():
+    """Test that crawler yields every page and retries transient 503 errors"""
+    server = start_server()
+    try:
+        base = f"http://127.0.0.1:{server.server_port}"
+        urls = [f"{base}/analytics", f"{base}/flaky", f"{base}/docker"]
+        crawler = AsyncCrawler(backoff=0.01)
+        pages = asyncio.run(crawl(crawler, urls))
+
+        assert sorted(page.url for page in pages) == sorted(urls)
+        assert all(page.status == 200 for page in pages)
+    finally:
+        server.shutdown()
+
+
+def test_crawler_mode_chunks():
+    """Test that crawler mode produces chunks in the same format and order as input URLs"""
+    server = start_server()
+    try:
+        base = f"http://127.0.0.1:{server.server_port}"
+        urls = [f"{base}/analytics", f"{base}/docker"]
+        processor = WebPageProcessor(crawler=AsyncCrawler())
+        chunks = processor.process_urls(urls)
+
+        assert len(chunks) == 2
+        assert chunks[0].startswith(f"Page name:\nCourse /analytics\nPage source:\n{urls[0]}\n")
+        assert "About /docker" in chunks[1]
+    finally:
+        server.shutdown()
+
+
+def test_crawl_skips_error_pages():
+    """Test that error statuses are not retried or yielded and are reported as failed"""
+    server = start_server()
+    try:
+        base = f"http://127.0.0.1:{server.server_port}"
+        urls = [f"{base}/analytics", f"{base}/missing"]
+        failed = []
+        pages = asyncio.run(crawl(AsyncCrawler(backoff=0.01), urls, failed))
+
+        assert [page.url for page in pages] == [urls[0]]
+        assert failed == [urls[1]]
+    finally:
+        server.shutdown()
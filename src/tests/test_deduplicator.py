@@ -0,0 +1,39 @@
+from app.deduplicator import ChunkDeduplicator
+
+MENU = "Специализации Симуляторы Программы с вузами Бесплатно Центр карьеры Аналитик данных Hard Аналитика Инженер данных"
+
+
+def make_chunk(url: str, content: str) -> str:
+    return f"Page name:\nКурс\nPage source:\n{url}\nPage content:\n{content}\n"
+
+
+def test_drops_site_chrome_and_duplicates():
+    """Test that menu repeated on every page is dropped and near-duplicates are kept once"""
+    urls = [f"https://karpov.courses/course-{i}" for i in range(4)]
+    pages = {
+        url: [make_chunk(url, MENU), make_chunk(url, f"Уникальное описание курса номер {i} про SQL и Python")]
+        for i, url in enumerate(urls)
+    }
+    shared = "Отзывы выпускников о курсе и помощь центра карьеры в поиске работы"
+    pages[urls[0]].append(make_chunk(urls[0], shared))
+    pages[urls[1]].append(make_chunk(urls[1], shared + "!"))
+
+    deduplicator = ChunkDeduplicator()
+    result = deduplicator.deduplicate(pages)
+
+    assert all(MENU not in chunk for chunks in result.values() for chunk in chunks)
+    assert sum(shared in chunk for chunks in result.values() for chunk in chunks) == 1
+    assert deduplicator.stats == {"chunks": 10, "boilerplate": 4, "duplicates": 1, "kept": 5}
+
+
+def test_kept_copy_is_independent_of_page_order():
+    """Test that the same copy of a duplicate survives whatever order pages were crawled in"""
+    shared = "Отзывы выпускников о курсе и помощь центра карьеры в поиске работы"
+    urls = ["https://karpov.courses/b", "https://karpov.courses/a"]
+    pages = {url: [make_chunk(url, f"Описание {url}"), make_chunk(url, shared)] for url in urls}
+
+    forward = ChunkDeduplicator().deduplicate(pages)
+    backward = ChunkDeduplicator().deduplicate(dict(reversed(pages.items())))
+
+    assert forward == backward
+    assert len(forward["https://karpov.courses/a"]) == 2 and len(forward["https://karpov.courses/b"]) == 1
@@ -1,5 +1,8 @@
+import subprocess
+import sys
 import numpy as np
 from app.embedder import Embedder
+from app.embedding_cache import EmbeddingCache
 from tests.constants import TEST_TEXT, TEST_EMBEDDING
 
 
@@ -30,3 +33,80 @@ def test_embedding_size():
     embedder = Embedder()
     embedding = embedder.get_embeddings(TEST_TEXT)
     assert len(embedding) == 384, f"Expected embedding size 384, got {len(embedding)}"
+
+
+def test_batched_embeddings():
+    """Test that length-bucketed batches match one-by-one embeddings in input order"""
+    embedder = Embedder(batch_size=2, max_batch_tokens=64)
+    texts = [TEST_TEXT * 5, TEST_TEXT, "Курс по SQL", TEST_TEXT * 2]
+    embeddings = embedder.get_embeddings(texts)
+
+    for text, embedding in zip(texts, embeddings):
+        np.testing.assert_allclose(embedding, embedder.get_embeddings(text), rtol=1e-4, atol=1e-4)
+    assert embedder.stats["texts"] == len(texts)
+    assert embedder.throughput["texts_per_sec"] > 0
+
+
+def test_failed_text_is_isolated():
+    """Test that one text that cannot be embedded does not lose the whole batch"""
+    embedder = Embedder()
+    embeddings = embedder.get_embeddings([TEST_TEXT, {"not": "a text"}, TEST_TEXT])
+
+    assert embeddings.shape == (3, 384)
+    assert not embeddings[1].any()
+    np.testing.assert_allclose(embeddings[0], TEST_EMBEDDING[0], rtol=1e-4, atol=1e-4)
+
+
+def test_cached_embeddings_skip_model(tmp_path):
+    """Test that a warm cache returns embeddings without running the model"""
+    embedder = Embedder(cache=EmbeddingCache(str(tmp_path / "embeddings.db")))
+    first = embedder.get_embeddings([TEST_TEXT])
+    embedded = embedder.stats["texts"]
+    second = embedder.get_embeddings([TEST_TEXT])
+
+    assert embedder.stats["texts"] == embedded
+    np.testing.assert_array_equal(first, second)
+
+
+def test_onnx_backend_parity(tmp_path):
+    """Test that ONNX Runtime backends reproduce the float32 PyTorch embedding"""
+    expected = np.array(TEST_EMBEDDING[0])
+    for quantization in (None, "avx2"):
+        embedder = Embedder(
+            backend="onnx", quantization=quantization, onnx_dir=str(tmp_path)
+        )
+        actual = embedder.get_embeddings(TEST_TEXT)
+
+        cosine = actual @ expected / (np.linalg.norm(actual) * np.linalg.norm(expected))
+        assert cosine >= 0.99, f"Cosine similarity {cosine} for quantization={quantization}"
+
+
+def test_onnx_dir_is_stable(monkeypatch, tmp_path):
+    """Test that the exported ONNX model is cached per model and quantization config"""
+    monkeypatch.setenv("ONNX_CACHE_DIR", str(tmp_path))
+    first = Embedder(backend="onnx", quantization="avx2").default_onnx_dir()
+
+    assert first == Embedder(backend="onnx", quantization="avx2").default_onnx_dir()
+    assert first == str(tmp_path / "intfloat--multilingual-e5-small-avx2")
+    assert Embedder(backend="onnx").default_onnx_dir() != first
+
+
+def test_lazy_model_loading():
+    """Test that importing the app and creating an Embedder does not import torch or openai"""
+    code = (
+        "import sys\n"
+        "from app.embedder import Embedder\n"
+        "from app.course_advisor import CourseAdvisor\n"
+        "Embedder()\n"
+        "print(sorted({'torch', 'sentence_transformers', 'openai'} & set(sys.modules)))"
+    )
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "[]"
+
+
+def test_empty_input_does_not_load_model():
+    """Test that embedding no texts returns an empty matrix without loading the model"""
+    embedder = Embedder(dimension=384)
+    embeddings = embedder.get_embeddings([])
+    assert embeddings.shape == (0, 384) and embeddings.dtype == np.float32
+    assert not embedder.is_loaded
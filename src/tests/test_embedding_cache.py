@@ -0,0 +1,44 @@
+import numpy as np
+from app.embedding_cache import EmbeddingCache
+
+MODEL = "intfloat/multilingual-e5-small"
+
+
+def test_round_trip_between_processes(tmp_path):
+    """Test that embeddings stored by one cache instance are found by another one"""
+    path = str(tmp_path / "embeddings.db")
+    embeddings = np.arange(6, dtype=np.float32).reshape(2, 3)
+    EmbeddingCache(path).put_many(MODEL, ["Курс SQL", "Docker"], embeddings)
+
+    cache = EmbeddingCache(path)
+    found = cache.get_many(MODEL, ["Docker", "Python", " Курс SQL\n"])
+
+    assert sorted(found) == [0, 2]
+    np.testing.assert_array_equal(found[0], embeddings[1])
+    np.testing.assert_array_equal(found[2], embeddings[0])
+    assert cache.get_many("other-model", ["Docker"]) == {}
+    assert cache.stats == {"hits": 2, "misses": 2}
+
+
+def test_lru_eviction(tmp_path):
+    """Test that least recently used embeddings are evicted above max_entries"""
+    cache = EmbeddingCache(str(tmp_path / "embeddings.db"), max_entries=2)
+    cache.put_many(MODEL, ["a"], np.ones((1, 3), dtype=np.float32))
+    cache.put_many(MODEL, ["b"], np.ones((1, 3), dtype=np.float32))
+    cache.get_many(MODEL, ["a"])
+    cache.put_many(MODEL, ["c"], np.ones((1, 3), dtype=np.float32))
+
+    assert sorted(cache.get_many(MODEL, ["a", "b", "c"])) == [0, 2]
+
+
+def test_eviction_down_to_low_water(tmp_path):
+    """Test that eviction only runs above max_entries and removes the oldest rows down to the low-water mark"""
+    cache = EmbeddingCache(str(tmp_path / "embeddings.db"), max_entries=10)
+    texts = [str(i) for i in range(10)]
+    for text in texts:
+        cache.put_many(MODEL, [text], np.ones((1, 3), dtype=np.float32))
+    assert len(cache.get_many(MODEL, texts)) == 10
+
+    cache.put_many(MODEL, ["10"], np.ones((1, 3), dtype=np.float32))
+    assert len(cache.get_many(MODEL, texts + ["10"])) == cache.low_water == 9
+    assert cache._row_count() == 9
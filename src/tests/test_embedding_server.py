@@ -0,0 +1,114 @@
+import os
+import stat
+import threading
+from multiprocessing import AuthenticationError
+import numpy as np
+import pytest
+from app.embedding_server import EmbeddingServer, RemoteEmbedder, key_path, parse_address
+
+
+class FakeEmbedder:
+    """Embedder stand-in that encodes text length and records batch sizes"""
+
+    model_name = "fake-model"
+
+    def __init__(self):
+        self.batches = []
+
+    def get_embeddings(self, texts: list[str]) -> np.ndarray:
+        self.batches.append(len(texts))
+        if "fail" in texts:
+            raise ValueError("cannot embed")
+        embeddings = np.zeros((len(texts), 8), dtype=np.float32)
+        embeddings[:, 0] = [len(text) for text in texts]
+        return embeddings
+
+    def get_embedding_dimension(self) -> int:
+        return 8
+
+
+@pytest.fixture(autouse=True)
+def key_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_RUNTIME_DIR", str(tmp_path / "run"))
+
+
+@pytest.fixture
+def server(tmp_path):
+    server = EmbeddingServer(FakeEmbedder(), str(tmp_path / "embedder.sock"), max_wait_ms=50)
+    server.start()
+    yield server
+    server.close()
+
+
+def test_parse_address():
+    """Test that host:port is a TCP address and anything else a socket path"""
+    assert parse_address("localhost:7000") == ("localhost", 7000)
+    assert parse_address("/tmp/embedder.sock") == "/tmp/embedder.sock"
+
+
+def test_remote_embeddings(server):
+    """Test that a client gets embeddings and model info from the server"""
+    embedder = RemoteEmbedder(server.address)
+    embeddings = embedder.get_embeddings(["a", "abc"])
+    assert embeddings.dtype == np.float32 and embeddings[:, 0].tolist() == [1, 3]
+    assert embedder.get_embedding_dimension() == 8 and embedder.model_name == "fake-model"
+    with pytest.raises(RuntimeError, match="cannot embed"):
+        embedder.get_embeddings(["fail"])
+    # The connection stays usable after an error
+    assert embedder.get_embeddings(["ab"])[0, 0] == 2
+
+
+def test_concurrent_clients_are_batched(server):
+    """Test that requests of concurrent clients are embedded together and answered separately"""
+    embedder = RemoteEmbedder(server.address)
+    results = {}
+
+    def query(i: int):
+        results[i] = embedder.get_embeddings(["x" * i])[0, 0]
+
+    threads = [threading.Thread(target=query, args=(i,)) for i in range(1, 9)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == {i: i for i in range(1, 9)}
+    assert server.stats["requests"] == 8 and server.stats["batches"] < 8
+
+
+def test_clients_have_to_authenticate(server):
+    """Test that the generated key and the socket are owner-only and a wrong key is rejected"""
+    for path in (server.address, key_path(server.address)):
+        assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+    with pytest.raises(AuthenticationError):
+        RemoteEmbedder(server.address, authkey=b"wrong").get_embeddings(["a"])
+    # A key file others can access is not trusted
+    os.chmod(key_path(server.address), 0o644)
+    with pytest.raises(PermissionError):
+        RemoteEmbedder(server.address).get_embeddings(["a"])
+    os.chmod(key_path(server.address), 0o600)
+
+    # A restarted server generates a new key, which clients read again on reconnect
+    embedder = RemoteEmbedder(server.address)
+    assert embedder.get_embeddings(["a"])[0, 0] == 1
+    server.close()
+    # Connections of a killed server are dropped with it
+    embedder.close()
+    restarted = EmbeddingServer(FakeEmbedder(), server.address)
+    restarted.start()
+    try:
+        assert embedder.get_embeddings(["ab"])[0, 0] == 2
+    finally:
+        restarted.close()
+    assert not os.path.exists(key_path(server.address))
+
+
+def test_public_address_requires_authkey():
+    """Test that listening beyond loopback without an authkey is refused"""
+    with pytest.raises(ValueError, match="authkey"):
+        EmbeddingServer(FakeEmbedder(), ("0.0.0.0", 0)).start()
+    server = EmbeddingServer(FakeEmbedder(), ("127.0.0.1", 0))
+    server.start()
+    try:
+        assert RemoteEmbedder(server.address).get_embeddings(["abc"])[0, 0] == 3
+    finally:
+        server.close()
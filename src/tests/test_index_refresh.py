@@ -0,0 +1,80 @@
+import numpy as np
+from app.index_refresh import chunk_fingerprint, refresh_index
+from app.vector_store import VectorStore
+
+
+class CountingEmbedder:
+    """Deterministic stand-in for Embedder that counts embedded texts"""
+
+    def __init__(self):
+        self.embedded = 0
+
+    def get_embeddings(self, texts: list[str]) -> np.ndarray:
+        self.embedded += len(texts)
+        rng = np.random.default_rng(len(texts))
+        embeddings = rng.standard_normal((len(texts), 384)).astype(np.float32)
+        return embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+
+def test_fingerprint_ignores_whitespace():
+    """Test that fingerprints depend on source and normalized content only"""
+    assert chunk_fingerprint("https://a", "Курс  SQL\n") == chunk_fingerprint("https://a", "Курс SQL")
+    assert chunk_fingerprint("https://a", "Курс SQL") != chunk_fingerprint("https://b", "Курс SQL")
+
+
+def test_refresh_embeds_only_changed_chunks():
+    """Test that refresh embeds new chunks, removes stale ones and reuses the rest"""
+    store = VectorStore(384)
+    embedder = CountingEmbedder()
+    pages = {
+        "https://karpov.courses/analytics": ["SQL", "Python", "A/B"],
+        "https://karpov.courses/docker": ["Docker", "Compose"],
+    }
+    assert refresh_index(store, embedder, pages) == {"added": 5, "removed": 0, "reused": 0}
+
+    pages["https://karpov.courses/docker"] = ["Docker", "Kubernetes"]
+    stats = refresh_index(store, embedder, pages)
+
+    assert stats == {"added": 1, "removed": 1, "reused": 4}
+    assert embedder.embedded == 6
+    assert sorted(chunk.text for chunk in store.chunks.values()) == ["A/B", "Docker", "Kubernetes", "Python", "SQL"]
+    assert store.index.ntotal == 5
+
+
+def test_refresh_keeps_missing_pages():
+    """Test that chunks of a page missing from a refresh (e.g. failed fetch) are kept"""
+    store = VectorStore(384)
+    embedder = CountingEmbedder()
+    pages = {
+        "https://karpov.courses/analytics": ["SQL", "Python"],
+        "https://karpov.courses/docker": ["Docker", "Compose"],
+    }
+    refresh_index(store, embedder, pages)
+
+    stats = refresh_index(store, embedder, {"https://karpov.courses/analytics": ["SQL", "Python"]})
+    assert stats == {"added": 0, "removed": 0, "reused": 2}
+    assert store.index.ntotal == 4
+
+    # A page passed with no chunks is removed
+    stats = refresh_index(store, embedder, {"https://karpov.courses/docker": []})
+    assert stats["removed"] == 2
+    assert sorted(chunk.text for chunk in store.chunks.values()) == ["Python", "SQL"]
+
+
+def test_refresh_retries_failed_embeddings():
+    """Test that chunks whose embedding failed (zero rows) are not stored and are retried"""
+
+    class FailingEmbedder(CountingEmbedder):
+        def get_embeddings(self, texts: list[str]) -> np.ndarray:
+            embeddings = super().get_embeddings(texts)
+            embeddings[[i for i, text in enumerate(texts) if "Broken" in text]] = 0
+            return embeddings
+
+    store = VectorStore(384)
+    pages = {"https://karpov.courses/analytics": ["SQL", "Broken"]}
+    assert refresh_index(store, FailingEmbedder(), pages) == {"added": 1, "removed": 0, "reused": 0}
+    assert store.index.ntotal == 1 and len(store.fingerprints) == 1
+
+    embedder = CountingEmbedder()
+    assert refresh_index(store, embedder, pages) == {"added": 1, "removed": 0, "reused": 1}
+    assert embedder.embedded == 1
@@ -0,0 +1,115 @@
+import os
+import threading
+import numpy as np
+import pytest
+from app.index_repository import IndexRepository
+from app.vector_store import VectorStore
+
+
+def make_store(texts: list[str]) -> VectorStore:
+    store = VectorStore(8)
+    embeddings = np.eye(8, dtype=np.float32)[: len(texts)]
+    store.add_texts(texts, embeddings)
+    return store
+
+
+def test_publish_and_load(tmp_path):
+    """Test that a published store is loaded from the version CURRENT points to"""
+    repository = IndexRepository(str(tmp_path / "index"))
+    assert repository.current_path() is None
+
+    version = repository.publish(make_store(["SQL", "Python"]), model_name="e5", chunk_size=500)
+    assert repository.current_version() == version == repository.versions()[0]
+    manifest = repository.manifest()
+    assert manifest["chunks"] == 2 and manifest["dimension"] == 8
+    assert manifest["metadata"] == {"model_name": "e5", "chunk_size": 500}
+    assert {"store.faiss", "store.chunks", "store.json"} <= set(manifest["files"])
+
+    loaded = repository.load(mmap=True, verify=True)
+    assert sorted(chunk.text for chunk in loaded.chunks.values()) == ["Python", "SQL"]
+
+
+def test_unchanged_store_is_not_republished(tmp_path):
+    """Test that publishing the same store again keeps the current version"""
+    repository = IndexRepository(str(tmp_path / "index"))
+    store = make_store(["SQL"])
+    version = repository.publish(store)
+    assert repository.publish(store) == version
+    assert repository.publish(repository.load()) == version
+
+
+def test_rollback_and_prune(tmp_path):
+    """Test that rollback switches to the previous version and only keep versions stay on disk"""
+    repository = IndexRepository(str(tmp_path / "index"), keep=2)
+    versions = [repository.publish(make_store([f"text {i}"])) for i in range(3)]
+    assert repository.versions() == versions[1:]
+
+    assert repository.rollback() == versions[1]
+    assert [chunk.text for chunk in repository.load().chunks.values()] == ["text 1"]
+    with pytest.raises(ValueError):
+        repository.rollback()
+    assert repository.rollback(versions[2]) == versions[2]
+
+
+def test_unfinished_and_corrupted_versions(tmp_path):
+    """Test that a half-written version is invisible and a truncated one is not loaded"""
+    repository = IndexRepository(str(tmp_path / "index"))
+    version = repository.publish(make_store(["SQL"]))
+    os.makedirs(os.path.join(repository.versions_dir, "99999999-000000-crashed.tmp"))
+    assert repository.versions() == [version]
+
+    with open(os.path.join(repository.versions_dir, version, "store.json"), "a") as f:
+        f.write(" ")
+    with pytest.raises(ValueError):
+        repository.load()
+
+
+def test_legacy_store(tmp_path):
+    """Test that a store saved at the repository path is read until a version is published"""
+    make_store(["SQL"]).save(str(tmp_path / "index"))
+    repository = IndexRepository(str(tmp_path / "index"))
+    assert repository.current_path() == str(tmp_path / "index")
+    assert [chunk.text for chunk in repository.load().chunks.values()] == ["SQL"]
+
+
+def test_checkpoint(tmp_path):
+    """Test that a checkpoint is only resumed with the settings it was saved with"""
+    repository = IndexRepository(str(tmp_path / "index"))
+    repository.save_checkpoint(make_store(["SQL"]), {"pages": {"a": []}}, chunk_size=500)
+    repository.save_checkpoint(make_store(["SQL", "Python"]), {"pages": {"a": [], "b": []}}, chunk_size=500)
+    assert len(os.listdir(repository.checkpoints_dir)) == 1
+
+    store = VectorStore(8)
+    assert repository.load_checkpoint(store, chunk_size=300) is None
+    assert repository.load_checkpoint(store, chunk_size=500) == {"pages": {"a": [], "b": []}}
+    assert len(store.chunks) == 2
+
+    repository.clear_checkpoint()
+    assert repository.load_checkpoint(VectorStore(8), chunk_size=500) is None
+
+
+def test_write_lock(tmp_path):
+    """Test that writers of another repository object wait for the lock, nested writes do not"""
+    repository = IndexRepository(str(tmp_path / "index"))
+    other = IndexRepository(str(tmp_path / "index"))
+    with repository.lock():
+        # Publishing inside a held lock re-enters it
+        version = repository.publish(make_store(["SQL"]))
+        with other.lock(blocking=False) as acquired:
+            assert not acquired
+
+    with other.lock(blocking=False) as acquired:
+        assert acquired and other.current_version() == version
+
+    # Other threads are excluded as well, not only other processes
+    results = []
+
+    def try_lock():
+        with repository.lock(blocking=False) as acquired:
+            results.append(acquired)
+
+    with repository.lock():
+        thread = threading.Thread(target=try_lock)
+        thread.start()
+        thread.join()
+    assert results == [False]
@@ -0,0 +1,114 @@
+import time
+from types import SimpleNamespace
+from app.course_advisor import CourseAdvisor
+from app.index_repository import IndexRepository
+from app.index_watcher import IndexWatcher
+from app.semantic_cache import SemanticCache
+from app.vector_store import VectorStore
+from tests.test_course_advisor import FakeEmbedder, fake_chunks
+
+
+def publish(repository: IndexRepository, texts: list[str]) -> str:
+    store = VectorStore(384)
+    store.add_texts(texts, FakeEmbedder().get_embeddings(texts))
+    return repository.publish(store)
+
+
+def test_swap_new_version(tmp_path):
+    """Test that a published version is swapped in and the old store keeps serving its queries"""
+    repository = IndexRepository(str(tmp_path / "index"))
+    publish(repository, ["Курс по SQL"])
+    target = SimpleNamespace(vectorstore=repository.load())
+    watcher = IndexWatcher(repository, [target])
+    assert not watcher.check()
+
+    old = target.vectorstore
+    publish(repository, ["Курс по Docker"])
+    assert watcher.check() and watcher.stats["swaps"] == 1
+    query = FakeEmbedder().get_embeddings(["курс"])
+    assert target.vectorstore.similarity_search(query, k=1)[0]["chunk"].endswith("Курс по Docker")
+    assert old.similarity_search(query, k=1)[0]["chunk"].endswith("Курс по SQL")
+
+    # Rolling back is a version change as well
+    repository.rollback()
+    assert watcher.check()
+    assert target.vectorstore.similarity_search(query, k=1)[0]["chunk"].endswith("Курс по SQL")
+
+
+def test_broken_version_keeps_old_store(tmp_path):
+    """Test that a version that fails to load is skipped and not retried"""
+    repository = IndexRepository(str(tmp_path / "index"))
+    publish(repository, ["Курс по SQL"])
+    target = SimpleNamespace(vectorstore=repository.load())
+    watcher = IndexWatcher(repository, [target])
+
+    version = publish(repository, ["Курс по Docker"])
+    with open(tmp_path / "index" / "versions" / version / "store.faiss", "ab") as f:
+        f.write(b"0")
+    assert not watcher.check() and not watcher.check()
+    assert watcher.stats["errors"] == 1 and len(target.vectorstore.chunks) == 1
+
+
+def test_background_thread(tmp_path):
+    """Test that the watcher thread picks up a new version"""
+    repository = IndexRepository(str(tmp_path / "index"))
+    publish(repository, ["Курс по SQL"])
+    target = SimpleNamespace(vectorstore=repository.load())
+    watcher = IndexWatcher(repository, [target], interval=0.01)
+    watcher.start()
+    try:
+        publish(repository, ["Курс по SQL", "Курс по Docker"])
+        deadline = time.monotonic() + 5
+        while len(target.vectorstore.chunks) != 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        watcher.stop()
+    assert len(target.vectorstore.chunks) == 2
+
+
+def test_answer_from_replaced_index_is_not_cached(tmp_path):
+    """Test that a query in flight during a swap finishes on the old store without caching its answer"""
+    repository = IndexRepository(str(tmp_path / "index"))
+    publish(repository, ["Курс по SQL"])
+    advisor = CourseAdvisor(repository.load(), FakeEmbedder(), cache=SemanticCache())
+    watcher = IndexWatcher(repository, [advisor])
+    requests = []
+
+    def create(**kwargs):
+        requests.append(kwargs)
+        # A new version is published and swapped in while the answer is generated
+        publish(repository, ["Курс по Docker"])
+        watcher.check()
+        return iter(fake_chunks(["Начните ", "с SQL"]))
+
+    advisor._client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    assert "".join(advisor.stream_query("С чего начать?")) == "Начните с SQL"
+    assert "Курс по SQL" in requests[0]["messages"][0]["content"]
+    assert watcher.stats["swaps"] == 1 and len(advisor.cache.entries) == 0
+
+
+def test_query_is_pinned_to_one_store(tmp_path):
+    """Test that a swap right after the query started does not change the store it searches"""
+    repository = IndexRepository(str(tmp_path / "index"))
+    publish(repository, ["Курс по SQL"])
+    watcher = IndexWatcher(repository, [])
+
+    class SwappingEmbedder(FakeEmbedder):
+        def get_embeddings(self, texts: list[str]):
+            # A new version is swapped in while the question is embedded
+            publish(repository, ["Курс по Docker"])
+            watcher.check()
+            return super().get_embeddings(texts)
+
+    advisor = CourseAdvisor(repository.load(), SwappingEmbedder(), cache=SemanticCache())
+    watcher.targets.append(advisor)
+    requests = []
+
+    def create(**kwargs):
+        requests.append(kwargs)
+        return iter(fake_chunks(["Начните с SQL"]))
+
+    advisor._client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    assert "".join(advisor.stream_query("С чего начать?")) == "Начните с SQL"
+    assert "Курс по SQL" in requests[0]["messages"][0]["content"]
+    assert len(advisor.cache.entries) == 0
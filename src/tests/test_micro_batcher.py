@@ -0,0 +1,102 @@
+import asyncio
+import numpy as np
+from app.micro_batcher import MicroBatcher
+from app.vector_store import VectorStore
+
+TEXTS = {
+    "https://karpov.courses/analytics": "Курс по аналитике данных и SQL",
+    "https://karpov.courses/ml-start": "Курс по машинному обучению на Python",
+    "https://karpov.courses/docker": "Курс по Docker и контейнерам",
+}
+
+
+class FakeEmbedder:
+    """Embedder stand-in mapping every text to a one-hot vector and counting model calls"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def get_embeddings(self, texts: list[str]) -> np.ndarray:
+        self.calls += 1
+        embeddings = np.zeros((len(texts), 8), dtype=np.float32)
+        for row, text in enumerate(texts):
+            embeddings[row, sum(map(ord, text.split()[-1])) % 8] = 1.0
+        return embeddings
+
+
+def make_store(embedder: FakeEmbedder) -> VectorStore:
+    store = VectorStore(8)
+    texts = [
+        f"Page name:\nКурс\nPage source:\n{source}\nPage content:\n{text}\n"
+        for source, text in TEXTS.items()
+    ]
+    store.add_texts(texts, embedder.get_embeddings(list(TEXTS.values())))
+    return store
+
+
+def test_concurrent_queries_share_batch():
+    """Test that concurrent queries are embedded together and get the same results as one by one"""
+    embedder = FakeEmbedder()
+    store = make_store(embedder)
+    batcher = MicroBatcher(store, embedder, max_batch_size=8, max_wait_ms=50)
+    queries = [f"курс {word}" for word in ("SQL", "Python", "контейнерам")] * 4
+
+    async def search_all():
+        await batcher.start()
+        try:
+            return await asyncio.gather(*(batcher.search(query, k=2) for query in queries))
+        finally:
+            await batcher.stop()
+
+    embedder.calls = 0
+    batched = asyncio.run(search_all())
+    assert batcher.stats["queries"] == len(queries)
+    assert batcher.stats["batches"] < len(queries)
+    assert embedder.calls == batcher.stats["batches"]
+
+    for query, (embedding, results) in zip(queries, batched):
+        expected = store.hybrid_search(embedder.get_embeddings([query]), query, k=2)
+        assert np.array_equal(embedding, embedder.get_embeddings([query]))
+        assert results == expected
+
+
+def test_source_filters_and_k():
+    """Test that queries with different source filters and k in one batch are searched separately"""
+    embedder = FakeEmbedder()
+    batcher = MicroBatcher(make_store(embedder), embedder, max_wait_ms=50, hybrid=False)
+
+    async def search_all():
+        await batcher.start()
+        try:
+            return await asyncio.gather(
+                batcher.search("курс SQL", k=1),
+                batcher.search("курс SQL", k=3, sources=["*/docker"]),
+            )
+        finally:
+            await batcher.stop()
+
+    (_, top), (_, filtered) = asyncio.run(search_all())
+    assert batcher.stats["batches"] == 1
+    assert [result["source"] for result in top] == ["https://karpov.courses/analytics"]
+    assert [result["source"] for result in filtered] == ["https://karpov.courses/docker"]
+
+
+def test_embed_then_search():
+    """Test that a query embedded with embed is searched with its embedding without another model call"""
+    embedder = FakeEmbedder()
+    store = make_store(embedder)
+    batcher = MicroBatcher(store, embedder, max_wait_ms=1, hybrid=False)
+
+    async def embed_and_search():
+        await batcher.start()
+        try:
+            embedding = await batcher.embed("курс SQL")
+            return embedding, await batcher.search("курс SQL", k=1, embedding=embedding)
+        finally:
+            await batcher.stop()
+
+    embedder.calls = 0
+    embedding, (searched, results) = asyncio.run(embed_and_search())
+    assert embedder.calls == 1
+    assert np.array_equal(embedding, searched)
+    assert [result["source"] for result in results] == ["https://karpov.courses/analytics"]
@@ -0,0 +1,67 @@
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from app.crawler import AsyncCrawler
+from app.page_cache import PageCache
+from app.web_page_processor import WebPageProcessor
+
+
+class ETagHandler(BaseHTTPRequestHandler):
+    """Serves static course pages with ETag validators and counts full responses"""
+
+    full_responses = 0
+
+    def do_GET(self):
+        etag = f'"{self.path}-v1"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        ETagHandler.full_responses += 1
+        body = f"<html><head><title>Course {self.path}</title></head><body>About {self.path}</body></html>"
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("ETag", etag)
+        self.end_headers()
+        self.wfile.write(body.encode("utf-8"))
+
+    def log_message(self, *args):
+        pass
+
+
+def test_conditional_refresh(tmp_path):
+    """Test that refreshing unchanged pages uses 304 responses and cached chunks"""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ETagHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        base = f"http://127.0.0.1:{server.server_port}"
+        urls = [f"{base}/analytics", f"{base}/docker"]
+        cache = PageCache(str(tmp_path))
+        processor = WebPageProcessor(crawler=AsyncCrawler(), cache=cache)
+
+        first = processor.process_urls(urls)
+        second = processor.process_urls(urls)
+
+        assert first == second
+        assert ETagHandler.full_responses == 2
+        assert cache.stats == {"hits": 2, "misses": 2}
+    finally:
+        server.shutdown()
+
+
+def test_lru_eviction(tmp_path):
+    """Test that least recently used pages are evicted above max_entries"""
+    cache = PageCache(str(tmp_path), max_entries=2)
+    cache.put("https://a", "<html>a</html>", ["a"], "500:100")
+    cache.put("https://b", "<html>b</html>", ["b"], "500:100")
+    # Explicit mtimes, rapid writes can share a timestamp on coarse filesystems
+    os.utime(cache._path("https://a", "json"), (1000, 1000))
+    os.utime(cache._path("https://b", "json"), (2000, 2000))
+
+    # Touch "a" so that "b" becomes the least recently used entry
+    assert cache.lookup_chunks("https://a", "<html>a</html>", "500:100") == ["a"]
+    cache.put("https://c", "<html>c</html>", ["c"], "500:100")
+
+    assert cache.get("https://a") is not None
+    assert cache.get("https://b") is None
+    assert cache.get("https://c") is not None
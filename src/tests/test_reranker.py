@@ -0,0 +1,97 @@
+import threading
+import time
+import numpy as np
+from app.reranker import Reranker
+
+
+class FakeCrossEncoder:
+    """Cross-encoder stand-in scoring pairs by the number of shared words"""
+
+    def __init__(self):
+        self.pairs = 0
+
+    def predict(self, pairs: list[tuple[str, str]], **kwargs) -> np.ndarray:
+        self.pairs += len(pairs)
+        return np.array(
+            [len(set(query.lower().split()) & set(text.lower().split())) for query, text in pairs],
+            dtype=np.float32,
+        )
+
+
+def results(texts: list[str]) -> list[dict]:
+    return [{"chunk": text, "text": text, "score": 1.0 - i / 10} for i, text in enumerate(texts)]
+
+
+TEXTS = ["Курс по Docker", "Стоимость обучения", "Курс по SQL для аналитиков", "Отзывы выпускников"]
+
+
+def test_rerank_and_cache():
+    """Test that results are ordered by cross-encoder score and pair scores are cached"""
+    reranker = Reranker()
+    reranker._model = FakeCrossEncoder()
+
+    reranked = reranker.rerank("курс sql для аналитиков", results(TEXTS), k=2)
+    assert [result["text"] for result in reranked] == [TEXTS[2], TEXTS[0]]
+    assert reranked[0]["rerank_score"] == 4
+
+    assert reranker.rerank("курс sql для аналитиков", results(TEXTS), k=2) == reranked
+    assert reranker.stats["pairs"] == 4 and reranker.stats["cache_hits"] == 4
+
+
+def test_latency_budget():
+    """Test that only the leading results that fit the budget are re-ranked, or none if too few fit"""
+    reranker = Reranker(budget_ms=20)
+    reranker._model = FakeCrossEncoder()
+    reranker.pair_ms = 10.0
+
+    reranked = reranker.rerank("курс sql", results(TEXTS[1:] + TEXTS[:1]), k=4)
+    assert [result["text"] for result in reranked] == [TEXTS[2], TEXTS[1], TEXTS[3], TEXTS[0]]
+    assert reranker.stats["pairs"] == 2 and reranker.stats["truncated"] == 1
+
+    reranker.budget_ms = 5
+    assert reranker.rerank("курс docker", results(TEXTS), k=2) == results(TEXTS)[:2]
+    assert reranker.stats["skipped"] == 1
+
+
+def test_pair_time_recovers():
+    """Test that model warm-up is not timed and the estimate decays while queries are skipped"""
+
+    class SlowStartCrossEncoder(FakeCrossEncoder):
+        def predict(self, pairs: list[tuple[str, str]], **kwargs) -> np.ndarray:
+            if not self.pairs:
+                time.sleep(0.2)
+            return super().predict(pairs, **kwargs)
+
+    reranker = Reranker(budget_ms=100)
+    reranker._model = SlowStartCrossEncoder()
+    reranker.rerank("курс sql", results(TEXTS), k=2)
+    assert reranker.pair_ms < 25
+
+    # A slow spell skips re-ranking, but only until the decayed estimate fits the budget again
+    reranker.pair_ms = 100.0
+    for _ in range(10):
+        reranker.rerank("курс docker", results(TEXTS), k=2)
+    assert 0 < reranker.stats["skipped"] < 10 and reranker.stats["reranked"] > 1
+
+
+def test_concurrent_warm_up_loads_once():
+    """Test that a request arriving during warm-up waits for it instead of loading the model again"""
+    reranker = Reranker()
+    loads = []
+
+    def load_model():
+        if reranker._model is None:
+            loads.append(1)
+            time.sleep(0.1)
+            reranker._model = FakeCrossEncoder()
+
+    reranker._load_model = load_model
+    warm_up = threading.Thread(target=reranker.warm_up)
+    warm_up.start()
+    reranked = reranker.rerank("курс sql", results(TEXTS), k=1)
+    warm_up.join()
+
+    assert len(loads) == 1
+    assert reranked[0]["text"] == TEXTS[2]
+    # One warm-up pair and the four pairs of the request
+    assert reranker._model.pairs == 5
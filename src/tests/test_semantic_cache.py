@@ -0,0 +1,53 @@
+import numpy as np
+from app.semantic_cache import SemanticCache, cache_scope
+
+
+def make_questions(n: int) -> np.ndarray:
+    """Random unit vectors standing in for question embeddings"""
+    rng = np.random.default_rng(0)
+    embeddings = rng.standard_normal((n, 384)).astype(np.float32)
+    return embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+
+def test_hit_on_similar_question():
+    """Test that a close paraphrase hits the cache and an unrelated question misses"""
+    questions = make_questions(2)
+    cache = SemanticCache(threshold=0.9)
+    cache.put("С чего начать аналитику?", questions[0], "С курса по аналитике", "v1")
+
+    paraphrase = questions[0] + 0.01 * questions[1]
+    assert cache.get(paraphrase, "v1") == "С курса по аналитике"
+    assert cache.get(questions[1], "v1") is None
+    assert cache.hit_rate == 0.5
+
+
+def test_ttl_eviction_and_invalidation():
+    """Test that answers expire, least recently used answers are evicted and a new index version drops all"""
+    questions = make_questions(3)
+    cache = SemanticCache(max_entries=2)
+    for i in range(3):
+        cache.put(f"question {i}", questions[i], f"answer {i}", "v1")
+    assert cache.get(questions[0], "v1") is None
+    assert cache.get(questions[2], "v1") == "answer 2"
+    assert cache.stats["evicted"] == 1
+
+    assert cache.get(questions[2], "v2") is None
+    assert cache.stats["invalidations"] == 1
+
+    cache = SemanticCache(ttl=0)
+    cache.put("question", questions[0], "answer")
+    assert cache.get(questions[0]) is None
+    assert cache.stats["expired"] == 1
+
+
+def test_scopes_are_separate():
+    """Test that answers are only reused for the same source filter and completion parameters"""
+    questions = make_questions(1)
+    cache = SemanticCache(threshold=0.9)
+    scope = cache_scope(["*/docker", "*/analytics"])
+    cache.put("question", questions[0], "filtered answer", "v1", scope)
+
+    assert cache.get(questions[0], "v1") is None
+    assert cache.get(questions[0], "v1", cache_scope(temperature=0)) is None
+    assert cache.get(questions[0], "v1", cache_scope(["*/analytics", "*/docker"])) == "filtered answer"
+    assert cache_scope() is None and cache_scope("*/docker") == cache_scope(["*/docker"])
@@ -0,0 +1,82 @@
+from types import SimpleNamespace
+from fastapi.testclient import TestClient
+from app.async_course_advisor import AsyncCourseAdvisor
+from app.semantic_cache import SemanticCache
+from app.service import create_app
+from tests.test_micro_batcher import FakeEmbedder, make_store
+
+
+class FakeCompletions:
+    """Chat completions stand-in counting LLM calls"""
+
+    def __init__(self):
+        self.calls = 0
+
+    async def create(self, **kwargs):
+        self.calls += 1
+        message = SimpleNamespace(content="Начните с курса по аналитике")
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+
+def make_client() -> tuple[TestClient, FakeCompletions]:
+    embedder = FakeEmbedder()
+    store = make_store(embedder)
+    completions = FakeCompletions()
+    advisor = AsyncCourseAdvisor(store, embedder, cache=SemanticCache())
+    advisor._create_async_client = lambda: SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    return TestClient(create_app(store, embedder, advisor, max_wait_ms=1)), completions
+
+
+def test_search():
+    """Test that /search returns ranked chunks with their metadata"""
+    client, _ = make_client()
+    with client:
+        response = client.post("/search", json={"query": "курс SQL", "k": 2})
+        assert response.status_code == 200
+        results = response.json()["results"]
+        assert len(results) == 2
+        assert results[0]["source"] == "https://karpov.courses/analytics"
+        assert "SQL" in results[0]["chunk"]
+
+        response = client.post("/search", json={"query": "курс SQL", "sources": ["*/docker"]})
+        assert [result["source"] for result in response.json()["results"]] == [
+            "https://karpov.courses/docker"
+        ]
+        assert client.post("/search", json={"query": "курс", "k": 0}).status_code == 422
+        assert client.get("/health").json()["batches"] == 2
+
+
+def test_answer_uses_cache():
+    """Test that /answer generates an answer once and serves the repeated question from the cache"""
+    client, completions = make_client()
+    advisor = client.app.state.advisor
+    selected = []
+    select_results = advisor.aselect_results
+
+    async def count_selections(question, results):
+        selected.append(question)
+        return await select_results(question, results)
+
+    advisor.aselect_results = count_selections
+    with client:
+        first = client.post("/answer", json={"question": "Где учат SQL"}).json()
+        second = client.post("/answer", json={"question": "Где учат SQL"}).json()
+
+    assert first["answer"] == second["answer"] == "Начните с курса по аналитике"
+    assert not first["cached"] and second["cached"]
+    assert first["sources"][0] == "https://karpov.courses/analytics"
+    assert completions.calls == 1
+    # The cached answer is returned without searching and re-ranking
+    assert len(selected) == 1
+
+
+def test_answer_cache_respects_sources():
+    """Test that an answer restricted to some pages is not served for other restrictions"""
+    client, completions = make_client()
+    with client:
+        filtered = client.post("/answer", json={"question": "Где учат SQL", "sources": ["*/analytics"]}).json()
+        unfiltered = client.post("/answer", json={"question": "Где учат SQL"}).json()
+        repeated = client.post("/answer", json={"question": "Где учат SQL", "sources": ["*/analytics"]}).json()
+
+    assert not filtered["cached"] and not unfiltered["cached"] and repeated["cached"]
+    assert completions.calls == 2
@@ -0,0 +1,34 @@
+from app.sparse_index import SparseIndex, reciprocal_rank_fusion, tokenize
+
+
+def test_tokenize_russian_morphology():
+    """Test that word forms share a term and tool names stay whole"""
+    assert tokenize("курсы") == tokenize("курсов") == tokenize("Курс")
+    assert tokenize("A/B-тесты и C++") == tokenize("a/b-тест и c++")
+    assert "a/b" in tokenize("Про A/B тесты")
+
+
+def test_search_and_save(tmp_path):
+    """Test that BM25 ranks chunks with the query terms first and survives save and load"""
+    texts = {
+        10: "Курс по Docker и Kubernetes для инженеров",
+        11: "Аналитика данных на Python",
+        12: "Симулятор SQL: задачи на запросы",
+        13: "Статистика и A/B-тесты для аналитиков",
+    }
+    index = SparseIndex.build(texts)
+    scores, ids = index.search("докер docker контейнеры", k=3)
+    assert ids.tolist() == [10]
+
+    index.save(str(tmp_path / "index.npz"))
+    loaded = SparseIndex.load(str(tmp_path / "index.npz"))
+    scores, ids = loaded.search("a/b тестов аналитика", k=3)
+    assert ids[0] == 13 and set(ids.tolist()) == {11, 13}
+    assert scores[0] > scores[1]
+    assert loaded.search("аналитика", k=3, allowed=[13])[1].tolist() == [13]
+
+
+def test_reciprocal_rank_fusion():
+    """Test that items ranked high by both lists win"""
+    fused = reciprocal_rank_fusion([[1, 2, 3], [3, 1, 4]], k=60)
+    assert [idx for idx, _ in fused] == [1, 3, 2, 4]
@@ -1,6 +1,7 @@
 import os
 import numpy as np
-from app.vector_store import VectorStore
+from app.chunk_store import Chunk
+from app.vector_store import IndexSpec, VectorStore
 from tests.constants import TEST_TEXT, TEST_EMBEDDING
 
 
@@ -74,3 +75,192 @@ def test_cosine_similarity():
     assert np.isclose(
         similarity_score, 1.0, rtol=1e-5
     ), f"Expected similarity score 1.0, got {similarity_score}"
+
+
+def test_remove_ids():
+    """Test that removed texts are no longer returned by search"""
+    store = VectorStore(384)
+    embeddings = np.array(TEST_EMBEDDING, dtype=np.float32)
+
+    ids = store.add_texts([TEST_TEXT, "Another text"], np.vstack([embeddings, -embeddings]))
+    store.remove_ids([ids[0]])
+
+    query_embedding = np.array(TEST_EMBEDDING[0], dtype=np.float32)
+    results = store.similarity_search(query_embedding, k=5)
+    assert [result["chunk"] for result in results] == ["Another text"]
+
+
+def test_from_path(tmp_path):
+    """Test that a saved store can be loaded without knowing its dimension"""
+    store = VectorStore(384)
+    store.add_texts([TEST_TEXT], np.array(TEST_EMBEDDING, dtype=np.float32))
+    store.save(str(tmp_path / "store"))
+
+    loaded = VectorStore.from_path(str(tmp_path / "store"))
+    results = loaded.similarity_search(np.array(TEST_EMBEDDING[0], dtype=np.float32), k=1)
+    assert loaded.dimension == 384
+    assert results[0]["chunk"] == TEST_TEXT
+
+
+def test_approximate_indexes(tmp_path):
+    """Test that HNSW, IVF and IVF-PQ indexes find stored vectors and keep their spec after reload"""
+    rng = np.random.default_rng(0)
+    embeddings = rng.standard_normal((1000, 384)).astype(np.float32)
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    texts = [f"chunk {i}" for i in range(len(embeddings))]
+
+    specs = [
+        IndexSpec(kind="hnsw"),
+        IndexSpec(kind="ivf", nlist=16, nprobe=16),
+        IndexSpec(kind="ivfpq", nlist=16, nprobe=16, pq_m=48),
+    ]
+    for spec in specs:
+        store = VectorStore(384, index_spec=spec)
+        store.add_texts(texts, embeddings)
+        store.remove_ids([0])
+        store.save(str(tmp_path / spec.kind))
+
+        loaded = VectorStore.from_path(str(tmp_path / spec.kind))
+        assert loaded.index_spec == spec
+        found = [loaded.similarity_search(embeddings[i], k=1)[0]["chunk"] for i in range(1, 51)]
+        assert found == texts[1:51], f"{spec.kind} index did not find stored vectors"
+
+
+def test_search_batch():
+    """Test that batch search returns the same neighbours as one query at a time"""
+    rng = np.random.default_rng(0)
+    embeddings = rng.standard_normal((100, 384)).astype(np.float32)
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    store = VectorStore(384)
+    store.add_texts([f"chunk {i}" for i in range(len(embeddings))], embeddings)
+
+    scores, ids = store.search_batch(embeddings[:10], k=3)
+    assert scores.shape == ids.shape == (10, 3)
+    assert ids[:, 0].tolist() == list(range(10))
+    for i, texts in enumerate(store.get_texts(ids)):
+        results = store.similarity_search(embeddings[i], k=3)
+        assert texts == [result["chunk"] for result in results]
+        assert np.allclose(scores[i], [result["score"] for result in results])
+
+
+def test_mmap_load(tmp_path):
+    """Test that a memory-mapped store serves searches and becomes writable on change"""
+    store = VectorStore(384)
+    embeddings = np.array(TEST_EMBEDDING, dtype=np.float32)
+    store.add_texts([TEST_TEXT], embeddings, fingerprints=["f" * 64])
+    store.save(str(tmp_path / "store"))
+
+    loaded = VectorStore.from_path(str(tmp_path / "store"), mmap=True)
+    assert loaded.similarity_search(embeddings[0], k=1)[0]["chunk"] == TEST_TEXT
+    assert loaded.fingerprints == {"f" * 64: 0}
+
+    loaded.add_texts(["Another text"], -embeddings)
+    loaded.save(str(tmp_path / "store"))
+    reloaded = VectorStore.from_path(str(tmp_path / "store"), mmap=True)
+    assert [chunk.formatted for chunk in reloaded.chunks.values()] == [TEST_TEXT, "Another text"]
+    assert reloaded.fingerprints == {"f" * 64: 0}
+
+
+def test_filtered_search(tmp_path):
+    """Test that source filters restrict results inside FAISS for every index kind"""
+    rng = np.random.default_rng(0)
+    embeddings = rng.standard_normal((300, 384)).astype(np.float32)
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    urls = ["https://karpov.courses/simulator-sql", "https://karpov.courses/analytics"]
+    chunks = [Chunk(f"chunk {i}", urls[i % 2], "Курс", i // 2) for i in range(len(embeddings))]
+
+    for spec in (IndexSpec(), IndexSpec(kind="hnsw"), IndexSpec(kind="ivf", nlist=4, nprobe=4)):
+        store = VectorStore(384, index_spec=spec)
+        store.add_chunks(chunks, embeddings)
+        store.save(str(tmp_path / spec.kind))
+        for search_store in (store, VectorStore.from_path(str(tmp_path / spec.kind), mmap=True)):
+            # Query with an analytics chunk, only simulator chunks may come back
+            results = search_store.similarity_search(embeddings[1], k=5, sources="*/simulator*")
+            assert len(results) == 5
+            assert all(result["source"] == urls[0] for result in results)
+            assert search_store.similarity_search(embeddings[1], k=1)[0]["source"] == urls[1]
+
+
+def test_hybrid_search(tmp_path):
+    """Test that keyword matches are fused with dense results and the BM25 index is saved"""
+    rng = np.random.default_rng(0)
+    embeddings = rng.standard_normal((4, 384)).astype(np.float32)
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    chunks = [
+        Chunk("Контейнеризация приложений с Docker", "https://a/devops", "DevOps"),
+        Chunk("Основы SQL и баз данных", "https://a/sql", "SQL"),
+        Chunk("Python для анализа данных", "https://a/python", "Python"),
+        Chunk("Статистика и A/B-тесты", "https://a/ab", "Статистика"),
+    ]
+    store = VectorStore(384)
+    store.add_chunks(chunks, embeddings)
+    store.save(str(tmp_path / "store"))
+
+    loaded = VectorStore.from_path(str(tmp_path / "store"), mmap=True)
+    # The query vector is closest to the SQL chunk, the keyword lifts the Docker chunk found by both indexes
+    results = loaded.hybrid_search(embeddings[1], "Где изучить docker?", k=2)
+    assert [result["source"] for result in results] == ["https://a/devops", "https://a/sql"]
+    assert results[0]["sparse_score"] > 0 and results[1]["sparse_score"] is None
+    assert results[1]["dense_score"] > results[0]["dense_score"]
+    # A keyword-only match gets the similarity of its stored vector
+    results = loaded.hybrid_search(embeddings[1], "Где изучить docker?", k=2, candidates=1)
+    keyword_only = next(result for result in results if result["source"] == "https://a/devops")
+    assert np.isclose(keyword_only["dense_score"], embeddings[0] @ embeddings[1], atol=1e-5)
+    assert loaded.hybrid_search(embeddings[1], "docker", k=4, sources="*/ab")[0]["source"] == "https://a/ab"
+
+
+def test_shared_flat_vectors(tmp_path):
+    """Test that memory-mapped flat vectors give the same results as the FAISS index"""
+    rng = np.random.default_rng(0)
+    embeddings = rng.standard_normal((200, 384)).astype(np.float32)
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    store = VectorStore(384)
+    store.add_texts([f"chunk {i}" for i in range(len(embeddings))], embeddings)
+    store.remove_ids(list(range(0, 200, 3)))
+    store.save(str(tmp_path / "store"))
+
+    loaded = VectorStore.from_path(str(tmp_path / "store"), mmap=True)
+    assert isinstance(loaded.index.vectors, np.memmap) and loaded.index.ntotal == store.index.ntotal
+    expected_scores, expected_ids = store.search_batch(embeddings[:10], k=7)
+    scores, ids = loaded.search_batch(embeddings[:10], k=7)
+    assert np.array_equal(ids, expected_ids) and np.allclose(scores, expected_scores, atol=1e-5)
+
+    # Changes read the FAISS index into memory
+    loaded.remove_ids([1])
+    assert not hasattr(loaded.index, "vectors") and loaded.index.ntotal == store.index.ntotal - 1
+
+
+def test_compressed_indexes(tmp_path):
+    """Test that compressed kinds re-scored with memory-mapped exact vectors rank like the flat index"""
+    rng = np.random.default_rng(0)
+    embeddings = rng.standard_normal((1000, 384)).astype(np.float32)
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    texts = [f"chunk {i}" for i in range(len(embeddings))]
+    flat = VectorStore(384)
+    flat.add_texts(texts, embeddings)
+    flat.remove_ids(list(range(0, 1000, 7)))
+    expected_scores, expected_ids = flat.search_batch(embeddings[:20], k=5)
+
+    specs = [
+        IndexSpec(kind="fp16", rescore=4),
+        IndexSpec(kind="sq8", rescore=4),
+        IndexSpec(kind="pq", pq_m=48, rescore=8),
+    ]
+    for spec in specs:
+        store = VectorStore(384, index_spec=spec)
+        store.add_texts(texts, embeddings)
+        store.remove_ids(list(range(0, 1000, 7)))
+        store.save(str(tmp_path / spec.kind))
+
+        loaded = VectorStore.from_path(str(tmp_path / spec.kind), mmap=True)
+        assert loaded.index_spec == spec and isinstance(loaded.exact_vectors.vectors, np.memmap)
+        scores, ids = loaded.search_batch(embeddings[:20], k=5)
+        recall = np.mean([len(set(a) & set(b)) / 5 for a, b in zip(ids, expected_ids)])
+        assert recall >= (0.9 if spec.kind == "pq" else 1.0), f"{spec.kind} recall@5 is {recall}"
+        # Returned scores are exact cosine similarities
+        assert np.allclose(scores, np.einsum("nkd,nd->nk", embeddings[ids], embeddings[:20]), atol=1e-5)
+
+        # Changes read the exact vectors into memory and keep them in sync
+        loaded.remove_ids([1])
+        assert loaded.exact_vectors.ntotal == loaded.index.ntotal == store.index.ntotal - 1
+        assert loaded.similarity_search(embeddings[2], k=1)[0]["chunk"] == "chunk 2"
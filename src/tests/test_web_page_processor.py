@@ -1,3 +1,4 @@
+from app.crawler import Page
 from app.web_page_processor import WebPageProcessor
 from app.config import COURSE_URLS
 from tests.constants import EXPECTED_CHUNK_COUNT, EXPECTED_FIRST_CHUNKS
@@ -20,3 +21,18 @@ def test_first_chunks_content():
         assert (
             actual.strip() == expected.strip()
         ), f"Chunk content mismatch:\nExpected: {expected}\nActual: {actual}"
+
+
+def test_split_records_sections():
+    """Test that chunks keep source, title, position and the nearest heading as metadata"""
+    html = (
+        "<html><head><title>Курс SQL</title></head><body>"
+        "<h2>Программа</h2><p>" + "запросы " * 80 + "</p>"
+        "<h2>Цена</h2><p>" + "оплата " * 80 + "</p></body></html>"
+    )
+    processor = WebPageProcessor(chunk_size=200, chunk_overlap=0)
+    chunks = processor.split_records([processor.parse_page(Page("https://a/sql", html, 200))])
+
+    assert [chunk.position for chunk in chunks] == list(range(len(chunks)))
+    assert all(chunk.source == "https://a/sql" and chunk.title == "Курс SQL" for chunk in chunks)
+    assert chunks[0].section == "Программа" and chunks[-1].section == "Цена"